@@ -0,0 +1,66 @@
+"""
+Compares the memory footprint and throughput (sampling and evaluating support, weight and queries) of the dense
+sample layout with compact samples (float64 or float32 reals, bit-packed Booleans) on the example densities of
+pywmi.tests.examples and on a domain with many Boolean variables.
+
+Run it as a module from the root of the repository (so that pywmi and pywmi.tests can be imported):
+
+    python -m benchmarks.compact_samples --samples 1000000
+"""
+import argparse
+import time
+
+import numpy as np
+import pysmt.shortcuts as smt
+from tabulate import tabulate
+
+from pywmi import Domain, Density, evaluate_many
+from pywmi.sample import uniform
+from pywmi.tests.examples import get_examples
+
+LAYOUTS = [("dense", dict()),
+           ("compact float64", dict(compact=True)),
+           ("compact float32", dict(compact=True, real_dtype=np.float32))]
+
+
+def boolean_density(bool_count=64):
+    domain = Domain.make(["b{}".format(i) for i in range(bool_count)], ["x", "y"], real_bounds=(0, 1))
+    bools = [domain.get_symbol(v) for v in domain.bool_vars]
+    x, y = domain.get_symbol("x"), domain.get_symbol("y")
+    support = smt.And(*[smt.Or(bools[i], bools[i + 1], x <= y) for i in range(0, bool_count, 2)])
+    weight = smt.Ite(bools[0], x * y, x + y)
+    return Density(domain, support, weight, [bools[-1] & (x <= smt.Real(0.5))])
+
+
+def measure(density, sample_count, layout, repeats):
+    formulas = [density.support, density.weight] + density.queries
+    sample_times, evaluate_times = [], []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        samples = uniform(density.domain, sample_count, rand_gen=np.random.RandomState(0), **layout)
+        sample_times.append(time.perf_counter() - start)
+        start = time.perf_counter()
+        evaluate_many(density.domain, formulas, samples)
+        evaluate_times.append(time.perf_counter() - start)
+    return samples.nbytes, min(sample_times), min(evaluate_times)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--samples", type=int, default=1000000)
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+
+    rows = []
+    for density in get_examples() + [boolean_density()]:
+        name = "{} Booleans, {} reals".format(len(density.domain.bool_vars), len(density.domain.real_vars))
+        for layout_name, layout in LAYOUTS:
+            nbytes, sample_time, evaluate_time = measure(density, args.samples, layout, args.repeats)
+            rows.append([name, layout_name, "{:.1f}".format(nbytes / 2 ** 20),
+                         "{:.4f}".format(sample_time), "{:.4f}".format(evaluate_time)])
+
+    print(tabulate(rows, headers=["domain", "layout", "MiB", "sampling (s)", "evaluation (s)"]))
+
+
+if __name__ == "__main__":
+    main()
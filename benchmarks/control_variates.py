@@ -0,0 +1,42 @@
+"""
+Reports the variance reduction of control variates (the ratio of the variances of plain and controlled rejection
+estimates of the volume, i.e., the factor by which fewer samples reach the same accuracy) on the example densities of
+pywmi.tests.examples.
+
+Run it as a module from the root of the repository (so that pywmi and pywmi.tests can be imported):
+
+    python -m benchmarks.control_variates --samples 100000 --degrees 1 2 3
+"""
+import argparse
+
+from tabulate import tabulate
+
+from pywmi import RejectionEngine
+from pywmi.tests.examples import get_examples
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--samples", type=int, default=100000)
+    parser.add_argument("--degrees", type=int, nargs="+", default=[1, 2])
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rows = []
+    for density in get_examples():
+        plain = RejectionEngine(density.domain, density.support, density.weight, args.samples, seed=args.seed)
+        plain_error = plain.estimate_volume().std_error
+        row = [", ".join(density.domain.variables), "{:.4g}".format(plain_error)]
+        for degree in args.degrees:
+            engine = RejectionEngine(density.domain, density.support, density.weight, args.samples, seed=args.seed,
+                                     control_variates=True, control_degree=degree)
+            error = engine.estimate_volume().std_error
+            row.append("{:.2f}x".format((plain_error / error) ** 2) if error > 1e-6 * plain_error else "exact")
+        rows.append(row)
+
+    headers = ["domain", "std. error (plain)"] + ["degree {}".format(d) for d in args.degrees]
+    print(tabulate(rows, headers=headers))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+"""
+Reports the speedup of multi-threaded evaluation (support, weight and queries) versus the number of threads on the
+example densities of pywmi.tests.examples.
+
+Run it as a module from the root of the repository (so that pywmi and pywmi.tests can be imported):
+
+    python -m benchmarks.evaluation_threads --samples 2000000 --threads 1 2 4 8
+"""
+import argparse
+import time
+
+import numpy as np
+from tabulate import tabulate
+
+from pywmi import evaluate_many
+from pywmi.sample import uniform
+from pywmi.tests.examples import get_examples
+
+
+def measure(density, samples, workers, repeats):
+    formulas = [density.support, density.weight] + density.queries
+    evaluate_many(density.domain, formulas, samples[:100], workers=1)  # Compile outside of the measurement
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        evaluate_many(density.domain, formulas, samples, workers=workers)
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--samples", type=int, default=1000000)
+    parser.add_argument("--threads", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+
+    rows = []
+    for density in get_examples():
+        samples = uniform(density.domain, args.samples, rand_gen=np.random.RandomState(0))
+        times = [measure(density, samples, workers, args.repeats) for workers in args.threads]
+        name = ", ".join(density.domain.variables)
+        rows.append([name, "{:.4f}".format(times[0])] + ["{:.2f}x".format(times[0] / t) for t in times])
+
+    headers = ["domain", "seconds ({} threads)".format(args.threads[0])]
+    headers += ["{} threads".format(t) for t in args.threads]
+    print(tabulate(rows, headers=headers))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+"""
+Reports the speedup of the multi-process rejection engine (volume and query probabilities) versus the number of
+processes on the example densities of pywmi.tests.examples.
+
+Run it as a module from the root of the repository (so that pywmi and pywmi.tests can be imported):
+
+    python -m benchmarks.rejection_processes --samples 10000000 --processes 1 2 4 8 16 32
+"""
+import argparse
+import time
+
+from tabulate import tabulate
+
+from pywmi import RejectionEngine
+from pywmi.tests.examples import get_examples
+
+
+def measure(density, samples, processes, repeats):
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        with RejectionEngine(density.domain, density.support, density.weight, samples, seed=0,
+                             processes=processes) as engine:
+            engine.compute_volume()
+            if len(density.queries) > 0:
+                engine.compute_probabilities(density.queries)
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--samples", type=int, default=10000000)
+    parser.add_argument("--processes", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+
+    rows = []
+    for density in get_examples():
+        times = [measure(density, args.samples, processes, args.repeats) for processes in args.processes]
+        name = ", ".join(density.domain.variables)
+        rows.append([name, "{:.4f}".format(times[0])] + ["{:.2f}x".format(times[0] / t) for t in times])
+
+    headers = ["domain", "seconds ({} processes)".format(args.processes[0])]
+    headers += ["{} processes".format(p) for p in args.processes]
+    print(tabulate(rows, headers=headers))
+
+
+if __name__ == "__main__":
+    main()
@@ -5,7 +5,13 @@ from .domain import Domain, Density
 from .parse import nested_to_smt, smt_to_nested, combined_nested_to_wmi
 
 # noinspection PyUnresolvedReferences
-from .smt_check import evaluate, evaluate_assignment
+from .compact_samples import CompactSamples
+
+# noinspection PyUnresolvedReferences
+from .profiling import EvaluationProfile
+
+# noinspection PyUnresolvedReferences
+from .smt_check import evaluate, evaluate_many, evaluate_assignment
 
 # noinspection PyUnresolvedReferences
 from .smt_walk import SmtWalker
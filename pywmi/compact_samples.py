@@ -0,0 +1,181 @@
+import numpy as np
+
+
+class CompactSamples(object):
+    """
+    A batch of samples that stores the real variables as one block of floats (float32 or float64) and bit-packs the
+    Boolean variables (eight per byte). Supports the part of the NumPy interface that is used to evaluate formulas:
+    selecting rows (samples[rows]) and selecting columns (samples[:, column]), so that columns are only unpacked
+    when they are needed.
+    """
+
+    def __init__(self, variables, is_bool, reals, bools):
+        """
+        :param List[str] variables: The variables (columns) in order
+        :param np.ndarray is_bool: For every variable whether it is Boolean
+        :param np.ndarray reals: The values of the real variables (one row per sample, one column per real variable)
+        :param np.ndarray bools: The bit-packed values of the Boolean variables (one row of bytes per sample, the i-th
+        Boolean variable is stored in bit i % 8 of byte i // 8)
+        """
+        self.variables = list(variables)
+        self.is_bool = np.asarray(is_bool, dtype=bool)
+        self.reals = reals
+        self.bools = bools
+        self.positions = np.zeros(len(self.variables), dtype=int)
+        self.positions[self.is_bool] = np.arange(np.count_nonzero(self.is_bool))
+        self.positions[~self.is_bool] = np.arange(np.count_nonzero(~self.is_bool))
+
+    @classmethod
+    def from_dense(cls, domain, values, real_dtype=np.float64):
+        """
+        :param Domain domain: The domain of the samples
+        :param np.ndarray values: The samples (one row per sample, Booleans encoded as 0 or 1)
+        :param real_dtype: The type used to store real values
+        :return CompactSamples: The compactly stored samples
+        """
+        is_bool = np.array([domain.is_bool(v) for v in domain.variables], dtype=bool)
+        reals = np.asarray(values[:, ~is_bool], dtype=real_dtype)
+        return cls(domain.variables, is_bool, reals, pack_bools(values[:, is_bool] != 0))
+
+    @classmethod
+    def empty(cls, domain, sample_count, real_dtype=np.float64):
+        """
+        :return CompactSamples: Uninitialized storage for the given number of samples of the domain
+        """
+        is_bool = np.array([domain.is_bool(v) for v in domain.variables], dtype=bool)
+        reals = np.empty((sample_count, np.count_nonzero(~is_bool)), dtype=real_dtype)
+        bools = np.empty((sample_count, (np.count_nonzero(is_bool) + 7) // 8), dtype=np.uint8)
+        return cls(domain.variables, is_bool, reals, bools)
+
+    @classmethod
+    def concatenate(cls, parts):
+        """
+        :param List[CompactSamples] parts: Samples over the same variables
+        :return CompactSamples: The rows of all parts in order
+        """
+        first = parts[0]
+        reals = np.concatenate([part.reals for part in parts], axis=0)
+        bools = np.concatenate([part.bools for part in parts], axis=0)
+        return cls(first.variables, first.is_bool, reals, bools)
+
+    @property
+    def shape(self):
+        return self.reals.shape[0], len(self.variables)
+
+    @property
+    def ndim(self):
+        return 2
+
+    @property
+    def dtype(self):
+        return self.reals.dtype
+
+    @property
+    def nbytes(self):
+        return self.reals.nbytes + self.bools.nbytes
+
+    def __len__(self):
+        return self.reals.shape[0]
+
+    def __repr__(self):
+        return "CompactSamples({} samples, {} reals ({}), {} Booleans)".format(
+            len(self), self.reals.shape[1], self.reals.dtype, np.count_nonzero(self.is_bool))
+
+    def column(self, index, rows=slice(None)):
+        """
+        :param int index: The index of the variable
+        :param rows: The rows to select (slice, index array or Boolean mask)
+        :return np.ndarray: The (real) values or (Boolean) truth values of the variable
+        """
+        position = self.positions[index]
+        if self.is_bool[index]:
+            return unpack_bool(self.bools[rows], position)
+        return self.reals[rows, position]
+
+    def set_bool(self, index, truth_values, rows=slice(None)):
+        """
+        Overwrites the truth values of a Boolean variable
+        :param int index: The index of the (Boolean) variable
+        :param truth_values: The new truth values (Boolean array or scalar)
+        :param rows: The rows to update (slice, index array or Boolean mask)
+        """
+        if not self.is_bool[index]:
+            raise ValueError("Variable {} is not Boolean".format(self.variables[index]))
+        position = self.positions[index]
+        byte, mask = position // 8, np.uint8(1 << (position % 8))
+        selected = self.bools[rows, byte]
+        self.bools[rows, byte] = np.where(truth_values, selected | mask, selected & ~mask)
+
+    def __getitem__(self, key):
+        if isinstance(key, tuple):
+            rows, columns = key
+            if np.isscalar(columns):
+                return self.column(columns, rows)
+            columns = np.arange(len(self.variables))[columns]
+            dtype = self.reals.dtype
+            return np.stack([self.column(i, rows).astype(dtype, copy=False) for i in columns], axis=-1)
+        if np.isscalar(key):
+            return self[[key]].to_dense()[0]
+        return CompactSamples(self.variables, self.is_bool, self.reals[key], self.bools[key])
+
+    def __setitem__(self, rows, samples):
+        """
+        Overwrites the given rows with (compact) samples over the same variables
+        """
+        self.reals[rows] = samples.reals
+        self.bools[rows] = samples.bools
+
+    def copy(self):
+        return CompactSamples(self.variables, self.is_bool, self.reals.copy(), self.bools.copy())
+
+    def to_dense(self, dtype=np.float64):
+        """
+        :return np.ndarray: The samples as one array (one row per sample, Booleans encoded as 0 or 1)
+        """
+        result = np.empty(self.shape, dtype=dtype)
+        result[:, ~self.is_bool] = self.reals
+        if np.any(self.is_bool):
+            result[:, self.is_bool] = unpack_bools(self.bools, np.count_nonzero(self.is_bool))
+        return result
+
+    def project(self, variables):
+        """
+        :param List[str] variables: The variables to keep
+        :return CompactSamples: The samples restricted to the given variables (Booleans remain bit-packed)
+        """
+        indices = [self.variables.index(v) for v in variables]
+        is_bool = self.is_bool[indices]
+        reals = self.reals[:, [self.positions[i] for i in indices if not self.is_bool[i]]]
+        bool_positions = [self.positions[i] for i in indices if self.is_bool[i]]
+        if bool_positions == list(range(len(bool_positions))) and len(bool_positions) % 8 == 0:
+            bools = self.bools[:, :len(bool_positions) // 8]
+        else:
+            bools = pack_bools(np.stack([unpack_bool(self.bools, p) for p in bool_positions], axis=-1)
+                               if bool_positions else np.empty((len(self), 0), dtype=bool))
+        return CompactSamples(variables, is_bool, reals, bools)
+
+
+def pack_bools(truth_values):
+    """
+    :param np.ndarray truth_values: A Boolean array (one row per sample, one column per Boolean variable)
+    :return np.ndarray: The truth values packed into bytes (one row of bytes per sample)
+    """
+    return np.packbits(truth_values, axis=1, bitorder="little")
+
+
+def unpack_bools(packed, count):
+    """
+    :param np.ndarray packed: Truth values packed using pack_bools
+    :param int count: The number of Boolean variables
+    :return np.ndarray: The unpacked truth values (one row per sample, one column per Boolean variable)
+    """
+    return np.unpackbits(packed, axis=1, count=count, bitorder="little").view(bool)
+
+
+def unpack_bool(packed, position):
+    """
+    :param np.ndarray packed: Truth values packed using pack_bools
+    :param int position: The position of the Boolean variable among the Boolean variables
+    :return np.ndarray: The truth values of the Boolean variable
+    """
+    return (packed[:, position // 8] & np.uint8(1 << (position % 8))) != 0
@@ -7,6 +7,7 @@ from glob import glob
 import numpy as np
 from typing import Optional, List, Tuple, IO
 
+from pywmi.compact_samples import CompactSamples
 from pywmi.export import Exportable
 
 import pysmt.shortcuts as smt
@@ -166,6 +167,8 @@ class Domain(Exportable):
         var_types = {v: self.var_types[v] for v in variables_to_keep}
         var_domains = {v: self.var_domains[v] for v in variables_to_keep if self.is_real(v)}
         new_domain = Domain(variables_to_keep, var_types, var_domains)
+        if isinstance(data, CompactSamples):
+            return new_domain, data.project(variables_to_keep)
         variable_indices = [self.variables.index(v) for v in variables_to_keep]
         new_data = data[:, variable_indices]
         return new_domain, new_data
@@ -1,5 +1,5 @@
 from .xadd import XaddEngine
-from .rejection import RejectionEngine, RejectionIntegrator
+from .rejection import RejectionEngine, RejectionIntegrator, SharedSamples
 from .pa import PredicateAbstractionEngine
 from .convex_integrator import ConvexIntegrationBackend
 from .latte_backend import LatteIntegrator
@@ -11,6 +11,7 @@ from .algebraic_backend import (
     StringAlgebra,
 )
 from .adaptive_rejection import AdaptiveRejection
+from .importance import ImportanceSamplingEngine, PartitionProposal
 from .xsdd import (
     XsddEngine,
     FactorizedXsddEngine,
@@ -3,9 +3,10 @@ import numpy as np
 from pysmt.exceptions import PysmtException
 
 from pywmi.engine import Engine
-from pywmi import evaluate, Domain
+from pywmi import evaluate, evaluate_many, Domain
 import pysmt.shortcuts as smt
 
+from pywmi.rng import make_rand_gen
 from pywmi.sample import uniform
 
 from typing import Tuple
@@ -42,7 +43,8 @@ class SmtOracle(Oracle):
         return evaluate(self.domain, self.formula, samples)
 
     def get_accepted_sample(self):
-        self.solver.solve()
+        if not self.solver.solve():
+            return None
         try:
             model = self.solver.get_model()
             return np.array([model.get_value(self.domain.get_symbol(var)) for var in self.domain.variables])
@@ -120,10 +122,13 @@ class Node(object):
     def get_weighted_volume(self, weight_function, query=None):
         if self.is_leaf:
             if not self.empty:
-                labels = self.labels
+                positive_samples = self.samples[self.labels]
                 if query:
-                    labels = np.logical_and(evaluate(self.builder.domain, query, self.samples), labels)
-                weighted_count = evaluate(self.builder.domain, weight_function, self.samples[labels])
+                    weighted_count, query_labels = evaluate_many(self.builder.domain, [weight_function, query],
+                                                                 positive_samples)
+                    weighted_count = weighted_count[query_labels]
+                else:
+                    weighted_count = evaluate(self.builder.domain, weight_function, positive_samples)
                 return sum(weighted_count) / len(self.samples) * (self.volume / self.builder.volume)
             return 0
         else:
@@ -278,7 +283,7 @@ class AdaptiveRejection(Engine):
         self.split_criterion = split_criterion or information_gain
         oracle = SmtOracle(support, domain)
         self.seed = seed
-        self.rand_gen = np.random.RandomState(self.seed)
+        self.rand_gen = make_rand_gen(self.seed)
         self.builder = TreeBuilder(domain, oracle, self.stop_criterion, self.split_criterion, self.sample_count_build, self.rand_gen)
         self._tree = None
 
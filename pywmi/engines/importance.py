@@ -0,0 +1,164 @@
+import math
+
+import numpy as np
+
+from pywmi import evaluate, evaluate_many
+from pywmi.engine import Engine
+from pywmi.estimate import Estimate
+from pywmi.rng import make_rand_gen
+from .adaptive_rejection import AdaptiveRejection, SmtOracle, TreeBuilder, information_gain
+
+DEFENSIVE_FRACTION = 0.1  # The fraction of the proposal that is spread over the leaves proportionally to their volume
+
+
+class PartitionProposal(object):
+    """
+    A piecewise uniform proposal distribution over the leaves of an adaptive-rejection tree (see TreeBuilder). Every
+    non-empty leaf is chosen with a probability proportional to its estimated weighted volume (the volume of the leaf
+    box times the average weight of the samples that the tree drew in the leaf), mixed with a defensive component
+    proportional to the leaf volume (so that leaves in which the tree did not observe any support still have a
+    positive probability). Leaves that the tree proved to be empty are excluded.
+    """
+
+    def __init__(self, tree, weight=None, defensive=DEFENSIVE_FRACTION):
+        """
+        :param Node tree: The root of the tree
+        :param FNode weight: The weight used to estimate the mass of every leaf (None for the acceptance rate only)
+        :param float defensive: The fraction of the proposal that is proportional to the volume of the leaves
+        """
+        self.domain = tree.builder.domain
+        leaves = [leaf for leaf in self.get_leaves(tree) if not leaf.empty]
+        self.lower = np.array([[bound[0][0] for bound in leaf.bounds] for leaf in leaves], dtype=float)
+        self.upper = np.array([[bound[1][0] for bound in leaf.bounds] for leaf in leaves], dtype=float)
+        self.volumes = np.array([leaf.volume for leaf in leaves], dtype=float)
+
+        masses = np.zeros(len(leaves))
+        for i, leaf in enumerate(leaves):
+            positive_samples = leaf.samples[leaf.labels]
+            if weight is not None and len(positive_samples) > 0:
+                values = np.abs(evaluate(self.domain, weight, positive_samples))
+            else:
+                values = np.ones(len(positive_samples))
+            masses[i] = leaf.volume * np.sum(values) / len(leaf.samples)
+
+        self.probabilities = defensive * self.volumes / np.sum(self.volumes)
+        if np.sum(masses) > 0:
+            self.probabilities += (1 - defensive) * masses / np.sum(masses)
+        else:
+            self.probabilities += (1 - defensive) * self.volumes / np.sum(self.volumes)
+
+    @staticmethod
+    def get_leaves(node):
+        if node.is_leaf:
+            return [node]
+        return [leaf for child in node.children for leaf in PartitionProposal.get_leaves(child)]
+
+    def sample(self, n, rand_gen=np.random):
+        """
+        Draws samples from the proposal in one vectorized batch (Boolean variables are sampled uniformly)
+        :param int n: The number of samples
+        :param rand_gen: The random generator (RandomState or Generator)
+        :return Tuple[np.ndarray, np.ndarray]: The samples and their proposal densities
+        """
+        counts = rand_gen.multinomial(n, self.probabilities)
+        leaves = np.repeat(np.arange(len(self.probabilities)), counts)
+        samples = rand_gen.random((n, len(self.domain.variables)))
+        bool_indices = [self.domain.variables.index(v) for v in self.domain.bool_vars]
+        real_indices = [self.domain.variables.index(v) for v in self.domain.real_vars]
+        samples[:, bool_indices] = samples[:, bool_indices] < 0.5
+        samples[:, real_indices] = self.lower[leaves] \
+            + samples[:, real_indices] * (self.upper[leaves] - self.lower[leaves])
+        densities = self.probabilities[leaves] / self.volumes[leaves] / 2 ** len(bool_indices)
+        return samples, densities
+
+
+class ImportanceSamplingEngine(Engine):
+    """
+    Estimates weighted model integrals using importance sampling from a piecewise uniform proposal over the leaves of
+    an adaptive-rejection tree (see PartitionProposal). All samples are drawn in one batch and reweighted by the ratio
+    of the (weighted) support and the proposal density. A tree can be built once (e.g., AdaptiveRejection.tree) and
+    passed to engines for different queries.
+    """
+
+    def __init__(self, domain, support, weight, sample_count, tree=None, sample_count_build=None, stop_criterion=None,
+                 split_criterion=None, defensive=DEFENSIVE_FRACTION, seed=None):
+        """
+        :param tree: A tree that partitions the domain and covers the support (built if it is not given)
+        :param sample_count_build: The number of samples used at every node when building the tree
+        :param defensive: The fraction of the proposal that is proportional to the volume of the leaves
+        :param seed: An integer seed, a SeedSequence or a random generator (see pywmi.rng.make_rand_gen)
+        """
+        super().__init__(domain, support, weight, False)
+        self.sample_count = sample_count
+        self.sample_count_build = int(sample_count_build or sample_count / 10)
+        self.stop_criterion = stop_criterion or AdaptiveRejection.make_stop_criterion(max_ratio=0.5, max_depth=6)
+        self.split_criterion = split_criterion or information_gain
+        self.defensive = defensive
+        self.seed = seed
+        self.rand_gen = make_rand_gen(self.seed)
+        self._tree = tree
+        self._proposal = None
+        self.effective_sample_size = None
+
+    @property
+    def tree(self):
+        if not self._tree:
+            builder = TreeBuilder(self.domain, SmtOracle(self.support, self.domain), self.stop_criterion,
+                                  self.split_criterion, self.sample_count_build, self.rand_gen)
+            self._tree = builder.build_tree()
+        return self._tree
+
+    @property
+    def proposal(self):
+        if self._proposal is None:
+            self._proposal = PartitionProposal(self.tree, self.weight, self.defensive)
+        return self._proposal
+
+    def get_importance_weights(self, sample_count, queries=()):
+        """
+        Draws samples from the proposal and stores the effective sample size of their importance weights
+        :return Tuple[np.ndarray, List[np.ndarray]]: The importance weights of the samples and the labels of the
+        queries on the samples
+        """
+        samples, densities = self.proposal.sample(sample_count, self.rand_gen)
+        labels = evaluate(self.domain, self.support, samples)
+        positive_samples = samples[labels]
+        weights = np.zeros(sample_count)
+        values = evaluate(self.domain, self.weight, positive_samples) if self.weight is not None else 1
+        weights[labels] = values / densities[labels]
+        query_labels = [np.zeros(sample_count, dtype=bool) for _ in queries]
+        for query_label, values in zip(query_labels, evaluate_many(self.domain, queries, positive_samples)):
+            query_label[labels] = values
+        self.effective_sample_size = float(np.sum(weights) ** 2 / np.sum(weights ** 2)) \
+            if np.any(weights != 0) else 0.0
+        return weights, query_labels
+
+    def estimate_volume(self, sample_count=None):
+        """
+        Estimates the weighted volume (the mean importance weight) and its standard error, the effective sample size of
+        the importance weights is stored in effective_sample_size
+        :return Estimate: The estimate
+        """
+        sample_count = sample_count if sample_count is not None else self.sample_count
+        weights, _ = self.get_importance_weights(sample_count)
+        std_error = float(np.std(weights, ddof=1) / math.sqrt(sample_count)) if sample_count > 1 else math.inf
+        return Estimate(float(np.mean(weights)), std_error, sample_count)
+
+    def compute_volume(self, sample_count=None, add_bounds=False):
+        return self.estimate_volume(sample_count).value
+
+    def compute_probabilities(self, queries, sample_count=None, add_bounds=False):
+        # Self-normalized importance sampling: all queries are evaluated on the same batch of samples
+        sample_count = sample_count if sample_count is not None else self.sample_count
+        weights, query_labels = self.get_importance_weights(sample_count, queries)
+        total = np.sum(weights)
+        return [np.sum(weights[q]) / total if total > 0 else None for q in query_labels]
+
+    def copy(self, domain, support, weight):
+        # The tree covers the support, it is reused for restrictions of the support (e.g., queries) in the same domain
+        tree = self._tree if domain.variables == self.domain.variables else None
+        return ImportanceSamplingEngine(domain, support, weight, self.sample_count, tree, self.sample_count_build,
+                                        self.stop_criterion, self.split_criterion, self.defensive, seed=self.seed)
+
+    def __str__(self):
+        return "is:n{}:b{}".format(self.sample_count, self.sample_count_build)
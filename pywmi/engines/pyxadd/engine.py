@@ -1,10 +1,12 @@
 from typing import Optional, List
 
+import numpy as np
 from pysmt.shortcuts import Symbol, Real, Bool, Times, Plus, And
 from pysmt.typing import REAL, BOOL
 
 from pywmi.engines.algebraic_backend import PsiPolynomialAlgebra, SympyAlgebra
 from .resolve import ResolveIntegrator
+from .sampling import XaddSampler
 from .operation import Summation, Multiplication, LogicalAnd, LogicalOr
 from pywmi.engine import Engine
 from pywmi.smt_walk import CachedSmtWalker
@@ -141,6 +143,8 @@ class PyXaddEngine(Engine):
                 algebra = SympyAlgebra()
         self.pool = pool or Pool(algebra=algebra)
         self.reduce_strategy = reduce_strategy
+        self.diagrams = None  # The diagrams of the last (bounded) integration, before integrating each variable
+        self._sampler = None
 
     def compute_volume(self, add_bounds=True):
         support = self.support
@@ -151,12 +155,31 @@ class PyXaddEngine(Engine):
         combined = self.pool.apply(Multiplication, theory_xadd, weight_xadd)
         integrator = ResolveIntegrator(self.pool, reduce_strategy=self.reduce_strategy)
         result = combined
+        diagrams = []
         for v in self.domain.get_symbols():
+            diagrams.append(result)
             result = integrator.integrate(result, v)
+        if add_bounds:
+            self.diagrams = diagrams
+            self._sampler = None
         result_node = self.pool.get_node(result)
         assert result_node.is_terminal()
         return self.pool.algebra.to_float(result_node.expression)
 
+    def get_samples(self, n, rand_gen=np.random):
+        """
+        Draws exact samples by sequential conditional sampling through the partially integrated diagrams (which are
+        computed once and reused by subsequent calls)
+        :param int n: The number of samples
+        :param rand_gen: The random generator
+        :return np.ndarray: The samples
+        """
+        if self.diagrams is None:
+            self.compute_volume()
+        if self._sampler is None:
+            self._sampler = XaddSampler(self.pool, self.domain, self.domain.get_symbols(), self.diagrams)
+        return self._sampler.sample(n, rand_gen)
+
     def copy(self, domain, support, weight):
         return PyXaddEngine(
             domain,
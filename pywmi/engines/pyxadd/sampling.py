@@ -0,0 +1,197 @@
+from typing import Dict, List
+
+import numpy as np
+import sympy
+from pysmt.fnode import FNode
+from pysmt.typing import BOOL
+
+from pywmi import Domain
+from pywmi.smt_math import CONST_KEY
+from .core import Pool
+
+BISECTION_STEPS = 60  # Halves the search interval of the inverse CDF down to machine precision
+
+
+class XaddSampler(object):
+    """
+    Draws exact samples from a weighted XADD using the partially integrated diagrams of a (sequential) integration:
+    if diagram k is the result of integrating out variables 1 to k, the last variable is sampled from its marginal
+    (diagram n - 1), its value is substituted and the next variable is sampled from diagram n - 2, etc.
+    Samples are drawn in vectorized batches: every diagram is evaluated on all samples at once by descending the
+    diagram with the group of samples that reaches each node.
+    """
+
+    def __init__(self, pool: Pool, domain: Domain, variables: List[FNode], diagrams: List[int]):
+        """
+        :param pool: The pool of the diagrams
+        :param domain: The domain of the density
+        :param variables: The variables in the order they were integrated
+        :param diagrams: The diagram before integrating each variable (diagrams[k] is the result of integrating the
+        first k variables)
+        """
+        self.pool = pool
+        self.domain = domain
+        self.variables = variables
+        self.diagrams = diagrams
+        self._terminals = dict()  # node id => vectorized function of the real variables
+        self._thresholds = dict()  # (diagram, variable) => linear tests involving the variable
+        self._degrees = dict()  # (diagram, variable) => maximal degree of the variable in the terminals
+
+    def sample(self, n, rand_gen=np.random) -> np.ndarray:
+        """
+        :param int n: The number of samples
+        :param rand_gen: The random generator
+        :return: The samples (one row per sample, columns ordered as the variables of the domain)
+        """
+        values = dict()  # type: Dict[str, np.ndarray]
+        for var, diagram in reversed(list(zip(self.variables, self.diagrams))):
+            name = var.symbol_name()
+            if var.symbol_type() == BOOL:
+                weight_true = self.evaluate(diagram, dict(values, **{name: np.ones(n)}), n)
+                weight_false = self.evaluate(diagram, dict(values, **{name: np.zeros(n)}), n)
+                total = weight_true + weight_false
+                values[name] = (rand_gen.random(n) * total < weight_true).astype(float)
+            else:
+                values[name] = self.sample_real(diagram, name, values, n, rand_gen)
+        return np.stack([values[v] for v in self.domain.variables], axis=1)
+
+    def sample_real(self, diagram: int, name: str, values: Dict[str, np.ndarray], n: int, rand_gen) -> np.ndarray:
+        """
+        Samples a real variable from the univariate (piecewise polynomial) density that remains after substituting
+        the values of the variables that have already been sampled. The density is a polynomial between consecutive
+        thresholds of the tests on the variable, on each piece the polynomial is interpolated exactly (using
+        degree + 1 Chebyshev nodes), a piece is chosen proportionally to its integral and the value within the piece is
+        found by inverting its cumulative distribution function using bisection.
+        """
+        lower, upper = self.domain.var_domains[name]
+        tests = self.get_tests(diagram, name)
+        thresholds = np.empty((n, len(tests)))
+        for i, (coefficients, constant) in enumerate(tests):
+            rest = constant + sum(c * values[v] for v, c in coefficients.items() if v != name)
+            thresholds[:, i] = -rest / coefficients[name]
+        points = np.sort(np.concatenate([np.full((n, 1), lower), np.clip(thresholds, lower, upper),
+                                         np.full((n, 1), upper)], axis=1), axis=1)
+        middles, halves = (points[:, 1:] + points[:, :-1]) / 2, (points[:, 1:] - points[:, :-1]) / 2
+
+        size = self.get_degree(diagram, name) + 1
+        nodes = np.cos((2 * np.arange(size) + 1) * np.pi / (2 * size))
+        locations = middles[:, :, np.newaxis] + halves[:, :, np.newaxis] * nodes
+        pieces = locations.shape[1]
+        repeated = {v: np.repeat(column, pieces * size) for v, column in values.items()}
+        repeated[name] = locations.reshape(-1)
+        densities = self.evaluate(diagram, repeated, n * pieces * size).reshape(n, pieces, size)
+        # Monomial coefficients (in the normalized coordinate u in [-1, 1]) of the polynomial on every piece
+        coefficients = densities @ np.linalg.inv(np.vander(nodes, size, increasing=True)).T
+
+        powers = np.arange(1, size + 1)
+        antiderivative = coefficients / powers  # Coefficients of u^1, ..., u^size
+        masses = np.maximum(np.sum(antiderivative * (1 - (-1.0) ** powers), axis=2) * halves, 0)
+
+        cumulative = np.cumsum(masses, axis=1)
+        target = rand_gen.random(n) * cumulative[:, -1]
+        piece = np.minimum(np.sum(cumulative <= target[:, np.newaxis], axis=1), pieces - 1)
+        rows = np.arange(n)
+        chosen = antiderivative[rows, piece]
+        fraction = rand_gen.random(n)
+        below = self._integral(chosen, -np.ones(n))
+        total = self._integral(chosen, np.ones(n)) - below
+
+        low, high = -np.ones(n), np.ones(n)
+        for _ in range(BISECTION_STEPS):
+            middle = (low + high) / 2
+            smaller = self._integral(chosen, middle) - below < fraction * total
+            low, high = np.where(smaller, middle, low), np.where(smaller, high, middle)
+        result = middles[rows, piece] + halves[rows, piece] * (low + high) / 2
+        empty = cumulative[:, -1] <= 0
+        result[empty] = lower + rand_gen.random(np.count_nonzero(empty)) * (upper - lower)
+        return result
+
+    @staticmethod
+    def _integral(antiderivative, u):
+        # Horner's scheme for the coefficients of u^1, ..., u^size
+        result = np.zeros_like(u)
+        for i in range(antiderivative.shape[1] - 1, -1, -1):
+            result = (result + antiderivative[:, i]) * u
+        return result
+
+    def evaluate(self, diagram: int, values: Dict[str, np.ndarray], n: int) -> np.ndarray:
+        """
+        :return: The value of the diagram for every sample (values contains one column per variable)
+        """
+        result = np.zeros(n)
+        stack = [(diagram, np.arange(n))]
+        while stack:
+            node_id, rows = stack.pop()
+            if len(rows) == 0 or node_id == self.pool.zero_id:
+                continue
+            node = self.pool.get_node(node_id)
+            if node.is_terminal():
+                result[rows] = self.get_terminal(node)({v: column[rows] for v, column in values.items()})
+                continue
+            decision = node.decision
+            if decision.is_bool():
+                truth = values[decision.test.symbol_name()][rows] != 0
+            else:
+                coefficients, constant = self._linear(decision)
+                truth = constant + sum(c * values[v][rows] for v, c in coefficients.items()) <= 0
+            stack.append((node.child_true, rows[truth]))
+            stack.append((node.child_false, rows[~truth]))
+        return result
+
+    @staticmethod
+    def _linear(decision):
+        inequality = decision.inequality.inequality_dict
+        coefficients = {key[0]: value for key, value in inequality.items() if key != CONST_KEY}
+        return coefficients, inequality.get(CONST_KEY, 0)
+
+    def get_terminal(self, node):
+        if node.node_id not in self._terminals:
+            expression = _to_sympy(node.expression)
+            symbols = sorted(expression.free_symbols, key=str)
+            function = sympy.lambdify(symbols, expression, "numpy")
+            names = [str(s) for s in symbols]
+            self._terminals[node.node_id] = lambda values: function(*[values[v] for v in names])
+        return self._terminals[node.node_id]
+
+    def get_nodes(self, diagram: int):
+        nodes, stack = set(), [diagram]
+        while stack:
+            node_id = stack.pop()
+            if node_id not in nodes:
+                nodes.add(node_id)
+                node = self.pool.get_node(node_id)
+                if not node.is_terminal():
+                    stack += [node.child_true, node.child_false]
+        return [self.pool.get_node(node_id) for node_id in nodes]
+
+    def get_tests(self, diagram: int, name: str):
+        key = (diagram, name)
+        if key not in self._thresholds:
+            tests = []
+            for node in self.get_nodes(diagram):
+                if not node.is_terminal() and not node.decision.is_bool():
+                    coefficients, constant = self._linear(node.decision)
+                    if coefficients.get(name, 0) != 0:
+                        tests.append((coefficients, constant))
+            self._thresholds[key] = tests
+        return self._thresholds[key]
+
+    def get_degree(self, diagram: int, name: str) -> int:
+        key = (diagram, name)
+        if key not in self._degrees:
+            symbol = sympy.Symbol(name)
+            degree = 0
+            for node in self.get_nodes(diagram):
+                if node.is_terminal():
+                    expression = _to_sympy(node.expression)
+                    if symbol in expression.free_symbols:
+                        degree = max(degree, sympy.Poly(expression, symbol).degree())
+            self._degrees[key] = degree
+        return self._degrees[key]
+
+
+def _to_sympy(expression):
+    # Terminals of other algebras (e.g., PSI polynomials) are converted through their string representation
+    if isinstance(expression, sympy.Poly):
+        return expression.as_expr()
+    return expression if isinstance(expression, sympy.Basic) else sympy.sympify(str(expression))
@@ -1,16 +1,34 @@
+import math
+import os
+import time
+import weakref
 from builtins import range
+from concurrent.futures import ProcessPoolExecutor
+from itertools import combinations_with_replacement
 from typing import List
 
 import numpy
 import pysmt.shortcuts as smt
 import scipy.optimize
+from scipy.special import comb
 
-from pywmi import evaluate, Domain
+from pywmi import evaluate, evaluate_many, Domain
 from pywmi.engine import Engine
-from pywmi.sample import uniform
+from pywmi.estimate import Estimate, SampleStatistics
+from pywmi.parallel import TASK_SIZE, _run
+from pywmi.parse import smt_to_nested, nested_to_smt
+from pywmi.rng import make_rand_gen, get_state, from_state, spawn, seed_sequence
+from pywmi.sample import uniform, boolean_groups
 from pywmi.smt_math import LinearInequality, Polynomial
 from .convex_integrator import ConvexIntegrationBackend
 
+QMC_REPLICATES = 8
+MAX_STRATA = 1024  # The default maximal number of Boolean worlds (strata) that are enumerated
+PILOT_FRACTION = 0.1  # The fraction of samples used to estimate the variance within every stratum
+BATCH_SIZE = 10000  # The default number of samples drawn per batch in sequential mode
+MIN_ACCEPTED = 30  # The number of accepted samples required before sequential estimation can stop
+CONTROL_DEGREE = 2  # The default maximal degree of the monomials of the real variables used as control variates
+
 
 def sample(n_boolean_vars, bounds, n):
     samples = numpy.random.random((n, n_boolean_vars + len(bounds)))
@@ -23,84 +41,626 @@ def sample(n_boolean_vars, bounds, n):
     return samples
 
 
+def get_bound_volume(domain):
+    """
+    :return: The volume of the region that uniform samples of the domain are drawn from (the product of the real bounds
+    or, if there are no real variables, the number of Boolean assignments)
+    """
+    return domain.get_volume() if len(domain.real_vars) > 0 else 2 ** len(domain.bool_vars)
+
+
 class RejectionEngine(Engine):
-    def __init__(self, domain, support, weight, sample_count, seed=None):
+    def __init__(self, domain, support, weight, sample_count, seed=None, sampling="random", replicates=None,
+                 stratify=False, max_strata=MAX_STRATA, relative_error=None, half_width=None, confidence=0.95,
+                 time_budget=None, batch_size=BATCH_SIZE, incremental=False, processes=1, control_variates=False,
+                 control_degree=CONTROL_DEGREE):
+        """
+        :param seed: An integer seed, a SeedSequence or a random generator (see pywmi.rng.make_rand_gen)
+        :param sampling: The sampling method ("random", or "sobol" or "halton" for quasi-Monte Carlo sampling)
+        :param replicates: The number of independently scrambled replicates that quasi-Monte Carlo estimates are
+        averaged over (the spread between replicates determines the standard error), by default QMC_REPLICATES
+        :param stratify: If true, volumes are estimated using stratified sampling over Boolean worlds (see
+        estimate_stratified)
+        :param max_strata: The maximal number of strata (if there are more Boolean worlds, only a subset of the
+        Boolean variables is used to define strata, see get_strata_variables)
+        :param relative_error: If given, estimates are computed sequentially: batches of samples are drawn until the
+        half-width of the confidence interval relative to the estimate is at most relative_error (or the sample_count
+        or time_budget is exhausted)
+        :param half_width: If given, estimates are computed sequentially until the (absolute) half-width of the
+        confidence interval is at most half_width
+        :param confidence: The confidence level of the intervals used for sequential estimation
+        :param time_budget: The number of seconds after which sequential estimation stops (None for no limit)
+        :param batch_size: The number of samples drawn per batch in sequential mode
+        :param incremental: If true, the engine keeps the statistics of all samples drawn so far (see statistics) and
+        later estimates only draw the samples that are missing to reach their sample count (or accuracy target)
+        :param processes: The number of processes that samples are drawn in (None for one per CPU), with multiple
+        processes the samples are split into one shard per process and only the statistics of every shard are
+        returned to the engine (see draw_statistics), the pool of processes is started once and reused by all
+        estimates of the engine (see executor and close)
+        :param control_variates: If true, the variance of estimates is reduced using control variates (functions with
+        a known integral over the bounding box, see estimate_control_variates)
+        :param control_degree: The maximal degree of the monomials of the real variables used as control variates
+        """
         Engine.__init__(self, domain, support, weight, exact=False)
         self.sample_count = sample_count
         self.seed = seed
-        self.rand_gen = numpy.random.RandomState(self.seed)
+        self.sampling = sampling
+        self.replicates = replicates
+        self.stratify = stratify
+        self.max_strata = max_strata
+        self.relative_error = relative_error
+        self.half_width = half_width
+        self.confidence = confidence
+        self.time_budget = time_budget
+        self.batch_size = batch_size
+        self.processes = processes
+        self.control_variates = control_variates
+        self.control_degree = control_degree
+        self.stopped_by = None  # The criterion that ended the last sequential estimate ("target", "sample_count" or
+        # "time_budget")
+        if (self.sequential or incremental or self.parallel) and (sampling != "random" or stratify):
+            raise ValueError("Sequential, incremental and parallel estimation require pseudo-random sampling without "
+                             "stratification")
+        if control_variates and (sampling != "random" or stratify or self.sequential or incremental or self.parallel):
+            raise ValueError("Control variates require pseudo-random sampling in a single (non-sequential) estimate")
+        self.rand_gen = make_rand_gen(self.seed)
+        self.statistics = SampleStatistics() if incremental else None  # The statistics kept by incremental engines
+        self._executor = None
+
+    @property
+    def parallel(self):
+        return self.processes != 1
+
+    @property
+    def executor(self):
+        """
+        The pool of processes of a parallel engine, started on first use (it is shut down by close, or when the engine
+        is garbage collected)
+        """
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.processes or os.cpu_count())
+            weakref.finalize(self, self._executor.shutdown)
+        return self._executor
+
+    def close(self):
+        """
+        Shuts down the pool of processes (if it was started), later estimates start a new pool
+        """
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    @property
+    def incremental(self):
+        return self.statistics is not None
+
+    def get_statistics(self, ohe_variables=None, exactly_k=None):
+        """
+        :return SampleStatistics: The statistics of the engine if it is incremental, otherwise new statistics
+        """
+        if not self.incremental:
+            return SampleStatistics()
+        if ohe_variables is not None or exactly_k is not None:
+            raise ValueError("Incremental estimation does not support one-hot or exactly-k groups")
+        return self.statistics
+
+    def checkpoint(self):
+        """
+        :return dict: The state of an incremental engine (its statistics and random generator, JSON serializable),
+        which can be used to resume the estimation later on (see resume)
+        """
+        if not self.incremental:
+            raise ValueError("Only incremental engines can be checkpointed")
+        return {"statistics": self.statistics.get_state(), "rand_gen": get_state(self.rand_gen)}
+
+    def resume(self, state):
+        """
+        Continues the estimation of a checkpoint (see checkpoint), the engine becomes incremental
+        :param dict state: The checkpoint
+        """
+        self.statistics = SampleStatistics.from_state(state["statistics"])
+        self.rand_gen = from_state(state["rand_gen"])
+
+    @property
+    def sequential(self):
+        return self.relative_error is not None or self.half_width is not None
+
+    def get_bound_volume(self, ohe_variables=None, exactly_k=None):
+        """
+        :return: The volume of the region that is sampled from, Boolean variables in one-hot encoded (or exactly-k)
+        groups only contribute the number of valid assignments of their group
+        """
+        if ohe_variables is None and exactly_k is None:
+            return get_bound_volume(self.domain)
+
+        groups = boolean_groups(self.domain, ohe_variables, exactly_k)
+        grouped = {i for indices, _ in groups for i in indices}
+        bound_volume = 2 ** len([v for v in self.domain.bool_vars
+                                 if self.domain.variables.index(v) not in grouped])
+        for indices, k in groups:
+            bound_volume *= comb(len(indices), k, exact=True)
 
-    def compute_volume(self, sample_count=None, add_bounds=False, ohe_variables=None):
+        real_volume = self.domain.get_bounding_box_volume()
+        if real_volume != 0:
+            bound_volume *= real_volume
+        return bound_volume
+
+    def compute_volume(self, sample_count=None, add_bounds=False, ohe_variables=None, exactly_k=None):
+        return self.estimate_volume(sample_count, ohe_variables, exactly_k).value
+
+    def estimate_volume(self, sample_count=None, ohe_variables=None, exactly_k=None):
+        """
+        Estimates the weighted volume and its standard error. Pseudo-random samples yield one estimate whose standard
+        error is computed from the sample variance, quasi-Monte Carlo samples are split over independently scrambled
+        replicates whose spread determines the standard error.
+        :return Estimate: The estimate
+        """
         sample_count = sample_count if sample_count is not None else self.sample_count
-        samples = uniform(self.domain, sample_count, rand_gen=self.rand_gen, ohe_variables=ohe_variables)
-        labels = evaluate(self.domain, self.support, samples)
+        if self.control_variates:
+            return self.estimate_control_variates(sample_count, (), ohe_variables, exactly_k)[0]
+        if self.sequential or self.incremental or self.parallel:
+            statistics = self.get_statistics(ohe_variables, exactly_k)
+            if self.sequential:
+                self.sample_sequentially(sample_count, statistics, (), ohe_variables, exactly_k)
+            elif sample_count > statistics.sample_count:
+                n = sample_count - statistics.sample_count
+                statistics.merge(self.draw_statistics(n, (), ohe_variables, exactly_k))
+            return statistics.volume(self.get_bound_volume(ohe_variables, exactly_k))
+        if self.stratify:
+            if ohe_variables is not None or exactly_k is not None:
+                raise ValueError("Stratified sampling does not support one-hot or exactly-k groups")
+            return self.estimate_stratified(sample_count)
+        if self.sampling == "random":
+            replicates = 1
+        else:
+            replicates = max(1, min(self.replicates or QMC_REPLICATES, sample_count))
+        bound_volume = self.get_bound_volume(ohe_variables, exactly_k)
+
+        estimates, count = [], 0
+        for replicate in range(replicates):
+            n = sample_count // replicates + (1 if replicate < sample_count % replicates else 0)
+            samples = uniform(self.domain, n, rand_gen=self.rand_gen, ohe_variables=ohe_variables,
+                              sampling=self.sampling, exactly_k=exactly_k)
+            labels = evaluate(self.domain, self.support, samples)
+            if self.weight is not None:
+                values = evaluate(self.domain, self.weight, samples[labels])
+            else:
+                values = numpy.ones(numpy.count_nonzero(labels))
+            mean = numpy.sum(values) / n if n > 0 else 0.0
+            mean_of_squares = numpy.sum(values * values) / n if n > 0 else 0.0
+            estimates.append((bound_volume * mean, bound_volume ** 2 * max(mean_of_squares - mean ** 2, 0.0), n))
+            count += n
+
+        if replicates == 1:
+            value, variance, n = estimates[0]
+            std_error = math.sqrt(variance / (n - 1)) if n > 1 else math.inf
+        else:
+            replicate_values = numpy.array([e[0] for e in estimates])
+            value = float(numpy.mean(replicate_values))
+            std_error = float(numpy.std(replicate_values, ddof=1) / math.sqrt(replicates))
+        return Estimate(float(value), std_error, count, replicates)
+
+    def get_strata_variables(self, sample_count):
+        """
+        If all Boolean worlds can be enumerated (at most max_strata worlds with two pilot samples each), every world is
+        a stratum. Otherwise, the strata are the assignments to a subset of the Boolean variables, preferring the
+        variables that occur in the weight (and then the support), so every stratum is a set of worlds and the
+        remaining Boolean variables are not stratified. Unlike strata of sampled worlds plus one residual stratum of
+        all other worlds, this covers every world by a stratum of known volume, which keeps the residual stratum from
+        absorbing worlds whose weight the selection of strata missed.
+        :return List[str]: The Boolean variables whose assignments define the strata
+        """
+        def priority(v):
+            symbol = self.domain.get_symbol(v)
+            in_weight = self.weight is not None and symbol in self.weight.get_free_variables()
+            return 0 if in_weight else (1 if symbol in self.support.get_free_variables() else 2)
+
+        # Every stratum needs at least two pilot samples
+        count = min(len(self.domain.bool_vars), int(math.log2(max(self.max_strata, 1))),
+                    int(math.log2(max(sample_count * PILOT_FRACTION / 2, 1))))
+        return sorted(self.domain.bool_vars, key=priority)[:count]
+
+    def estimate_stratified(self, sample_count):
+        """
+        Estimates the weighted volume using stratified sampling: every assignment to the strata variables (see
+        get_strata_variables) is a stratum of known (equal) volume. A pilot run spends PILOT_FRACTION of the samples
+        evenly over the strata, the remaining samples are allocated proportionally to the standard deviation that
+        the pilot observed within every stratum (Neyman allocation). Within a stratum, the remaining Boolean and the
+        real variables are sampled uniformly.
+        :return Estimate: The estimate (combining the per-stratum means with the exact stratum volumes)
+        """
+        variables = self.get_strata_variables(sample_count)
+        columns = [self.domain.variables.index(v) for v in variables]
+        strata = 2 ** len(variables)
+        stratum_volume = self.get_bound_volume() / strata
+        totals, squares, counts = numpy.zeros(strata), numpy.zeros(strata), numpy.zeros(strata, dtype=int)
+
+        def sample_strata(allocation):
+            stratum = numpy.repeat(numpy.arange(strata), allocation)
+            samples = uniform(self.domain, len(stratum), rand_gen=self.rand_gen, sampling=self.sampling)
+            samples[:, columns] = (stratum[:, numpy.newaxis] >> numpy.arange(len(columns))) & 1
+            labels = evaluate(self.domain, self.support, samples)
+            values = numpy.zeros(len(stratum))
+            if self.weight is not None:
+                values[labels] = evaluate(self.domain, self.weight, samples[labels])
+            else:
+                values[labels] = 1
+            totals[:] += numpy.bincount(stratum, values, strata)
+            squares[:] += numpy.bincount(stratum, values * values, strata)
+            counts[:] += allocation
+
+        pilot = max(2, int(sample_count * PILOT_FRACTION) // strata)
+        sample_strata(numpy.full(strata, pilot))
 
-        if ohe_variables is None:
-            bound_volume = self.domain.get_volume() if len(self.domain.real_vars) > 0 else 2 ** len(self.domain.bool_vars)
+        means = totals / counts
+        deviations = numpy.sqrt(numpy.maximum(squares / counts - means ** 2, 0) * counts / (counts - 1))
+        remaining = max(sample_count - int(numpy.sum(counts)), 0)
+        if remaining > 0:
+            # Half of the samples are allocated evenly, in case the pilot missed the variance of a stratum
+            shares = numpy.full(strata, 0.5 / strata)
+            shares += 0.5 * deviations / numpy.sum(deviations) if numpy.sum(deviations) > 0 else 0.5 / strata
+            allocation = numpy.floor(shares * remaining).astype(int)
+            allocation[numpy.argsort(-(shares * remaining - allocation))[:remaining - numpy.sum(allocation)]] += 1
+            sample_strata(allocation)
+
+        means = totals / counts
+        variances = numpy.maximum(squares / counts - means ** 2, 0) * counts / (counts - 1)
+        value = stratum_volume * numpy.sum(means)
+        std_error = stratum_volume * math.sqrt(numpy.sum(variances / counts))
+        return Estimate(float(value), std_error, int(numpy.sum(counts)))
+
+    def sample_weights(self, sample_count, queries=(), ohe_variables=None, exactly_k=None):
+        """
+        :return Tuple[np.ndarray, List[np.ndarray]]: The weights of the accepted samples (out of sample_count drawn
+        samples) and the labels of the queries on the accepted samples
+        """
+        samples = uniform(self.domain, sample_count, rand_gen=self.rand_gen, ohe_variables=ohe_variables,
+                          sampling=self.sampling, exactly_k=exactly_k)
+        positive_samples = samples[evaluate(self.domain, self.support, samples)]
+        if self.weight is not None:
+            weights = evaluate(self.domain, self.weight, positive_samples)
         else:
-            ohevars = {x for ohe in ohe_variables for x in ohe}
-            bound_volume = 2 ** len([v for v in self.domain.bool_vars
-                                     if v not in ohevars])
-            for ohe in ohe_variables:
-                bound_volume *= len(ohe)
+            weights = numpy.ones(len(positive_samples))
+        return weights, evaluate_many(self.domain, queries, positive_samples)
+
+    def draw_statistics(self, sample_count, queries=(), ohe_variables=None, exactly_k=None):
+        """
+        Draws new samples and computes their statistics. In parallel mode, the samples are split into one shard per
+        process, the i-th shard uses the i-th child stream spawned from the random generator of the engine and the
+        statistics of the shards are merged in shard order (the result only depends on the seed and the number of
+        processes).
+        :return SampleStatistics: The statistics of the samples
+        """
+        statistics = SampleStatistics(queries)
+        if not self.parallel:
+            statistics.add(sample_count, *self.sample_weights(sample_count, queries, ohe_variables, exactly_k))
+            return statistics
 
-            real_volume = self.domain.get_bounding_box_volume()
-            if real_volume != 0:
-                bound_volume *= real_volume
+        processes = self.processes or os.cpu_count()
+        sizes = [sample_count // processes + (1 if i < sample_count % processes else 0) for i in range(processes)]
+        weight = smt_to_nested(self.weight) if self.weight is not None else None
+        arguments = [(self.domain.get_state(), smt_to_nested(self.support), weight,
+                      [smt_to_nested(query) for query in queries], size, child_seed, ohe_variables, exactly_k)
+                     for size, child_seed in zip(sizes, spawn(seed_sequence(self.rand_gen), processes)) if size > 0]
+        executor = self.executor if len(arguments) > 1 else None
+        for state in _run(_statistics_task, arguments, processes, executor):
+            statistics.merge(SampleStatistics.from_state(state))
+        return statistics
 
-        approx_volume = bound_volume * sum(labels) / len(labels)
+    def get_controls(self, groups=False):
+        """
+        The control variates are the monomials of the variables up to the control degree (Boolean variables are only
+        included if they are not sampled in one-hot or exactly-k groups) and the weight (if it is a polynomial of the
+        real variables). Their means under uniform sampling from the bounding box are known in closed form.
+        :param bool groups: True iff Boolean variables are sampled in groups
+        :return Tuple[List[int], np.ndarray, Polynomial, np.ndarray]: The indices of the variables of the monomials,
+        their exponents (one row per monomial), the polynomial weight (or None) and the means of all controls
+        """
+        real_count = len(self.domain.real_vars)
+        bounds = numpy.array([self.domain.var_domains[v] for v in self.domain.real_vars], dtype=float).reshape(-1, 2)
+        columns = [self.domain.variables.index(v) for v in self.domain.real_vars]
+        columns += [] if groups else [self.domain.variables.index(v) for v in self.domain.bool_vars]
 
+        def box_means(exponents):
+            # The mean of x ** e over [l, u] is (u ** (e + 1) - l ** (e + 1)) / ((e + 1) * (u - l)), or l ** e if the
+            # bounds coincide (l = u), a Boolean variable (or any power of it) has mean 1 / 2
+            lower, upper = bounds[:, 0], bounds[:, 1]
+            real_exponents, bool_exponents = exponents[:, :real_count], exponents[:, real_count:]
+            degenerate = upper == lower
+            width = numpy.where(degenerate, 1.0, upper - lower)
+            means = numpy.where(degenerate, lower ** real_exponents,
+                                (upper ** (real_exponents + 1) - lower ** (real_exponents + 1))
+                                / ((real_exponents + 1) * width))
+            return numpy.prod(means, axis=1) * 0.5 ** numpy.count_nonzero(bool_exponents, axis=1)
+
+        monomials = []
+        for degree in range(1, self.control_degree + 1):
+            for variables in combinations_with_replacement(range(len(columns)), degree):
+                exponents = numpy.bincount(variables, minlength=len(columns))
+                if numpy.all(exponents[real_count:] <= 1):  # Powers of Boolean variables are duplicates
+                    monomials.append(exponents)
+        exponents = numpy.array(monomials, dtype=int).reshape(-1, len(columns))
+        means = [box_means(exponents)]
+
+        polynomial = None
         if self.weight is not None:
-            pos_samples = samples[labels]
-            sample_weights = evaluate(self.domain, self.weight, pos_samples)
             try:
-                return sum(sample_weights) / pos_samples.shape[0] * approx_volume
-            except ZeroDivisionError:
-                return 0.0
+                polynomial = Polynomial.from_smt(self.weight)
+                weight_exponents, coefficients = polynomial.to_exponent_matrix(self.domain.real_vars)
+                weight_exponents = numpy.hstack([weight_exponents, numpy.zeros((len(coefficients),
+                                                                                len(columns) - real_count), int)])
+                means.append([numpy.sum(coefficients * box_means(weight_exponents))])
+            except ValueError:
+                polynomial = None  # The weight is not a polynomial of the real variables
+        return columns, exponents, polynomial, numpy.concatenate(means)
+
+    def estimate_control_variates(self, sample_count, queries=(), ohe_variables=None, exactly_k=None):
+        """
+        Estimates the weighted volume and query probabilities using control variates: the weighted support indicator
+        (and its product with every query) is regressed on the controls (see get_controls) and the estimates are
+        corrected by the fitted coefficients times the difference between the sample means of the controls and their
+        known means. The regression uses sufficient statistics that are accumulated over batches of samples.
+        :return Tuple[Estimate, List[Estimate]]: The estimated volume and query probabilities
+        """
+        columns, exponents, polynomial, control_means = self.get_controls(ohe_variables is not None
+                                                                           or exactly_k is not None)
+        controls_count, values_count = len(control_means), 1 + len(queries)
+        n, control_sums, value_sums = 0, numpy.zeros(controls_count), numpy.zeros(values_count)
+        control_products = numpy.zeros((controls_count, controls_count))
+        cross_products = numpy.zeros((controls_count, values_count))
+        value_products = numpy.zeros((values_count, values_count))
+
+        for start in range(0, sample_count, self.batch_size):
+            size = min(self.batch_size, sample_count - start)
+            samples = uniform(self.domain, size, rand_gen=self.rand_gen, ohe_variables=ohe_variables,
+                              exactly_k=exactly_k)
+            labels = evaluate(self.domain, self.support, samples)
+            values = numpy.zeros((size, values_count))
+            formulas = ([self.weight] if self.weight is not None and polynomial is None else []) + list(queries)
+            results = evaluate_many(self.domain, formulas, samples[labels])
+            if polynomial is not None:
+                weights = evaluate(self.domain, self.weight, samples)
+                values[labels, 0] = weights[labels]
+            else:
+                weights = results.pop(0) if self.weight is not None else 1
+                values[labels, 0] = weights
+            for i, query_labels in enumerate(results):
+                values[labels, i + 1] = values[labels, 0] * query_labels
+
+            variables = samples[:, columns]
+            controls = numpy.empty((size, len(control_means)))
+            for i, monomial in enumerate(exponents):
+                factors = numpy.nonzero(monomial)[0]
+                controls[:, i] = numpy.prod(variables[:, factors] ** monomial[factors], axis=1)
+            if polynomial is not None:
+                controls[:, -1] = weights
+
+            n += size
+            control_sums += numpy.sum(controls, axis=0)
+            value_sums += numpy.sum(values, axis=0)
+            control_products += controls.T @ controls
+            cross_products += controls.T @ values
+            value_products += values.T @ values
+
+        control_mean, value_mean = control_sums / n, value_sums / n
+        control_covariance = control_products / n - numpy.outer(control_mean, control_mean)
+        cross_covariance = cross_products / n - numpy.outer(control_mean, value_mean)
+        value_covariance = value_products / n - numpy.outer(value_mean, value_mean)
+        coefficients = numpy.linalg.pinv(control_covariance) @ cross_covariance
+        corrected = value_mean - (control_mean - control_means) @ coefficients
+        degrees_of_freedom = max(n - numpy.linalg.matrix_rank(control_covariance) - 1, 1)
+        residual_covariance = (value_covariance - cross_covariance.T @ coefficients) * n / degrees_of_freedom
+
+        bound_volume = self.get_bound_volume(ohe_variables, exactly_k)
+        volume = Estimate(float(bound_volume * corrected[0]),
+                          bound_volume * math.sqrt(max(residual_covariance[0, 0], 0.0) / n), n)
+        probabilities = []
+        for i in range(1, values_count):
+            if corrected[0] == 0:
+                probabilities.append(Estimate(math.nan, math.inf, n))
+                continue
+            p = corrected[i] / corrected[0]
+            variance = residual_covariance[i, i] - 2 * p * residual_covariance[i, 0] + p ** 2 * residual_covariance[0, 0]
+            probabilities.append(Estimate(float(p), math.sqrt(max(variance, 0.0) / n) / abs(corrected[0]), n))
+        return volume, probabilities
+
+    def is_accurate(self, estimate):
+        """
+        :return bool: True iff the estimate satisfies the relative error and half-width targets
+        """
+        half_width = estimate.half_width(self.confidence)
+        if self.relative_error is not None and not half_width <= self.relative_error * abs(estimate.value):
+            return False
+        return self.half_width is None or half_width <= self.half_width
+
+    def sample_sequentially(self, sample_count, statistics, queries=(), ohe_variables=None, exactly_k=None):
+        """
+        Adds batches of samples to the statistics until the estimate of the volume (or, if queries are given, the
+        estimate of every query probability) is accurate (see is_accurate), or until the statistics (of every query)
+        contain sample_count samples or the time budget is exhausted. Queries stop being evaluated once their estimate
+        is accurate.
+        :param SampleStatistics statistics: The statistics to update
+        """
+        bound_volume = self.get_bound_volume(ohe_variables, exactly_k)
+        active = [statistics.index(query) for query in queries]
+        start_time = time.perf_counter()
+        self.stopped_by = None
+        while True:
+            if statistics.accepted >= MIN_ACCEPTED:
+                active = [i for i in active if not self.is_accurate(statistics.probability(i))]
+                if len(queries) > 0 and len(active) == 0 \
+                        or len(queries) == 0 and self.is_accurate(statistics.volume(bound_volume)):
+                    self.stopped_by = "target"
+                    break
+            drawn = min(statistics.query_sample_counts[active]) if len(queries) > 0 else statistics.sample_count
+            if drawn >= sample_count:
+                self.stopped_by = "sample_count"
+                break
+            if self.time_budget is not None and time.perf_counter() - start_time >= self.time_budget:
+                self.stopped_by = "time_budget"
+                break
+
+            n = min(self.batch_size, sample_count - drawn)
+            statistics.merge(self.draw_statistics(n, [statistics.queries[i] for i in active], ohe_variables,
+                                                  exactly_k))
+
+    def estimate_probabilities(self, queries, sample_count=None):
+        """
+        Estimates the probabilities of the queries (as ratios of weighted volumes computed on the same samples) and
+        their standard errors. In sequential mode, sampling stops once every query is accurate (see
+        sample_sequentially), otherwise sample_count samples are drawn.
+        :return List[Estimate]: The estimates (with value nan if no sample was accepted)
+        """
+        sample_count = sample_count if sample_count is not None else self.sample_count
+        if self.control_variates:
+            return self.estimate_control_variates(sample_count, queries)[1]
+        statistics = self.get_statistics()
+        if self.sequential:
+            self.sample_sequentially(sample_count, statistics, queries)
         else:
-            return approx_volume
+            indices = [statistics.index(query) for query in queries]
+            missing = [i for i in indices if statistics.query_sample_counts[i] < sample_count]
+            if len(missing) > 0:
+                n = sample_count - min(statistics.query_sample_counts[missing])
+                statistics.merge(self.draw_statistics(n, [statistics.queries[i] for i in missing]))
+        return [statistics.probability(statistics.index(query)) for query in queries]
 
     def copy(self, domain, support, weight):
-        return RejectionEngine(domain, support, weight, self.sample_count, seed=self.seed)
+        return RejectionEngine(domain, support, weight, self.sample_count, seed=self.seed, sampling=self.sampling,
+                               replicates=self.replicates, stratify=self.stratify, max_strata=self.max_strata,
+                               relative_error=self.relative_error, half_width=self.half_width,
+                               confidence=self.confidence, time_budget=self.time_budget, batch_size=self.batch_size,
+                               incremental=self.incremental, processes=self.processes,
+                               control_variates=self.control_variates, control_degree=self.control_degree)
 
     def __str__(self):
-        return "rej" + (":n{}".format(self.sample_count))
+        return "rej" + (":n{}".format(self.sample_count)) \
+               + (":{}".format(self.sampling) if self.sampling != "random" else "") \
+               + (":stratified" if self.stratify else "") \
+               + (":re{}".format(self.relative_error) if self.relative_error is not None else "") \
+               + (":hw{}".format(self.half_width) if self.half_width is not None else "") \
+               + (":p{}".format(self.processes or "all") if self.parallel else "") \
+               + (":cv{}".format(self.control_degree) if self.control_variates else "")
 
     def compute_probabilities(self, queries, sample_count=None, add_bounds=False):
         sample_count = sample_count if sample_count is not None else self.sample_count
-        samples = uniform(self.domain, sample_count, rand_gen=self.rand_gen)
+        if self.sequential or self.incremental or self.parallel or self.control_variates:
+            return [None if math.isnan(e.value) else e.value for e in self.estimate_probabilities(queries, sample_count)]
+        samples = uniform(self.domain, sample_count, rand_gen=self.rand_gen, sampling=self.sampling)
         labels = evaluate(self.domain, self.support, samples)
         positive_samples = samples[labels]
 
-        results = []
         if self.weight is not None:
-            sample_weights = evaluate(self.domain, self.weight, positive_samples)
-            total = sum(sample_weights)
-            for query in queries:
-                if total > 0:
-                    query_labels = numpy.logical_and(evaluate(self.domain, query, positive_samples), labels[labels])
-                    results.append(sum(sample_weights[query_labels]) / total)
-                else:
-                    results.append(None)
+            sample_weights, *query_labels = evaluate_many(self.domain, [self.weight] + list(queries), positive_samples)
+            total = numpy.sum(sample_weights)
+            return [numpy.sum(sample_weights[q]) / total if total > 0 else None for q in query_labels]
         else:
             total = positive_samples.shape[0]
-            for query in queries:
-                if total > 0:
-                    query_labels = numpy.logical_and(evaluate(self.domain, query, positive_samples), labels[labels])
-                    results.append(sum(query_labels) / total)
+            query_labels = evaluate_many(self.domain, queries, positive_samples)
+            return [numpy.count_nonzero(q) / total if total > 0 else None for q in query_labels]
+
+
+class SharedSamples(object):
+    """
+    One set of uniform samples of a domain that is shared by the volume estimates of many supports (and weights), e.g.,
+    to score candidate supports during structure search while paying the sampling cost once. All formulas are
+    evaluated together on blocks of samples, so atoms (e.g., linear inequalities) that occur in several supports are
+    only evaluated once per block (see pywmi.evaluate_many).
+
+    Since all estimates are computed from the same samples, their errors are correlated (common random numbers): the
+    standard error of every estimate is valid on its own, but the errors of different estimates are not independent.
+    Differences between estimates of similar supports (e.g., to rank candidates) are therefore typically far more
+    accurate than the standard errors suggest, while sums or averages of estimates are not more accurate than the
+    individual estimates. The full covariance of the estimates can be computed using estimate_volumes.
+    """
+
+    def __init__(self, domain, sample_count, seed=None, compact=False, block_size=BATCH_SIZE):
+        """
+        :param Domain domain: The domain to sample from
+        :param int sample_count: The number of samples
+        :param seed: An integer seed, a SeedSequence or a random generator (see pywmi.rng.make_rand_gen)
+        :param bool compact: If true, samples are stored compactly (see pywmi.CompactSamples)
+        :param int block_size: The number of samples that all formulas are evaluated on at once
+        """
+        self.domain = domain
+        self.samples = uniform(domain, sample_count, rand_gen=make_rand_gen(seed), compact=compact)
+        self.block_size = block_size
+
+    @property
+    def sample_count(self):
+        return self.samples.shape[0]
+
+    def estimate_volumes(self, supports, weights=None, covariance=False):
+        """
+        Estimates the weighted volume of every support using the shared samples
+        :param List[FNode] supports: The supports
+        :param weights: None (unweighted), one weight for all supports or a list with one weight per support
+        :param bool covariance: If true, the covariance matrix of the estimates is returned as well
+        :return List[Estimate]|Tuple[List[Estimate], np.ndarray]: The estimates (and their covariance matrix)
+        """
+        supports = list(supports)
+        if weights is None or not isinstance(weights, (list, tuple)):
+            weights = [weights] * len(supports)
+        distinct_weights = list({w: None for w in weights if w is not None})
+        weight_indices = [len(supports) + distinct_weights.index(w) if w is not None else None for w in weights]
+
+        n, k = self.sample_count, len(supports)
+        sums = numpy.zeros(k)
+        products = numpy.zeros((k, k)) if covariance else numpy.zeros(k)
+        for start in range(0, n, self.block_size):
+            block = self.samples[start:start + self.block_size]
+            results = evaluate_many(self.domain, supports + distinct_weights, block)
+            values = numpy.zeros((block.shape[0], k))
+            for i in range(k):
+                if weight_indices[i] is None:
+                    values[:, i] = results[i]
                 else:
-                    results.append(None)
+                    # Only accepted samples are weighted (weights may be undefined outside of the support)
+                    values[:, i] = numpy.where(results[i], results[weight_indices[i]], 0.0)
+            sums += numpy.sum(values, axis=0)
+            products += values.T @ values if covariance else numpy.sum(values * values, axis=0)
+
+        bound_volume = get_bound_volume(self.domain)
+        means = sums / n
+        second_moments = products / n
+        if covariance:
+            covariances = (second_moments - numpy.outer(means, means)) * n / (n - 1)
+            variances = numpy.diag(covariances)
+        else:
+            variances = (second_moments - means ** 2) * n / (n - 1)
+        estimates = [Estimate(float(bound_volume * mean), bound_volume * math.sqrt(max(variance, 0.0) / n), n)
+                     for mean, variance in zip(means, variances)]
+        if covariance:
+            return estimates, bound_volume ** 2 * covariances / n
+        return estimates
+
 
-        return results
+def _statistics_task(argument):
+    domain_state, support, weight, queries, size, child_seed, ohe_variables, exactly_k = argument
+    engine = RejectionEngine(Domain.from_state(domain_state), nested_to_smt(support),
+                             nested_to_smt(weight) if weight is not None else None, size, seed=child_seed)
+    statistics = SampleStatistics([nested_to_smt(query) for query in queries])
+    # Shards are processed in blocks to bound the memory used by the samples
+    for start in range(0, size, TASK_SIZE):
+        statistics.merge(engine.draw_statistics(min(TASK_SIZE, size - start), statistics.queries, ohe_variables,
+                                                exactly_k))
+    return statistics.get_state()
 
 
 class RejectionIntegrator(ConvexIntegrationBackend):
-    def __init__(self, sample_count, bounding_box=False, seed=None):
+    def __init__(self, sample_count, bounding_box=False, seed=None, sampling="random"):
         super().__init__(False)
         self.sample_count = sample_count
         self.bounding_box = bounding_box
         self.seed = seed
-        self.rand_gen = numpy.random.RandomState(self.seed)
+        self.sampling = sampling
+        self.rand_gen = make_rand_gen(self.seed)
 
     def integrate(self, domain, convex_bounds: List[LinearInequality], polynomial: Polynomial):
         formula = smt.And(*[i.to_smt() for i in convex_bounds])
@@ -125,7 +685,7 @@ class RejectionIntegrator(ConvexIntegrationBackend):
                     c[j] = 0
                     lb_ub_bounds[domain.real_vars[j]] = (lb, ub)
             elif self.bounding_box == 2:
-                samples = uniform(domain, self.sample_count, rand_gen=self.rand_gen)
+                samples = uniform(domain, self.sample_count, rand_gen=self.rand_gen, sampling=self.sampling)
                 labels = evaluate(domain, formula, samples)
                 samples = samples[labels == 1]
 
@@ -142,7 +702,8 @@ class RejectionIntegrator(ConvexIntegrationBackend):
                 raise ValueError("Illegal bounding box value {}".format(self.bounding_box))
             domain = Domain(domain.variables, domain.var_types, lb_ub_bounds)
 
-        engine = RejectionEngine(domain, formula, polynomial.to_smt(), self.sample_count, seed=self.seed)
+        engine = RejectionEngine(domain, formula, polynomial.to_smt(), self.sample_count, seed=self.seed,
+                                 sampling=self.sampling)
         result = engine.compute_volume()
         if self.bounding_box:
             result = result
@@ -150,4 +711,5 @@ class RejectionIntegrator(ConvexIntegrationBackend):
 
     def __str__(self):
         return "ref_int.{}".format(self.sample_count)\
-               + (".{}".format(self.bounding_box) if self.bounding_box > 0 else "")
+               + (".{}".format(self.bounding_box) if self.bounding_box > 0 else "")\
+               + (".{}".format(self.sampling) if self.sampling != "random" else "")
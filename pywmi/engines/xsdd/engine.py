@@ -33,7 +33,9 @@ from .literals import extract_and_replace_literals, LiteralInfo
 from .piecewise import split_up_function
 from .smt_to_sdd import compile_to_sdd
 from .draw import sdd_to_dot_file
+from .sampling import Circuit, CircuitSampler
 from pywmi.engines.xsdd.vtrees.vtree import Vtree
+from pywmi.rng import DEF_RNG
 from ...install import check_installation_psi
 
 IntegratorAndAlgebra = Union[AlgebraBackend, IntegrationBackend]
@@ -114,6 +116,20 @@ class NonConvexWMISemiring(Semiring):
         raise NotImplementedError()
 
 
+class SmoothWMISemiring(NonConvexWMISemiring):
+    """
+    NonConvexWMISemiring that smooths sums over Boolean variables: a child that does not mention a Boolean variable
+    that another child mentions holds for both of its values, so the expression of every node (together with the
+    Boolean variables it mentions) is its exact (unintegrated) mass
+    """
+
+    def plus(self, a, b, index=None):
+        two = self.algebra.real(2)
+        a_expression = self.algebra.times(a[0], self.algebra.power(two, len(b[1] - a[1])))
+        b_expression = self.algebra.times(b[0], self.algebra.power(two, len(a[1] - b[1])))
+        return self.algebra.plus(a_expression, b_expression), a[1] | b[1]
+
+
 class BaseXsddEngine(Engine):
     def __init__(
         self,
@@ -146,9 +162,77 @@ class BaseXsddEngine(Engine):
         self.ordered = ordered
         self.vtree_strategy = vtree_strategy
         self.minimize = minimize  # Use SDD minimization as implemented in PySDD
-
-    def get_samples(self, n):
-        raise NotImplementedError()
+        self._bounded = None
+        self._sampler = None
+
+    def get_bounded(self):
+        """
+        :return: The engine with the bounds of the domain added to the support (reused between calls)
+        """
+        if self._bounded is None:
+            self._bounded = self.with_constraint(self.domain.get_bounds())
+        return self._bounded
+
+    def get_circuits(self):
+        """
+        Compiles every piece of the (piecewise polynomial) weight together with the support into an SDD and computes
+        the results of the sampling semiring for all SDD nodes (see get_node_results)
+        :return List[Circuit]: The compiled pieces
+        """
+        base_support = self.support
+        if self.find_conflicts:
+            base_support = smt.And(*self.collect_conflicts()) & base_support
+        piecewise_function = split_up_function(self.weight, PolynomialAlgebra(), get_env())
+        circuits = []
+        for w_weight, w_support in piecewise_function.pieces.items():
+            support = w_support & base_support
+            _, logic_support, literals = extract_and_replace_literals(support)
+            support_sdd = self.get_sdd(logic_support, literals, self.get_vtree(support, literals))
+            circuits.append(Circuit(support_sdd, literals, w_weight, self.get_node_results(literals, support_sdd)))
+        return circuits
+
+    def get_node_results(self, literals: LiteralInfo, support_sdd):
+        """
+        :return: The (smoothed) expression and Boolean variables of every SDD node (see SmoothWMISemiring)
+        """
+        _, cache = amc(SmoothWMISemiring(self.algebra, literals), support_sdd, return_cache=True)
+        return cache
+
+    def get_state_mass(self, circuit: Circuit, literals, pending):
+        """
+        Computes the mass of a partial path through the SDD of a circuit: the integral of the weight over the
+        conjunction of the chosen literals and the pending SDD nodes (summed over the Boolean variables that they leave
+        unassigned)
+        :param Circuit circuit: The circuit
+        :param Tuple[int] literals: The SDD literals that have been chosen
+        :param Tuple[SddNode] pending: The SDD nodes that still need to be satisfied
+        :return float: The mass
+        """
+        algebra = self.algebra
+        semiring = NonConvexWMISemiring(algebra, circuit.literals)
+        expression = circuit.polynomial.to_expression(algebra)
+        variables = set()
+        for factor, factor_variables in chain((semiring.weight(l) for l in literals),
+                                              (circuit.results[node] for node in pending)):
+            expression = algebra.times(expression, factor)
+            variables |= factor_variables
+        volume = algebra.to_float(algebra.integrate(self.domain, expression, self.domain.real_vars))
+        return volume * 2 ** (len(self.domain.bool_vars) - len(variables))
+
+    def get_samples(self, n, rand_gen=DEF_RNG):
+        """
+        Draws exact i.i.d. samples from the normalized density by sampling top-down through the compiled SDDs: the
+        elements of every decision node are chosen proportionally to their mass given the choices made so far (see
+        get_state_mass), using the per-node results that are computed once per engine, and the real variables are then
+        sampled within the convex region of the chosen literals (see CircuitSampler)
+        :param int n: The number of samples
+        :param rand_gen: The random generator
+        :return np.ndarray: The samples
+        """
+        engine = self.get_bounded()
+        if engine._sampler is None:
+            engine._sampler = CircuitSampler(self.domain, engine.get_circuits(), engine.get_state_mass)
+        return engine._sampler.sample(n, rand_gen)
 
     def collect_conflicts(self):
         conflicts = []
@@ -292,7 +376,7 @@ class XsddEngine(BaseXsddEngine):
             domain,
             support,
             weight,
-            self.backend.exact,
+            self.backend.exact if self.backend else self.algebra.exact,
             convex_backend=self.backend,
             **kwargs,
         )
@@ -347,6 +431,28 @@ class XsddEngine(BaseXsddEngine):
                     volume = self.algebra.plus(volume, self.algebra.real(vol))
         return volume
 
+    def get_node_results(self, literals: LiteralInfo, support_sdd):
+        if not self.backend:
+            return super().get_node_results(literals, support_sdd)
+        # The convex regions (and Boolean variables) of every node, as enumerated to compute the volume
+        _, cache = amc(ConvexWMISemiring(literals), support_sdd, return_cache=True)
+        return cache
+
+    def get_state_mass(self, circuit: Circuit, literals, pending):
+        if not self.backend:
+            return super().get_state_mass(circuit, literals, pending)
+        semiring = ConvexWMISemiring(circuit.literals)
+        regions = semiring.times_neutral()
+        for factor in chain((semiring.weight(l) for l in literals), (circuit.results[node] for node in pending)):
+            regions = semiring.times(regions, factor)
+        weight = circuit.polynomial.to_smt()
+        mass = 0
+        for convex_support, variables in regions:
+            if not convex_support.is_false():
+                missing_variable_count = len(self.domain.bool_vars) - len(variables)
+                mass += self.integrate_convex(convex_support, weight) * 2 ** missing_variable_count
+        return mass
+
     def integrate_convex(self, convex_support, polynomial_weight):
         try:
             domain = Domain(
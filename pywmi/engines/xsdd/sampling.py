@@ -0,0 +1,200 @@
+from typing import Callable, Dict, List, Tuple
+
+import numpy as np
+import pysmt.shortcuts as smt
+import scipy.optimize
+from pysmt.fnode import FNode
+
+from pywmi import Domain, evaluate
+from pywmi.smt_math import Polynomial, BoundsWalker
+from .literals import LiteralInfo
+
+MAX_BATCH_SIZE = 2 ** 18  # The maximal number of candidates drawn at once when sampling from a region
+
+
+class ConvexRegion:
+    """
+    A convex region of the support (a conjunction of linear inequalities and a partial assignment to the Boolean
+    variables), together with the polynomial weight that holds within the region
+    """
+
+    def __init__(self, support: FNode, polynomial: Polynomial, assignment: Dict[str, bool]):
+        self.support = support
+        self.polynomial = polynomial
+        self.assignment = assignment
+        self._box = None
+        self._weight_bound = None
+
+    def get_box(self, domain: Domain) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        :return: The lower and upper bounds of the real variables within the region (computed using linear programs)
+        """
+        if self._box is None:
+            lower = np.array([domain.var_domains[v][0] for v in domain.real_vars], dtype=float)
+            upper = np.array([domain.var_domains[v][1] for v in domain.real_vars], dtype=float)
+            inequalities = BoundsWalker.get_inequalities(self.support) if not self.support.is_true() else []
+            if len(inequalities) > 0:
+                a_matrix = np.array([[i.a(v) for v in domain.real_vars] for i in inequalities], dtype=float)
+                b_vector = np.array([i.b() for i in inequalities], dtype=float)
+                bounds = list(zip(lower, upper))
+                c = np.zeros(len(domain.real_vars))
+                for j in range(len(domain.real_vars)):
+                    c[j] = 1
+                    for sign, target in ((1, lower), (-1, upper)):
+                        result = scipy.optimize.linprog(sign * c, a_matrix, b_vector, bounds=bounds)
+                        if result.status == 0:
+                            target[j] = result.x[j]
+                    c[j] = 0
+            self._box = lower, upper
+        return self._box
+
+    def get_weight_bound(self, domain: Domain) -> float:
+        """
+        :return: An upper bound on the absolute value of the polynomial within the bounding box of the region
+        """
+        if self._weight_bound is None:
+            lower, upper = self.get_box(domain)
+            exponents, coefficients = self.polynomial.to_exponent_matrix(domain.real_vars)
+            magnitude = np.maximum(np.abs(lower), np.abs(upper))
+            self._weight_bound = float(np.sum(np.abs(coefficients) * np.prod(magnitude ** exponents, axis=1)))
+        return self._weight_bound
+
+    def sample(self, domain: Domain, n: int, rand_gen=np.random) -> np.ndarray:
+        """
+        Draws samples from the region, proportionally to the polynomial weight, using rejection sampling from the
+        bounding box of the region (candidates are drawn in vectorized batches)
+        :return: The samples (one row per sample)
+        """
+        real_indices = [domain.variables.index(v) for v in domain.real_vars]
+        lower, upper = self.get_box(domain)
+        constant = len(self.polynomial.poly_dict) <= 1 and all(len(k) == 0 for k in self.polynomial.poly_dict)
+        weight = self.polynomial.to_smt() if not constant else None
+        weight_bound = self.get_weight_bound(domain) if not constant else None
+
+        samples = np.empty((n, len(domain.variables)))
+        filled, drawn, accepted = 0, 0, 0
+        while filled < n:
+            rate = (accepted + 1) / (drawn + 1)
+            batch_size = int(min(max((n - filled) / rate * 1.2, 64), MAX_BATCH_SIZE))
+            candidates = (rand_gen.random((batch_size, len(domain.variables))) < 0.5).astype(float)
+            for var, value in self.assignment.items():
+                candidates[:, domain.variables.index(var)] = value
+            candidates[:, real_indices] = lower + rand_gen.random((batch_size, len(real_indices))) * (upper - lower)
+
+            keep = np.broadcast_to(evaluate(domain, self.support, candidates), (batch_size,))
+            if weight is not None:
+                weights = evaluate(domain, weight, candidates)
+                keep = keep & (rand_gen.random(batch_size) * weight_bound < weights)
+            selected = candidates[keep][:n - filled]
+            samples[filled:filled + len(selected)] = selected
+            filled += len(selected)
+            drawn += batch_size
+            accepted += np.count_nonzero(keep)
+        return samples
+
+
+class Circuit:
+    """
+    A piece of the support compiled into an SDD, together with the polynomial weight of the piece and the results of a
+    semiring for every SDD node (computed once and reused by all samples)
+    """
+
+    def __init__(self, root, literals: LiteralInfo, polynomial: Polynomial, results: Dict):
+        self.root = root
+        self.manager = root.manager  # Keeps the SDD manager alive as long as its nodes are used
+        self.literals = literals
+        self.polynomial = polynomial
+        self.results = results
+
+
+class CircuitSampler:
+    """
+    Draws samples from the density of compiled circuits by sampling top-down through their SDDs. A state is a partial
+    path: the SDD literals chosen so far and the SDD nodes that still need to be satisfied. The first pending node of a
+    state is expanded (literals are chosen, decision nodes are replaced by the prime and sub of one of their elements)
+    and the samples of a state are split over its elements (multinomially) proportionally to the masses of the
+    resulting states, so all samples that share a partial path are handled in one batch. Every complete path is a
+    convex region (and a partial Boolean assignment) that its samples are drawn from (see ConvexRegion).
+    """
+
+    def __init__(self, domain: Domain, circuits: List[Circuit], get_state_mass: Callable):
+        """
+        :param Domain domain: The domain
+        :param List[Circuit] circuits: The compiled pieces of the support
+        :param get_state_mass: A function that computes the mass of a state given the circuit, the chosen literals and
+        the pending nodes
+        """
+        self.domain = domain
+        self.circuits = circuits
+        self.get_state_mass = get_state_mass
+        self.masses = dict()  # (circuit index, literals, pending node ids) => mass, reused between calls
+        self.regions = dict()  # (circuit index, literals) => ConvexRegion
+
+    def get_mass(self, index, literals, pending):
+        key = (index, literals, tuple(node.id for node in pending))
+        if key not in self.masses:
+            self.masses[key] = max(self.get_state_mass(self.circuits[index], literals, pending), 0)
+        return self.masses[key]
+
+    def sample_paths(self, index, n, rand_gen):
+        """
+        :return List[Tuple[Tuple[int], int]]: The complete paths through the SDD of the index-th circuit (the chosen
+        SDD literals) and the number of samples that chose every path
+        """
+        paths = []
+        states = [((), (self.circuits[index].root,), n)]
+        while len(states) > 0:
+            literals, pending, count = states.pop()
+            if len(pending) == 0:
+                paths.append((literals, count))
+                continue
+            node, rest = pending[0], pending[1:]
+            if node.is_true():
+                states.append((literals, rest, count))
+            elif node.is_literal():
+                states.append((literals + (node.literal,), rest, count))
+            elif node.is_decision():
+                options = [(prime, sub) + rest for prime, sub in node.elements() if not prime.is_false()
+                           and not sub.is_false()]
+                masses = np.array([self.get_mass(index, literals, option) for option in options])
+                if np.sum(masses) <= 0:
+                    raise ValueError("Cannot sample from a state with zero mass")
+                for option, option_count in zip(options, rand_gen.multinomial(count, masses / np.sum(masses))):
+                    if option_count > 0:
+                        states.append((literals, option, option_count))
+            else:
+                raise ValueError("Cannot sample from an unsatisfiable node")
+        return paths
+
+    def get_region(self, index, literals):
+        """
+        :return ConvexRegion: The convex region (and Boolean assignment) of a complete path
+        """
+        if (index, literals) not in self.regions:
+            circuit = self.circuits[index]
+            inequalities, assignment = [], dict()
+            for literal in literals:
+                abstraction = circuit.literals[circuit.literals.inv_numbered[abs(literal)]]
+                if isinstance(abstraction, str):
+                    assignment[abstraction] = literal > 0
+                else:
+                    inequalities.append(abstraction if literal > 0 else ~abstraction)
+            self.regions[(index, literals)] = ConvexRegion(smt.And(*inequalities), circuit.polynomial, assignment)
+        return self.regions[(index, literals)]
+
+    def sample(self, n: int, rand_gen=np.random) -> np.ndarray:
+        """
+        Draws i.i.d. samples: circuits are chosen proportionally to their mass, then paths through their SDDs (see
+        sample_paths) and finally samples within the convex regions of the paths
+        :return: The samples (one row per sample)
+        """
+        masses = np.array([self.get_mass(i, (), (circuit.root,)) for i, circuit in enumerate(self.circuits)])
+        if len(masses) == 0 or np.sum(masses) <= 0:
+            raise ValueError("Cannot sample from a density with zero mass")
+        samples = []
+        for index, count in enumerate(rand_gen.multinomial(n, masses / np.sum(masses))):
+            if count > 0:
+                for literals, path_count in self.sample_paths(index, count, rand_gen):
+                    samples.append(self.get_region(index, literals).sample(self.domain, path_count, rand_gen))
+        samples = np.concatenate(samples) if len(samples) > 0 else np.empty((0, len(self.domain.variables)))
+        return samples[rand_gen.permutation(n)]
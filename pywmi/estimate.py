@@ -0,0 +1,186 @@
+import math
+
+import numpy as np
+from scipy import stats
+
+from pywmi.export import Exportable
+from pywmi.parse import smt_to_nested, nested_to_smt
+
+
+class Estimate(object):
+    """
+    A Monte Carlo estimate (e.g., of a weighted model integral) together with its standard error. If the estimate is
+    the mean of independent replicates (e.g., randomized quasi-Monte Carlo), the standard error is computed from the
+    replicates and confidence intervals use Student's t-distribution.
+    """
+
+    def __init__(self, value, std_error, sample_count, replicates=1):
+        """
+        :param float value: The estimated value
+        :param float std_error: The (estimated) standard error of the value
+        :param int sample_count: The total number of samples used
+        :param int replicates: The number of independent replicates the value averages (1 if the samples are i.i.d.)
+        """
+        self.value = value
+        self.std_error = std_error
+        self.sample_count = sample_count
+        self.replicates = replicates
+
+    def interval(self, confidence=0.95):
+        """
+        :param float confidence: The confidence level
+        :return Tuple[float, float]: The (two-sided) confidence interval
+        """
+        half_width = self.half_width(confidence)
+        return self.value - half_width, self.value + half_width
+
+    def half_width(self, confidence=0.95):
+        """
+        :param float confidence: The confidence level
+        :return float: The half-width of the (two-sided) confidence interval
+        """
+        if self.replicates > 1:
+            quantile = stats.t.ppf((1 + confidence) / 2, self.replicates - 1)
+        else:
+            quantile = stats.norm.ppf((1 + confidence) / 2)
+        return quantile * self.std_error
+
+    @property
+    def relative_error(self):
+        return self.std_error / abs(self.value) if self.value != 0 else math.inf
+
+    def __float__(self):
+        return float(self.value)
+
+    def __repr__(self):
+        return "Estimate({} +- {}, n={}{})".format(self.value, self.std_error, self.sample_count,
+                                                  ", replicates={}".format(self.replicates)
+                                                  if self.replicates > 1 else "")
+
+
+class SampleStatistics(Exportable):
+    """
+    Sufficient statistics of (rejection) sampling: the number of drawn and accepted samples and the sums of the weights
+    (and squared weights) of the accepted samples. For every query, the statistics of the samples that the query was
+    evaluated on are kept along with the sums of the weights of the samples that satisfy the query, which allows
+    queries to stop being evaluated once their estimate is sufficiently accurate (or to be added later on).
+    Statistics can be exported (see get_state) to checkpoint an estimate and resume it later.
+    """
+
+    def __init__(self, queries=()):
+        """
+        :param List[FNode] queries: The queries to keep statistics for
+        """
+        self.sample_count = 0
+        self.accepted = 0
+        self.weight_sum = 0.0
+        self.weight_square_sum = 0.0
+        self.queries = list(queries)
+        self.query_sample_counts = np.zeros(len(self.queries), dtype=int)
+        self.query_weight_sums = np.zeros(len(self.queries))
+        self.query_weight_square_sums = np.zeros(len(self.queries))
+        self.query_sums = np.zeros(len(self.queries))
+        self.query_square_sums = np.zeros(len(self.queries))
+
+    def index(self, query):
+        """
+        :return int: The index of the query (statistics for new queries are added, starting without samples)
+        """
+        if query not in self.queries:
+            self.queries.append(query)
+            self.query_sample_counts = np.append(self.query_sample_counts, 0)
+            for name in ["query_weight_sums", "query_weight_square_sums", "query_sums", "query_square_sums"]:
+                setattr(self, name, np.append(getattr(self, name), 0.0))
+        return self.queries.index(query)
+
+    def add(self, sample_count, weights, query_labels=(), queries=None):
+        """
+        Adds a batch of samples
+        :param int sample_count: The number of drawn samples
+        :param np.ndarray weights: The weights of the accepted samples
+        :param List[np.ndarray] query_labels: The labels of the (evaluated) queries on the accepted samples
+        :param List[int] queries: The indices of the evaluated queries (by default all queries)
+        """
+        weights = np.asarray(weights, dtype=float)
+        squares = weights * weights
+        weight_sum, weight_square_sum = float(np.sum(weights)), float(np.sum(squares))
+        self.sample_count += int(sample_count)
+        self.accepted += len(weights)
+        self.weight_sum += weight_sum
+        self.weight_square_sum += weight_square_sum
+
+        queries = range(len(self.query_sums)) if queries is None else queries
+        for i, labels in zip(queries, query_labels):
+            self.query_sample_counts[i] += sample_count
+            self.query_weight_sums[i] += weight_sum
+            self.query_weight_square_sums[i] += weight_square_sum
+            self.query_sums[i] += np.sum(weights[labels])
+            self.query_square_sums[i] += np.sum(squares[labels])
+
+    def merge(self, other):
+        """
+        Adds the statistics of other (independent) samples, queries are matched by their formula
+        :param SampleStatistics other: The statistics to add
+        :return SampleStatistics: These statistics
+        """
+        self.sample_count += other.sample_count
+        self.accepted += other.accepted
+        self.weight_sum += other.weight_sum
+        self.weight_square_sum += other.weight_square_sum
+        for j, query in enumerate(other.queries):
+            i = self.index(query)
+            self.query_sample_counts[i] += other.query_sample_counts[j]
+            for name in ["query_weight_sums", "query_weight_square_sums", "query_sums", "query_square_sums"]:
+                getattr(self, name)[i] += getattr(other, name)[j]
+        return self
+
+    def volume(self, bound_volume):
+        """
+        :param float bound_volume: The volume of the region the samples were drawn from
+        :return Estimate: The estimated weighted volume
+        """
+        n = self.sample_count
+        if n == 0:
+            return Estimate(math.nan, math.inf, 0)
+        mean = self.weight_sum / n
+        variance = max(self.weight_square_sum / n - mean ** 2, 0.0) * n / (n - 1) if n > 1 else math.inf
+        return Estimate(bound_volume * mean, bound_volume * math.sqrt(variance / n), n)
+
+    def probability(self, i):
+        """
+        The probability of query i is the ratio of weight sums p = sum(w * q) / sum(w), its standard error is
+        computed using the delta method: Var(p) ~ sum((w * (q - p)) ** 2) / sum(w) ** 2
+        :return Estimate: The estimated probability of query i (nan if no weight was observed)
+        """
+        total = self.query_weight_sums[i]
+        if total == 0:
+            return Estimate(math.nan, math.inf, int(self.query_sample_counts[i]))
+        p = self.query_sums[i] / total
+        residuals = (1 - 2 * p) * self.query_square_sums[i] + p ** 2 * self.query_weight_square_sums[i]
+        return Estimate(float(p), math.sqrt(max(residuals, 0.0)) / abs(total), int(self.query_sample_counts[i]))
+
+    def get_state(self):
+        return {
+            "sample_count": self.sample_count,
+            "accepted": self.accepted,
+            "weight_sum": self.weight_sum,
+            "weight_square_sum": self.weight_square_sum,
+            "queries": [smt_to_nested(query) for query in self.queries],
+            "query_sample_counts": self.query_sample_counts.tolist(),
+            "query_weight_sums": self.query_weight_sums.tolist(),
+            "query_weight_square_sums": self.query_weight_square_sums.tolist(),
+            "query_sums": self.query_sums.tolist(),
+            "query_square_sums": self.query_square_sums.tolist(),
+        }
+
+    @classmethod
+    def from_state(cls, state):
+        statistics = cls([nested_to_smt(query) for query in state["queries"]])
+        statistics.sample_count = int(state["sample_count"])
+        statistics.accepted = int(state["accepted"])
+        statistics.weight_sum = float(state["weight_sum"])
+        statistics.weight_square_sum = float(state["weight_square_sum"])
+        statistics.query_sample_counts = np.array(state["query_sample_counts"], dtype=int)
+        for name in ["query_weight_sums", "query_weight_square_sums", "query_sums", "query_square_sums"]:
+            setattr(statistics, name, np.array(state[name], dtype=float))
+        return statistics
@@ -0,0 +1,216 @@
+import numpy as np
+import pysmt.shortcuts as smt
+
+from pywmi import evaluate
+from pywmi.rng import integers, make_rand_gen, DEF_RNG
+from pywmi.smt_math import LinearInequality
+
+
+class HitAndRunSampler(object):
+    """
+    Markov chain Monte Carlo sampler for supports with a low acceptance rate under uniform rejection sampling. Every
+    step moves the real variables using hit-and-run (a uniform point on the part of a random line through the current
+    point that satisfies the support, computed analytically from the linear atoms of the support) and proposes to flip
+    a random Boolean variable (a Metropolis move that is rejected if the flipped sample violates the support). If a
+    weight is given, moves are accepted using a Metropolis correction so that the chains sample proportionally to the
+    weight. Several chains are run in parallel (vectorized), they start from a model of the support found by an SMT
+    solver.
+    """
+
+    def __init__(self, domain, support, weight=None, chains=16, burn_in=500, thinning=5, rand_gen=DEF_RNG,
+                 start=None):
+        """
+        :param Domain domain: The domain
+        :param FNode support: The support (a Boolean combination of Boolean variables and linear real atoms)
+        :param FNode weight: The (non-negative) weight to sample proportionally to (None for uniform sampling)
+        :param int chains: The number of chains
+        :param int burn_in: The number of steps per chain that are discarded before samples are collected
+        :param int thinning: The number of steps per chain between collected samples
+        :param rand_gen: The random generator or a seed (see pywmi.rng.make_rand_gen)
+        :param np.ndarray start: The initial sample (by default a model of the support)
+        """
+        self.domain = domain
+        self.support = support
+        self.weight = weight
+        self.chains = chains
+        self.burn_in = burn_in
+        self.thinning = max(1, thinning)
+        self.rand_gen = make_rand_gen(rand_gen)
+
+        self.real_indices = np.array([domain.variables.index(v) for v in domain.real_vars], dtype=int)
+        self.bool_indices = np.array([domain.variables.index(v) for v in domain.bool_vars], dtype=int)
+        self.lower = np.array([domain.var_domains[v][0] for v in domain.real_vars], dtype=float)
+        self.upper = np.array([domain.var_domains[v][1] for v in domain.real_vars], dtype=float)
+        self.coefficients, self.constants = self.linear_atoms()
+
+        start = self.find_start() if start is None else np.asarray(start, dtype=float)
+        self.state = np.tile(start, (chains, 1))
+        self.state_weights = self.get_weights(self.state)
+        self.steps = 0
+        self.proposed = 0
+        self.accepted = 0
+        self.trace = None
+
+    def linear_atoms(self):
+        """
+        :return Tuple[np.ndarray, np.ndarray]: The coefficients (one row per atom) and constants of the real atoms of
+        the support, atom i holds where coefficients[i] * x + constants[i] <= 0 (or < 0, = 0)
+        """
+        real_vars = self.domain.real_vars
+        coefficients, constants = [], []
+        for atom in self.support.get_atoms():
+            if atom.is_symbol() or not any(v.symbol_type() == smt.REAL for v in atom.get_free_variables()):
+                continue
+            try:
+                inequality = LinearInequality.from_smt(atom)
+            except ValueError:
+                raise ValueError("Hit-and-run sampling requires linear real atoms, found {}".format(atom))
+            coefficients.append([inequality.a(v) for v in real_vars])
+            constants.append(-inequality.b())
+        return np.array(coefficients, dtype=float).reshape(-1, len(real_vars)), np.array(constants, dtype=float)
+
+    def find_start(self):
+        model = smt.get_model(smt.And(self.support, self.domain.get_bounds()))
+        if model is None:
+            raise ValueError("The support is unsatisfiable within the bounds of the domain")
+        return np.array([float(model.get_py_value(self.domain.get_symbol(v))) for v in self.domain.variables])
+
+    def get_weights(self, samples):
+        if self.weight is None:
+            return np.ones(len(samples))
+        return evaluate(self.domain, self.weight, samples)
+
+    def metropolis(self, chains, proposals):
+        """
+        Moves the given chains to their proposals, subject to Metropolis acceptance if a weight is given
+        :param np.ndarray chains: The indices of the chains that propose a move
+        :param np.ndarray proposals: The proposed samples (satisfying the support, one per chain)
+        """
+        proposal_weights = self.get_weights(proposals)
+        if self.weight is None:
+            accept = np.ones(len(chains), dtype=bool)
+        else:
+            current = self.state_weights[chains]
+            ratio = np.divide(proposal_weights, current, out=np.ones_like(current), where=current > 0)
+            accept = self.rand_gen.random(len(chains)) < ratio
+        self.state[chains[accept]] = proposals[accept]
+        self.state_weights[chains[accept]] = proposal_weights[accept]
+        self.proposed += len(chains)
+        self.accepted += np.count_nonzero(accept)
+
+    def hit_and_run(self):
+        dimension = len(self.real_indices)
+        x = self.state[:, self.real_indices]
+        direction = self.rand_gen.standard_normal((self.chains, dimension))
+        direction /= np.maximum(np.linalg.norm(direction, axis=1, keepdims=True), 1e-300)
+
+        # The line x + t * direction leaves the bounds of the domain at t_min and t_max
+        with np.errstate(divide="ignore", invalid="ignore"):
+            to_lower = (self.lower - x) / direction
+            to_upper = (self.upper - x) / direction
+        t_min = np.max(np.where(direction != 0, np.minimum(to_lower, to_upper), -np.inf), axis=1)
+        t_max = np.min(np.where(direction != 0, np.maximum(to_lower, to_upper), np.inf), axis=1)
+
+        # Every atom changes its truth value at most once along the line, the support is constant in between
+        slopes = direction @ self.coefficients.T
+        offsets = x @ self.coefficients.T + self.constants
+        with np.errstate(divide="ignore", invalid="ignore"):
+            crossings = np.where(slopes != 0, -offsets / slopes, t_max[:, np.newaxis])
+        crossings = np.clip(crossings, t_min[:, np.newaxis], t_max[:, np.newaxis])
+        points = np.sort(np.concatenate([t_min[:, np.newaxis], crossings, t_max[:, np.newaxis]], axis=1), axis=1)
+        lengths = np.diff(points, axis=1)
+        middles = (points[:, :-1] + points[:, 1:]) / 2
+
+        candidates = np.repeat(self.state, middles.shape[1], axis=0)
+        candidates[:, self.real_indices] = \
+            (x[:, np.newaxis, :] + middles[:, :, np.newaxis] * direction[:, np.newaxis, :]).reshape(-1, dimension)
+        lengths = np.where(evaluate(self.domain, self.support, candidates).reshape(lengths.shape), lengths, 0)
+
+        # Draw a point uniformly from the feasible segments
+        cumulative = np.cumsum(lengths, axis=1)
+        target = self.rand_gen.random(self.chains) * cumulative[:, -1]
+        segment = np.minimum(np.sum(cumulative <= target[:, np.newaxis], axis=1), lengths.shape[1] - 1)
+        rows = np.arange(self.chains)
+        t = points[rows, segment] + target - (cumulative[rows, segment] - lengths[rows, segment])
+
+        chains = np.nonzero(cumulative[:, -1] > 0)[0]
+        proposals = self.state[chains]
+        proposals[:, self.real_indices] = x[chains] + t[chains, np.newaxis] * direction[chains]
+        self.metropolis(chains, proposals)
+
+    def flip_boolean(self):
+        # Flipping a uniformly chosen Boolean variable is a symmetric proposal, accepted or rejected by metropolis
+        rows = np.arange(self.chains)
+        flipped = self.bool_indices[integers(self.rand_gen, 0, len(self.bool_indices), self.chains)]
+        proposals = self.state.copy()
+        proposals[rows, flipped] = 1 - proposals[rows, flipped]
+        feasible = evaluate(self.domain, self.support, proposals)
+        self.metropolis(rows[feasible], proposals[feasible])
+
+    def step(self):
+        if len(self.real_indices) > 0:
+            self.hit_and_run()
+        if len(self.bool_indices) > 0:
+            self.flip_boolean()
+        self.steps += 1
+
+    def sample(self, sample_count):
+        """
+        Continues the chains (running the burn-in first, if it has not yet been run) and collects samples
+        :param int sample_count: The number of samples
+        :return np.ndarray: The samples (one row per sample, samples collected at the same step are consecutive)
+        """
+        while self.steps < self.burn_in:
+            self.step()
+        kept = -(-sample_count // self.chains)
+        trace = np.empty((kept, self.chains, len(self.domain.variables)))
+        for i in range(kept):
+            for _ in range(self.thinning):
+                self.step()
+            trace[i] = self.state
+        self.trace = trace
+        return trace.reshape(-1, len(self.domain.variables))[:sample_count]
+
+    @property
+    def acceptance_rate(self):
+        """
+        The ratio of proposed moves that were accepted (Metropolis acceptance, 1 if no weight is given)
+        """
+        return self.accepted / self.proposed if self.proposed > 0 else 0.0
+
+    def effective_sample_size(self):
+        """
+        :return Dict[str, float]: The effective sample size of every variable in the last batch of samples
+        """
+        if self.trace is None:
+            raise ValueError("No samples have been collected yet")
+        return {v: effective_sample_size(self.trace[:, :, i]) for i, v in enumerate(self.domain.variables)}
+
+
+def effective_sample_size(trace):
+    """
+    Estimates the effective sample size of (multiple) Markov chains from their autocorrelation, truncated using
+    Geyer's initial positive sequence
+    :param np.ndarray trace: The values of one variable (one row per step, one column per chain)
+    :return float: The effective sample size
+    """
+    trace = np.asarray(trace, dtype=float)
+    if trace.ndim == 1:
+        trace = trace[:, np.newaxis]
+    n, chains = trace.shape
+    centered = trace - trace.mean(axis=0)
+    transformed = np.fft.rfft(centered, n=2 * n, axis=0)
+    autocovariance = np.fft.irfft(transformed * np.conj(transformed), n=2 * n, axis=0)[:n] / n
+    within = np.mean(autocovariance[0])
+    between = np.var(trace.mean(axis=0), ddof=1) if chains > 1 else 0.0
+    variance = within * (n - 1) / n + between
+    if n < 4 or variance <= 0:
+        return float(n * chains)
+
+    correlation = 1 - (within - autocovariance.mean(axis=1)) / variance
+    correlation[0] = 1
+    pairs = correlation[:-1:2] + correlation[1::2]
+    negative = np.nonzero(pairs < 0)[0]
+    pairs = pairs[:negative[0]] if len(negative) > 0 else pairs
+    tau = max(-1 + 2 * np.sum(pairs), 1 / np.log10(n * chains))
+    return float(n * chains / tau)
@@ -0,0 +1,83 @@
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from pywmi.domain import Domain
+from pywmi.parse import smt_to_nested, nested_to_smt
+from pywmi.rng import spawn, make_rand_gen
+from pywmi.sample import uniform, PositiveStream, SamplingError, _concatenate
+
+TASK_SIZE = 100000  # The default number of samples generated per task
+
+
+def _tasks(sample_count, task_size, seed):
+    sizes = [task_size] * (sample_count // task_size)
+    if sample_count % task_size > 0:
+        sizes.append(sample_count % task_size)
+    return list(zip(sizes, spawn(seed, len(sizes))))
+
+
+def _run(worker, arguments, processes, executor=None):
+    # An executor that is passed in (e.g., the pool of an engine) is reused rather than started and shut down per call
+    if processes == 1 or len(arguments) <= 1:
+        return [worker(argument) for argument in arguments]
+    if executor is not None:
+        return list(executor.map(worker, arguments))
+    with ProcessPoolExecutor(max_workers=processes) as executor:
+        return list(executor.map(worker, arguments))  # Results are returned in the order of the tasks
+
+
+def _uniform_task(argument):
+    domain_state, size, child_seed, options = argument
+    return uniform(Domain.from_state(domain_state), size, rand_gen=make_rand_gen(child_seed), **options)
+
+
+def _positive_task(argument):
+    domain_state, support, size, child_seed, max_samples, options = argument
+    stream = PositiveStream(Domain.from_state(domain_state), nested_to_smt(support), chunk_size=size,
+                            rand_gen=make_rand_gen(child_seed), max_positive=size, max_samples=max_samples, **options)
+    chunks = list(stream)
+    return chunks[0] if chunks else None, stream.accepted, stream.drawn
+
+
+def parallel_uniform(domain, sample_count, seed=None, processes=None, task_size=TASK_SIZE, **options):
+    """
+    Draws uniform samples using a pool of processes. The samples are split into tasks of task_size samples, the i-th
+    task uses the i-th child stream spawned from the seed and the results are concatenated in task order, therefore
+    the samples only depend on the seed and the task size (not on the number of processes).
+    :param Domain domain: The domain to sample from
+    :param int sample_count: The number of samples
+    :param seed: An integer seed or a SeedSequence (see pywmi.rng.spawn)
+    :param int processes: The number of processes (None for one per CPU, 1 to sample in the current process)
+    :param int task_size: The number of samples per task
+    :param options: Further options for uniform (e.g., sampling, compact or ohe_variables)
+    :return: The samples
+    """
+    arguments = [(domain.get_state(), size, child_seed, options)
+                 for size, child_seed in _tasks(sample_count, task_size, seed)]
+    if len(arguments) == 0:
+        return uniform(domain, 0, **options)
+    return _concatenate(_run(_uniform_task, arguments, processes))
+
+
+def parallel_positive(domain, support, sample_count, seed=None, processes=None, task_size=TASK_SIZE,
+                      max_samples=None, **options):
+    """
+    Draws samples that satisfy the support using a pool of processes (see parallel_uniform), every task yields
+    task_size positive samples using a PositiveStream with its own child stream.
+    :param max_samples: The maximal number of uniform samples drawn per task (None for no limit), if a task exceeds
+    this budget a SamplingError is raised
+    :param options: Further options for PositiveStream (e.g., sampling, compact or batch sizes)
+    :return Tuple[np.ndarray, float]: The positive samples and the ratio of accepted samples
+    """
+    support = smt_to_nested(support)
+    arguments = [(domain.get_state(), support, size, child_seed, max_samples, options)
+                 for size, child_seed in _tasks(sample_count, task_size, seed)]
+    results = _run(_positive_task, arguments, processes)
+    if any(samples is None or len(samples) < size for (samples, _, _), (_, _, size, *_) in zip(results, arguments)):
+        raise SamplingError("Max sample count {} exceeded for a task".format(max_samples))
+    accepted = sum(result[1] for result in results)
+    drawn = sum(result[2] for result in results)
+    samples = _concatenate([result[0] for result in results]) if results \
+        else uniform(domain, 0, compact=options.get("compact", False))
+    return samples, accepted / drawn if drawn > 0 else np.nan
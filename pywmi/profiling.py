@@ -0,0 +1,119 @@
+import json
+import threading
+from collections import defaultdict
+
+import numpy as np
+from pysmt.operators import op_to_str
+from tabulate import tabulate
+
+
+class EvaluationProfile(object):
+    """
+    Collects per-node counters while formulas are evaluated on batches of samples: the number of times a node was
+    computed, the number of samples it was computed on, the time spent on the node itself (excluding its children) and
+    the number of bytes allocated for its results (and for the temporary arrays of compiled operations). Measurements
+    are taken once per node and batch (not per sample), so profiling adds little overhead to batch evaluation.
+    Profiles can be shared between threads.
+    """
+
+    def __init__(self):
+        self.entries = defaultdict(lambda: [0, 0, 0.0, 0])  # key => [calls, samples, seconds, bytes]
+        self._lock = threading.Lock()
+
+    def record(self, key, samples, seconds, allocated):
+        """
+        :param key: The node (FNode) or the name of an operation that does not correspond to a single node
+        :param int samples: The number of samples the node was computed on
+        :param float seconds: The time spent computing the node (excluding its children)
+        :param int allocated: The number of bytes allocated for the result and temporary arrays
+        """
+        with self._lock:
+            entry = self.entries[key]
+            entry[0] += 1
+            entry[1] += samples
+            entry[2] += seconds
+            entry[3] += allocated
+
+    def merge(self, other):
+        """
+        Adds the counters of another profile to this profile
+        :param EvaluationProfile other: The profile to merge
+        """
+        with self._lock:
+            for key, (calls, samples, seconds, allocated) in other.entries.items():
+                entry = self.entries[key]
+                entry[0] += calls
+                entry[1] += samples
+                entry[2] += seconds
+                entry[3] += allocated
+
+    def clear(self):
+        with self._lock:
+            self.entries.clear()
+
+    @property
+    def total_seconds(self):
+        return sum(entry[2] for entry in self.entries.values())
+
+    def ranked(self):
+        """
+        :return List[dict]: One dictionary per node (most time consuming first)
+        """
+        rows = []
+        for key, (calls, samples, seconds, allocated) in self.entries.items():
+            rows.append({
+                "node": _describe(key),
+                "type": _node_type(key),
+                "calls": calls,
+                "samples": samples,
+                "seconds": seconds,
+                "bytes": allocated,
+            })
+        return sorted(rows, key=lambda row: row["seconds"], reverse=True)
+
+    def report(self, limit=20, width=60):
+        """
+        :param int limit: The maximal number of nodes to report (None for all nodes)
+        :param int width: The maximal length of the node descriptions
+        :return str: A table of the most time consuming nodes
+        """
+        total = self.total_seconds
+        rows = []
+        for row in self.ranked()[:limit]:
+            node = row["node"] if len(row["node"]) <= width else row["node"][:width - 3] + "..."
+            share = row["seconds"] / total if total > 0 else 0
+            rows.append([node, row["type"], row["calls"], row["samples"], "{:.6f}".format(row["seconds"]),
+                         "{:.1%}".format(share), row["bytes"]])
+        return tabulate(rows, headers=["node", "type", "calls", "samples", "seconds", "time", "bytes"])
+
+    def to_json(self):
+        """
+        :return str: The profile as JSON (a list of nodes, most time consuming first)
+        """
+        return json.dumps(self.ranked(), indent=2)
+
+    def dump(self, filename):
+        with open(filename, "w") as ref:
+            ref.write(self.to_json())
+
+    def __repr__(self):
+        return self.report()
+
+
+def allocated_bytes(result):
+    """
+    :return int: The number of bytes newly allocated for the given result (views and scalars allocate nothing)
+    """
+    if isinstance(result, np.ndarray) and result.base is None:
+        return result.nbytes
+    return 0
+
+
+def _describe(key):
+    return key if isinstance(key, str) else key.serialize()
+
+
+def _node_type(key):
+    if isinstance(key, str):
+        return key
+    return op_to_str(key.node_type())
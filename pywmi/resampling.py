@@ -0,0 +1,111 @@
+import numpy as np
+
+from pywmi.rng import integers
+
+SCHEMES = ("multinomial", "systematic", "stratified", "alias")
+
+
+def _normalized_cumsum(weights):
+    weights = np.asarray(weights, dtype=float)
+    if weights.ndim != 1 or len(weights) == 0:
+        raise ValueError("Expected a non-empty vector of weights")
+    if np.any(weights < 0) or not np.all(np.isfinite(weights)):
+        raise ValueError("Weights have to be finite and non-negative")
+    cumulative = np.cumsum(weights)
+    if cumulative[-1] <= 0:
+        raise ValueError("The total weight has to be positive")
+    return cumulative / cumulative[-1]
+
+
+def _select(cumulative, points):
+    # Points lie in [0, 1), searchsorted (right) never selects elements of weight zero
+    return np.minimum(np.searchsorted(cumulative, points, side="right"), len(cumulative) - 1)
+
+
+def multinomial(weights, n, rand_gen=np.random):
+    """
+    Draws n indices independently, every index with a probability proportional to its weight
+    :param weights: The (non-negative) weights
+    :param int n: The number of indices to draw
+    :param rand_gen: The random generator
+    :return np.ndarray: The drawn indices
+    """
+    return _select(_normalized_cumsum(weights), rand_gen.random(n))
+
+
+def systematic(weights, n, rand_gen=np.random):
+    """
+    Draws n indices using a single uniform offset and n evenly spaced points (lowest variance, but the draws are
+    not independent)
+    """
+    return _select(_normalized_cumsum(weights), (np.arange(n) + rand_gen.random()) / n)
+
+
+def stratified(weights, n, rand_gen=np.random):
+    """
+    Draws n indices using one uniform point in every one of n equally sized strata
+    """
+    return _select(_normalized_cumsum(weights), (np.arange(n) + rand_gen.random(n)) / n)
+
+
+class AliasTable(object):
+    """
+    Walker's alias table (built using Vose's method) to draw indices proportional to weights in constant time per
+    draw. Building the table takes linear time, the table can be reused to draw repeatedly from the same pool.
+    """
+
+    def __init__(self, weights):
+        _normalized_cumsum(weights)  # Validates the weights
+        weights = np.asarray(weights, dtype=float)
+        size = len(weights)
+        scaled_array = weights * size / np.sum(weights)
+        small = np.nonzero(scaled_array < 1)[0].tolist()
+        large = np.nonzero(scaled_array >= 1)[0].tolist()
+
+        # Python lists are much faster than NumPy arrays for this element-wise loop
+        scaled = scaled_array.tolist()
+        probabilities = [1.0] * size
+        aliases = list(range(size))
+        while small and large:
+            less, more = small.pop(), large.pop()
+            probabilities[less] = scaled[less]
+            aliases[less] = more
+            scaled[more] -= 1 - scaled[less]
+            (small if scaled[more] < 1 else large).append(more)
+        self.probabilities = np.array(probabilities)
+        self.aliases = np.array(aliases)
+
+    def __len__(self):
+        return len(self.probabilities)
+
+    def draw(self, n, rand_gen=np.random):
+        """
+        :param int n: The number of indices to draw
+        :param rand_gen: The random generator
+        :return np.ndarray: The drawn (independent) indices
+        """
+        columns = integers(rand_gen, 0, len(self), n)
+        keep = rand_gen.random(n) < self.probabilities[columns]
+        return np.where(keep, columns, self.aliases[columns])
+
+
+def resample(weights, n, scheme="multinomial", rand_gen=np.random):
+    """
+    Draws n indices with probabilities proportional to the given weights
+    :param weights: The (non-negative) weights or an AliasTable (which is reused)
+    :param int n: The number of indices to draw
+    :param str scheme: One of SCHEMES ("multinomial", "systematic", "stratified" or "alias")
+    :param rand_gen: The random generator
+    :return np.ndarray: The drawn indices
+    """
+    if isinstance(weights, AliasTable):
+        return weights.draw(n, rand_gen)
+    if scheme == "multinomial":
+        return multinomial(weights, n, rand_gen)
+    elif scheme == "systematic":
+        return systematic(weights, n, rand_gen)
+    elif scheme == "stratified":
+        return stratified(weights, n, rand_gen)
+    elif scheme == "alias":
+        return AliasTable(weights).draw(n, rand_gen)
+    raise ValueError("Unknown resampling scheme {}, should be one of {}".format(scheme, SCHEMES))
@@ -0,0 +1,77 @@
+import numpy as np
+
+DEF_RNG = np.random.RandomState()  # The generator used when no generator is given
+
+
+def make_rand_gen(seed=None):
+    """
+    :param seed: None, an integer seed, a SeedSequence, a Generator or a RandomState
+    :return: A random generator, integer seeds (and None) yield a RandomState (as before), SeedSequences yield a
+    Generator and existing generators are returned unchanged
+    """
+    if isinstance(seed, (np.random.Generator, np.random.RandomState)):
+        return seed
+    if isinstance(seed, np.random.SeedSequence):
+        return np.random.Generator(np.random.PCG64(seed))
+    return np.random.RandomState(seed)
+
+
+def seed_sequence(seed=None):
+    """
+    :param seed: None, an integer seed, a SeedSequence, a Generator or a RandomState
+    :return SeedSequence: A seed sequence (derived from the state of the generator if a generator is given)
+    """
+    if isinstance(seed, np.random.SeedSequence):
+        return seed
+    if isinstance(seed, (np.random.Generator, np.random.RandomState)):
+        return np.random.SeedSequence(integers(seed, 0, 2 ** 32, 4).tolist())
+    return np.random.SeedSequence(seed)
+
+
+def spawn(seed, count):
+    """
+    Creates independent child streams, e.g., one per task of a parallel computation. The i-th child only depends on
+    the seed and i (not on the number of children that are created). Spawning repeatedly from the same SeedSequence
+    yields the same children.
+    :param seed: None, an integer seed, a SeedSequence, a Generator or a RandomState
+    :param int count: The number of children
+    :return List[SeedSequence]: The child seed sequences (use make_rand_gen to obtain their generators)
+    """
+    seed = seed_sequence(seed)
+    # Copy the sequence, SeedSequence.spawn would otherwise continue numbering children where a previous call stopped
+    parent = np.random.SeedSequence(seed.entropy, spawn_key=seed.spawn_key, pool_size=seed.pool_size)
+    return parent.spawn(count)
+
+
+def integers(rand_gen, low, high, size=None):
+    """
+    Draws integers in [low, high) from a Generator (integers) or a RandomState (randint)
+    """
+    if isinstance(rand_gen, np.random.Generator):
+        return rand_gen.integers(low, high, size)
+    return rand_gen.randint(low, high, size, dtype=np.int64)
+
+
+def get_state(rand_gen):
+    """
+    :param rand_gen: A Generator or a RandomState
+    :return dict: The state of the random generator (JSON serializable, see from_state)
+    """
+    if isinstance(rand_gen, np.random.Generator):
+        return rand_gen.bit_generator.state
+    state = rand_gen.get_state(legacy=False)
+    return dict(state, state=dict(state["state"], key=state["state"]["key"].tolist()))
+
+
+def from_state(state):
+    """
+    :param dict state: The state of a random generator (see get_state)
+    :return: A random generator (of the same type as the original generator) that continues from the given state
+    """
+    if "has_gauss" in state:
+        rand_gen = np.random.RandomState()
+        rand_gen.set_state(state)
+        return rand_gen
+    bit_generator = getattr(np.random, state["bit_generator"])()
+    bit_generator.state = state
+    return np.random.Generator(bit_generator)
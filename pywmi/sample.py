@@ -1,39 +1,166 @@
 
+import math
+import time
+import warnings
+
 import numpy as np
+from deprecated import deprecated
+from scipy.special import comb
+from scipy.stats import qmc
+
 from pywmi import Domain, evaluate
+from pywmi.compact_samples import CompactSamples
+from pywmi.mcmc import HitAndRunSampler
+from pywmi.resampling import resample
+from pywmi.rng import integers, DEF_RNG
 
 
-DEF_RNG = np.random.RandomState()
+COMPACT_BLOCK_SIZE = 65536  # Compact samples are generated in blocks of this many (dense) samples
+SAMPLING_METHODS = ("random", "sobol", "halton")
+MAX_EXACT_SUBSETS = 2 ** 52  # Subsets can be numbered exactly using floating point numbers up to this count
 
 class SamplingError(RuntimeError):
     def __init__(self, msg=""):
         self.msg = msg
 
 
-def uniform(domain: Domain, sample_count: int, ohe_variables=None, rand_gen=DEF_RNG):
-    #samples = np.random.random((sample_count, len(domain.variables)))
-    samples = rand_gen.random((sample_count, len(domain.variables)))
+def uniform(domain: Domain, sample_count: int, ohe_variables=None, rand_gen=DEF_RNG, compact=False,
+            real_dtype=np.float64, sampling="random", exactly_k=None):
+    """
+    Samples uniformly from the domain bounds
+    :param domain: The domain to sample from
+    :param sample_count: The number of samples
+    :param ohe_variables: Groups of Boolean variables of which exactly one should be true (one-hot encoded)
+    :param rand_gen: The random generator
+    :param compact: If true, the samples are stored as CompactSamples (reals stored as real_dtype, Booleans
+    bit-packed), the samples are generated in blocks and are the same as the ones of the dense layout
+    :param real_dtype: The type used to store the real values of compact samples
+    :param sampling: "random" draws pseudo-random points, "sobol" and "halton" draw scrambled low-discrepancy
+    (quasi-Monte Carlo) points whose scrambling is seeded by rand_gen
+    :param exactly_k: Pairs (variables, k) of groups of Boolean variables of which exactly k should be true
+    :return: The samples (one row per sample)
+    """
+    variable_count = len(domain.variables)
+    groups = boolean_groups(domain, ohe_variables, exactly_k)
+    # Every group uses one extra dimension whose value selects the subset of variables that are true
+    draw = unit_sampler(sampling, variable_count + len(groups), rand_gen)
+
+    parts = []
+    for start, end in (_blocks(sample_count, COMPACT_BLOCK_SIZE) if compact else [(0, sample_count)]):
+        unit = draw(end - start)
+        part = _scale_to_domain(domain, np.ascontiguousarray(unit[:, :variable_count]))
+        for g, (indices, k) in enumerate(groups):
+            part[:, indices] = choose_subsets(unit[:, variable_count + g], len(indices), k, rand_gen)
+        parts.append(CompactSamples.from_dense(domain, part, real_dtype) if compact else part)
+
+    if compact:
+        return CompactSamples.concatenate(parts) if parts \
+            else CompactSamples.from_dense(domain, np.empty((0, variable_count)), real_dtype)
+    return parts[0]
+
+
+def boolean_groups(domain, ohe_variables=None, exactly_k=None):
+    """
+    :param domain: The domain
+    :param ohe_variables: Groups of Boolean variables of which exactly one should be true
+    :param exactly_k: Pairs (variables, k) of groups of Boolean variables of which exactly k should be true
+    :return List[Tuple[List[int], int]]: The indices of the variables and the number of true variables of every group
+    """
+    groups = [(list(ohe), 1) for ohe in (ohe_variables or [])] + [(list(g), k) for g, k in (exactly_k or [])]
+    seen = set()
+    result = []
+    for variables, k in groups:
+        if any(not domain.is_bool(v) for v in variables):
+            raise ValueError("Groups can only contain Boolean variables: {}".format(variables))
+        if seen & set(variables) or len(set(variables)) != len(variables):
+            raise ValueError("Every variable can appear in at most one group: {}".format(variables))
+        if not 0 <= k <= len(variables):
+            raise ValueError("Cannot make {} of the variables {} true".format(k, variables))
+        seen |= set(variables)
+        result.append(([domain.variables.index(v) for v in variables], k))
+    return result
+
+
+def choose_subsets(unit, size, k, rand_gen=DEF_RNG):
+    """
+    Maps uniform values to uniformly distributed subsets of size k, subsets are numbered in lexicographic order
+    and the subset with rank floor(u * C(size, k)) is chosen for every value u
+    :param np.ndarray unit: Values in [0, 1)
+    :param int size: The number of elements to choose from
+    :param int k: The number of elements to choose
+    :param rand_gen: The random generator (only used if there are too many subsets to number them exactly)
+    :return np.ndarray: A Boolean matrix with one row per value, indicating the chosen elements
+    """
+    total = comb(size, k, exact=True)
+    if total > MAX_EXACT_SUBSETS:
+        ranks = np.argsort(rand_gen.random((len(unit), size)), axis=1)
+        chosen = np.zeros((len(unit), size), dtype=bool)
+        np.put_along_axis(chosen, ranks[:, :k], True, axis=1)
+        return chosen
+
+    rank = np.minimum(np.floor(unit * total), total - 1)
+    if k == 1:
+        return rank[:, np.newaxis] == np.arange(size)
+
+    # including[j, r] is the number of subsets that contain element j if r elements remain to be chosen from j onwards
+    including = np.array([[comb(size - j - 1, r - 1, exact=True) if r > 0 else 0 for r in range(k + 1)]
+                          for j in range(size)], dtype=float)
+    remaining = np.full(len(unit), k)
+    chosen = np.empty((len(unit), size), dtype=bool)
+    for j in range(size):
+        count = including[j, remaining]
+        np.less(rank, count, out=chosen[:, j])
+        rank -= np.where(chosen[:, j], 0, count)
+        remaining -= chosen[:, j]
+    return chosen
+
+
+def unit_sampler(sampling, dimension, rand_gen=DEF_RNG):
+    """
+    :param str sampling: The sampling method ("random", "sobol" or "halton")
+    :param int dimension: The number of dimensions
+    :param rand_gen: The random generator (used to seed the scrambling of quasi-Monte Carlo points)
+    :return Callable[[int], np.ndarray]: A function that draws the given number of points from the unit hypercube,
+    successive calls continue the same (low-discrepancy) sequence
+    """
+    if sampling == "random":
+        return lambda n: rand_gen.random((n, dimension))
+    if sampling not in SAMPLING_METHODS:
+        raise ValueError("Unknown sampling method {}, should be one of {}".format(sampling, SAMPLING_METHODS))
+    if dimension == 0:
+        return lambda n: np.empty((n, 0))
+
+    engine_type = qmc.Sobol if sampling == "sobol" else qmc.Halton
+    seed = int(integers(rand_gen, 0, 2 ** 31))
+    try:
+        engine = engine_type(dimension, scramble=True, rng=seed)
+    except TypeError:  # SciPy < 1.15
+        engine = engine_type(dimension, scramble=True, seed=seed)
+
+    def draw(n):
+        with warnings.catch_warnings():
+            # Sobol points are only balanced for powers of two, other sample counts are still valid
+            warnings.filterwarnings("ignore", message=".*balance properties of Sobol.*")
+            return engine.random(n)
+
+    return draw
+
+
+def _scale_to_domain(domain, samples):
     for i, var in enumerate(domain.variables):
         if domain.is_bool(var):
             samples[:, i] = samples[:, i] < 0.5
         else:
             lb, ub = domain.var_domains[var]
             samples[:, i] = lb + samples[:, i] * (ub - lb)
+    return samples
 
-    if ohe_variables is not None:
-        ohe_indexes = [[domain.variables.index(varname)
-                        for varname in ohe]
-                       for ohe in ohe_variables]
 
-        for i in range(len(samples)):
-            for ohe in ohe_indexes:
-                for x in ohe:
-                    samples[i,x] = False
-                samples[i,rand_gen.choice(ohe)] = True
-
-    return samples
+def _blocks(count, block_size):
+    return [(start, min(start + block_size, count)) for start in range(0, count, block_size)]
 
 
+@deprecated(reason="Use pywmi.resampling.resample, which draws index arrays vectorized")
 def weighted_sample(weights, values, n, rand_gen=DEF_RNG):
     # https://stackoverflow.com/a/2151885/253387
     total = float(sum(weights))
@@ -51,39 +178,154 @@ def weighted_sample(weights, values, n, rand_gen=DEF_RNG):
         n -= 1
 
 
+class PositiveStream(object):
+    """
+    Lazily generates samples that satisfy the support, in chunks of a fixed size. Uniform samples are drawn in batches
+    whose size adapts to the running acceptance rate, accepted samples are copied into a preallocated chunk buffer and
+    all batches are drawn from the same random generator (so streams are reproducible given a seeded generator).
+    The stream ends when a budget (drawn samples, accepted samples or time) is exhausted, the last chunk may then be
+    smaller than the chunk size.
+    """
+
+    def __init__(self, domain, support, chunk_size=10000, rand_gen=DEF_RNG, max_samples=None, max_positive=None,
+                 time_budget=None, initial_batch_size=None, min_batch_size=1024, max_batch_size=2 ** 20,
+                 compact=False, real_dtype=np.float64, sampling="random", copy=False):
+        """
+        :param chunk_size: The number of accepted samples per chunk
+        :param rand_gen: The random generator used for all batches
+        :param max_samples: The maximal number of uniform samples to draw (None for no limit)
+        :param max_positive: The number of accepted samples after which the stream ends (None for no limit)
+        :param time_budget: The number of seconds after which no more batches are drawn (None for no limit)
+        :param initial_batch_size: The size of the first batch (by default the chunk size)
+        :param min_batch_size: The minimal batch size (unless a budget requires smaller batches)
+        :param max_batch_size: The maximal batch size (bounds the memory used for rejected samples)
+        :param compact: If true, the chunks are CompactSamples (see uniform)
+        :param copy: If true, every chunk is a new array, otherwise chunks share one buffer and are only valid until
+        the next chunk is generated
+        """
+        if chunk_size < 1:
+            raise ValueError("The chunk size has to be positive, was {}".format(chunk_size))
+        self.domain = domain
+        self.support = support
+        self.chunk_size = chunk_size
+        self.rand_gen = rand_gen
+        self.max_samples = max_samples
+        self.max_positive = max_positive
+        self.time_budget = time_budget
+        self.initial_batch_size = initial_batch_size or chunk_size
+        self.min_batch_size = min_batch_size
+        self.max_batch_size = max_batch_size
+        self.compact = compact
+        self.real_dtype = real_dtype
+        self.sampling = sampling
+        self.copy = copy
+        self.drawn = 0
+        self.accepted = 0
+        self.stopped_by = None  # The budget that ended the stream ("max_samples", "max_positive" or "time_budget")
+
+    @property
+    def acceptance_rate(self):
+        return self.accepted / self.drawn if self.drawn > 0 else 0.0
+
+    def next_batch_size(self, needed):
+        if self.drawn == 0:
+            size = self.initial_batch_size
+        else:
+            size = int(math.ceil(needed / max(self.acceptance_rate, 0.001) * 1.1))
+            size = min(max(size, self.min_batch_size), self.max_batch_size)
+        if self.max_samples is not None:
+            size = min(size, self.max_samples - self.drawn)
+        return size
+
+    def _allocate(self, size):
+        if self.compact:
+            return CompactSamples.empty(self.domain, size, self.real_dtype)
+        return np.empty((size, len(self.domain.variables)))
+
+    def __iter__(self):
+        start_time = time.perf_counter()
+        buffer = self._allocate(self.chunk_size)
+        filled = 0
+        carry = None  # Accepted samples that did not fit in the previous chunk
+        while True:
+            if carry is not None:
+                positives, carry = carry, None
+            else:
+                if self.max_positive is not None and self.accepted >= self.max_positive:
+                    self.stopped_by = "max_positive"
+                elif self.max_samples is not None and self.drawn >= self.max_samples:
+                    self.stopped_by = "max_samples"
+                elif self.time_budget is not None and time.perf_counter() - start_time >= self.time_budget:
+                    self.stopped_by = "time_budget"
+                if self.stopped_by is not None:
+                    break
+
+                needed = self.chunk_size - filled
+                if self.max_positive is not None:
+                    needed = min(needed, self.max_positive - self.accepted)
+                batch = uniform(self.domain, self.next_batch_size(needed), rand_gen=self.rand_gen,
+                                compact=self.compact, real_dtype=self.real_dtype, sampling=self.sampling)
+                positives = batch[evaluate(self.domain, self.support, batch)]
+                self.drawn += batch.shape[0]
+                if self.max_positive is not None:
+                    positives = positives[:self.max_positive - self.accepted]
+                self.accepted += positives.shape[0]
+
+            count = min(positives.shape[0], self.chunk_size - filled)
+            buffer[filled:filled + count] = positives[:count]
+            filled += count
+            if count < positives.shape[0]:
+                carry = positives[count:]
+            if filled == self.chunk_size:
+                yield buffer.copy() if self.copy else buffer
+                filled = 0
+
+        if filled > 0:
+            yield buffer[:filled].copy() if self.copy else buffer[:filled]
+
+
 def positive(required_sample_count, domain, support, weight=None, sample_pool_size=None, sample_count=None,
-             max_samples=None, rand_gen=DEF_RNG):
+             max_samples=None, rand_gen=DEF_RNG, compact=False, real_dtype=np.float64, sampling="random",
+             scheme="multinomial", sampler="rejection"):
+    """
+    Draws samples that satisfy the support (proportionally to the weight, if given)
+    :param sampler: "rejection" to resample a pool of uniformly drawn positive samples, "mcmc" to use a
+    HitAndRunSampler with default settings (for supports with a low acceptance rate) or a configured HitAndRunSampler
+    (e.g., to set burn-in and thinning, and to inspect its diagnostics afterwards)
+    :return Tuple[np.ndarray, float]: The samples and the ratio of uniform samples that satisfied the support (nan
+    for MCMC samplers)
+    """
+    if not isinstance(sampler, str) or sampler == "mcmc":
+        if isinstance(sampler, str):
+            sampler = HitAndRunSampler(domain, support, weight, rand_gen=rand_gen)
+        samples = sampler.sample(required_sample_count)
+        if compact:
+            samples = CompactSamples.from_dense(domain, samples, real_dtype)
+        return samples, np.nan
+    elif sampler != "rejection":
+        raise ValueError("Unknown sampler {}, should be rejection, mcmc or a HitAndRunSampler".format(sampler))
+
     sample_pool_size = sample_pool_size or (required_sample_count if weight is None else required_sample_count * 10)
     sample_count = sample_count or sample_pool_size * 2
     max_samples = max_samples or sample_count * 10
-    samples = uniform(domain, sample_count, rand_gen=rand_gen)
-    labels = evaluate(domain, support, samples)
-    pos_samples = samples[labels]
-
-    while pos_samples.shape[0] < sample_pool_size:
-        if sample_count >= max_samples:
-            raise SamplingError("Max sample count {} exceeded (could not find pool of size {})"
-                                .format(max_samples, sample_pool_size))
-
-        pos_ratio = pos_samples.shape[0] / sample_count
-        estimated_count = (sample_pool_size - pos_samples.shape[0]) / max(pos_ratio, 0.001)
-        new_sample_count = min(int(estimated_count * 1.1), max_samples - sample_count)
-        new_samples = uniform(domain, new_sample_count)
-        new_labels = evaluate(domain, support, new_samples)
-        new_pos_samples = new_samples[new_labels]
-        if pos_samples.shape[0] > 0:
-            pos_samples = np.concatenate((pos_samples, new_pos_samples), axis=0)
-        else:
-            pos_samples = new_pos_samples
-        sample_count = sample_count + new_sample_count
-
-    pos_ratio = pos_samples.shape[0] / sample_count
-
-    if pos_samples.shape[0] > sample_pool_size:
-        pos_samples = pos_samples[:sample_pool_size]
+    stream = PositiveStream(domain, support, chunk_size=sample_pool_size, rand_gen=rand_gen, max_samples=max_samples,
+                            initial_batch_size=sample_count, min_batch_size=1, max_batch_size=max_samples,
+                            compact=compact, real_dtype=real_dtype, sampling=sampling)
+    pos_samples = next(iter(stream), None)
+    if pos_samples is None or pos_samples.shape[0] < sample_pool_size:
+        raise SamplingError("Max sample count {} exceeded (could not find pool of size {})"
+                            .format(max_samples, sample_pool_size))
+    pos_ratio = stream.acceptance_rate
 
     if weight is not None:
         sample_weights = evaluate(domain, weight, pos_samples)
-        return np.array(list(weighted_sample(sample_weights, pos_samples, required_sample_count, rand_gen=rand_gen))), pos_ratio
+        chosen = resample(sample_weights, required_sample_count, scheme, rand_gen=rand_gen)
+        return pos_samples[chosen], pos_ratio
     else:
         return pos_samples, pos_ratio
+
+
+def _concatenate(parts):
+    if isinstance(parts[0], CompactSamples):
+        return CompactSamples.concatenate(parts)
+    return np.concatenate(parts, axis=0)
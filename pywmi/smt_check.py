@@ -1,8 +1,63 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
 import numpy as np
 import pysmt.shortcuts as smt
 
+from pywmi.profiling import allocated_bytes
+from pywmi.smt_compile import compile_formulas, compile_point
 from pywmi.smt_walk import SmtWalker, CachedSmtWalker
 
+STRATEGIES = ("auto", "compiled", "walk", "masked")
+MIN_ROWS_PER_WORKER = 8192
+
+_default_workers = 1
+_default_profile = None
+_executor = None  # One pool shared by all evaluations, grown when more threads are requested
+_executor_workers = 0
+_executor_lock = threading.Lock()
+
+
+def set_default_workers(workers):
+    """
+    Sets the number of threads that evaluate (and everything built on it) uses by default to evaluate batches
+    :param int workers: The number of threads (1 disables multi-threaded evaluation)
+    """
+    global _default_workers
+    if workers < 1:
+        raise ValueError("The number of workers has to be at least 1, was {}".format(workers))
+    _default_workers = workers
+
+
+def get_default_workers():
+    return _default_workers
+
+
+def set_default_profile(profile):
+    """
+    Sets the profile that evaluate (and everything built on it) records the cost of every node in by default
+    :param EvaluationProfile profile: The profile (None disables profiling)
+    """
+    global _default_profile
+    _default_profile = profile
+
+
+def get_default_profile():
+    return _default_profile
+
+
+def _get_executor(workers):
+    global _executor, _executor_workers
+    with _executor_lock:
+        if _executor_workers < workers:
+            if _executor is not None:
+                # Tasks that were already submitted still complete, the threads exit once they are idle
+                _executor.shutdown(wait=False)
+            _executor = ThreadPoolExecutor(max_workers=workers)
+            _executor_workers = workers
+        return _executor
+
 
 class SmtChecker(SmtWalker):
     def __init__(self, assignment):
@@ -66,11 +121,35 @@ class SmtChecker(SmtWalker):
 
 
 class SmtBatchChecker(CachedSmtWalker):
-    def __init__(self, domain, values):
+    def __init__(self, domain, values, profile=None):
+        """
+        :param Domain domain: The domain of the samples
+        :param np.ndarray values: The samples (one row per sample)
+        :param EvaluationProfile profile: Optional profile that records the cost of every node that is computed
+        """
         super().__init__()
         self.values = values
         self.length = self.values.shape[0]
         self.indices = {v: i for i, v in enumerate(domain.variables)}
+        self.profile = profile
+        self._child_seconds = []
+
+    def walk_smt(self, formula):
+        if self.profile is None or self.cache_key(formula) in self._cache:
+            return super().walk_smt(formula)
+        self._child_seconds.append(0.0)
+        start = time.perf_counter()
+        result = super().walk_smt(formula)
+        seconds = time.perf_counter() - start
+        children = self._child_seconds.pop()
+        if self._child_seconds:
+            self._child_seconds[-1] += seconds
+        self.profile.record(formula, self.current_length, seconds - children, allocated_bytes(result))
+        return result
+
+    @property
+    def current_length(self):
+        return self.length
 
     def walk_ite(self, if_arg, then_arg, else_arg):
         if_samples, then_samples, else_samples = self.walk_smt_multiple([if_arg, then_arg, else_arg])
@@ -136,6 +215,99 @@ class SmtBatchChecker(CachedSmtWalker):
         return self.walk_smt(formula)
 
 
+class SmtMaskedChecker(SmtBatchChecker):
+    """
+    Evaluates conjunctions and disjunctions argument by argument, only on the rows that are still undecided, and
+    evaluates the branches of if-then-else terms only on the rows that take them. The arguments of conjunctions and
+    disjunctions are ordered by their estimated cost divided by the fraction of rows they decide on a small pilot batch.
+    """
+
+    def __init__(self, domain, values, pilot_size=64, profile=None):
+        super().__init__(domain, values, profile)
+        self.pilot_size = pilot_size
+        self.rows = None  # The (absolute) rows currently being evaluated, None for all rows
+        self._costs = dict()
+        self._orders = dict()
+
+    def on_rows(self, formula, rows):
+        previous = self.rows, self._cache
+        self.rows, self._cache = rows, dict()
+        try:
+            return self.walk_smt(formula)
+        finally:
+            self.rows, self._cache = previous
+
+    @property
+    def current_length(self):
+        return self.length if self.rows is None else len(self.rows)
+
+    def absolute(self, positions):
+        return positions if self.rows is None else self.rows[positions]
+
+    def cost(self, formula):
+        if formula not in self._costs:
+            self._costs[formula] = 1 + sum(self.cost(arg) for arg in formula.args())
+        return self._costs[formula]
+
+    def order(self, args, deciding_value):
+        key = (tuple(args), deciding_value)
+        if key not in self._orders:
+            pilot = np.arange(min(self.pilot_size, self.length))
+            rankings = []
+            for arg in args:
+                decided = np.count_nonzero(self.on_rows(arg, pilot) == deciding_value) / max(len(pilot), 1)
+                rankings.append(self.cost(arg) / max(decided, 1 / (len(pilot) + 1)))
+            self._orders[key] = [args[i] for i in sorted(range(len(args)), key=lambda i: rankings[i])]
+        return self._orders[key]
+
+    def walk_short_circuit(self, args, deciding_value):
+        args = self.order(args, deciding_value)
+        result = np.full(self.current_length, not deciding_value)
+        undecided = np.arange(self.current_length)
+        for i, arg in enumerate(args):
+            if i == 0:
+                values = np.asarray(self.walk_smt(arg), dtype=bool)
+            else:
+                values = np.asarray(self.on_rows(arg, self.absolute(undecided)), dtype=bool)
+            decided = values == deciding_value
+            result[undecided[decided]] = deciding_value
+            undecided = undecided[~decided]
+            if len(undecided) == 0:
+                break
+        return result
+
+    def walk_and(self, args):
+        return self.walk_short_circuit(args, False)
+
+    def walk_or(self, args):
+        return self.walk_short_circuit(args, True)
+
+    def walk_ite(self, if_arg, then_arg, else_arg):
+        condition = np.asarray(self.walk_smt(if_arg), dtype=bool)
+        then_rows, else_rows = np.nonzero(condition)[0], np.nonzero(~condition)[0]
+        then_values = self.on_rows(then_arg, self.absolute(then_rows))
+        else_values = self.on_rows(else_arg, self.absolute(else_rows))
+        result = np.empty(self.current_length, dtype=np.result_type(then_values, else_values))
+        result[then_rows] = then_values
+        result[else_rows] = else_values
+        return result
+
+    def walk_symbol(self, name, v_type):
+        if self.rows is None:
+            return super().walk_symbol(name, v_type)
+        column = self.values[self.rows, self.indices[name]]
+        if v_type == smt.BOOL:
+            column = column.astype(bool)
+        return column
+
+    def walk_constant(self, value, v_type):
+        if v_type == smt.BOOL:
+            return np.full(self.current_length, bool(value))
+        elif v_type == smt.REAL:
+            return np.full(self.current_length, float(value))
+        raise RuntimeError("Unsupported type {}".format(v_type))
+
+
 class SmtSingleChecker(SmtWalker):
     def __init__(self, domain, values):
         self.values = values
@@ -201,7 +373,104 @@ def evaluate_assignment(formula, assignment):
     return SmtChecker(assignment).walk_smt(formula)
 
 
-def evaluate(domain, formula, values):
+def evaluate(domain, formula, values, strategy="auto", chunk_size=None, memory_budget=None, workers=None,
+             profile=None):
+    """
+    Evaluates the formula on the given samples
+    :param Domain domain: The domain of the samples
+    :param FNode formula: The formula to evaluate
+    :param np.ndarray|CompactSamples values: A single sample (1D) or a batch of samples (2D, one row per sample)
+    :param str strategy: "compiled" uses a cached compiled version of the formula, "auto" additionally evaluates all
+    compound linear inequalities using a single matrix product and polynomials using exponent matrices, "walk" re-walks
+    the formula and "masked" short-circuits conjunctions, disjunctions and if-then-else terms (useful for low
+    acceptance rates). Single samples are evaluated by a cached, generated Python function (except for "walk")
+    :param int chunk_size: If given, the samples are evaluated in chunks of (at most) this size
+    :param int memory_budget: If given, the samples are evaluated in chunks such that the intermediate results (the
+    scratch buffers and the temporary arrays of the compiled operations) never use more than this number of bytes
+    (only for compiled strategies)
+    :param int workers: The number of threads to split the samples over (by default see set_default_workers), capped
+    such that every thread evaluates at least MIN_ROWS_PER_WORKER samples
+    :param EvaluationProfile profile: If given, records the cost of every node of the formula (by default see
+    set_default_profile)
+    """
+    return evaluate_many(domain, [formula], values, strategy, chunk_size, memory_budget, workers, profile)[0]
+
+
+def evaluate_many(domain, formulas, values, strategy="auto", chunk_size=None, memory_budget=None, workers=None,
+                  profile=None):
+    """
+    Evaluates multiple formulas on the same samples in one pass, subterms shared between the formulas are only
+    evaluated once
+    :param Domain domain: The domain of the samples
+    :param List[FNode] formulas: The formulas to evaluate
+    :param np.ndarray|CompactSamples values: A single sample (1D) or a batch of samples (2D, one row per sample)
+    :param str strategy: The evaluation strategy (see evaluate)
+    :param int chunk_size: If given, the samples are evaluated in chunks of (at most) this size
+    :param int memory_budget: If given, the maximal number of bytes used for intermediate results (see evaluate)
+    :param int workers: The number of threads to split the samples over (by default see set_default_workers), capped
+    such that every thread evaluates at least MIN_ROWS_PER_WORKER samples
+    :param EvaluationProfile profile: If given, records the cost of every node (by default see set_default_profile)
+    :return List: The result for every formula
+    """
+    profile = profile or _default_profile
+    workers = min(workers or _default_workers, values.shape[0] // MIN_ROWS_PER_WORKER)
+    if workers <= 1 or values.ndim == 1:
+        return _evaluate_block(domain, formulas, values, strategy, chunk_size, memory_budget, profile)
+
+    if strategy == "auto" or strategy == "compiled":
+        _compile_strategy(domain, formulas, strategy)  # Compile once, before splitting the work
+    if memory_budget is not None:
+        memory_budget //= workers
+    boundaries = np.linspace(0, values.shape[0], workers + 1).astype(int)
+    futures = [
+        _get_executor(workers).submit(_evaluate_block, domain, formulas, values[start:end], strategy, chunk_size,
+                                      memory_budget, profile)
+        for start, end in zip(boundaries[:-1], boundaries[1:])
+    ]
+    blocks = [future.result() for future in futures]
+    return [np.concatenate([block[i] for block in blocks]) for i in range(len(formulas))]
+
+
+def _compile_strategy(domain, formulas, strategy):
+    fast = strategy == "auto"
+    return compile_formulas(domain, formulas, linear=fast, polynomial=fast)
+
+
+def _evaluate_block(domain, formulas, values, strategy, chunk_size, memory_budget, profile=None):
+    chunked = chunk_size is not None or memory_budget is not None
     if len(domain.variables) > 1 and values.ndim == 1:
-        return SmtSingleChecker(domain, values).walk_smt(formula)
-    return SmtBatchChecker(domain, values).walk_smt(formula)
+        if strategy == "walk":
+            checker = SmtSingleChecker(domain, values)
+            return [checker.walk_smt(formula) for formula in formulas]
+        start = time.perf_counter()
+        results = list(compile_point(domain, formulas)(np.asarray(values)))
+        if profile is not None:
+            profile.record("point", 1, time.perf_counter() - start, 0)  # Single samples are not profiled per node
+        return results
+    elif strategy == "auto" or strategy == "compiled":
+        compiled = _compile_strategy(domain, formulas, strategy)
+        if chunked:
+            return compiled.execute_chunked(values, chunk_size, memory_budget, profile)
+        return compiled.execute(values, profile)
+    elif strategy == "walk":
+        checker_type = SmtBatchChecker
+    elif strategy == "masked":
+        checker_type = SmtMaskedChecker
+    else:
+        raise ValueError("Unknown evaluation strategy {}, should be one of {}".format(strategy, STRATEGIES))
+
+    if memory_budget is not None:
+        raise ValueError("Memory budgets are only supported by compiled evaluation strategies")
+    if chunk_size is None or chunk_size >= values.shape[0]:
+        checker = checker_type(domain, values, profile=profile)
+        return [checker.walk_smt(formula) for formula in formulas]
+
+    results = None
+    for start in range(0, values.shape[0], chunk_size):
+        checker = checker_type(domain, values[start:start + chunk_size], profile=profile)
+        chunk_results = [checker.walk_smt(formula) for formula in formulas]
+        if results is None:
+            results = [np.empty(values.shape[0], dtype=r.dtype) for r in chunk_results]
+        for result, chunk_result in zip(results, chunk_results):
+            result[start:start + chunk_size] = chunk_result
+    return results
@@ -0,0 +1,718 @@
+import time
+from collections import defaultdict
+from functools import lru_cache
+
+import numpy as np
+import pysmt.shortcuts as smt
+from pysmt.operators import POW as POW_TYPE
+
+from pywmi.profiling import allocated_bytes
+from pywmi.smt_walk import CachedSmtWalker
+
+POW_COST = 4  # Raising samples to a (non-square) power takes about as long as four multiplications
+
+
+def _load_real(values, column):
+    return values[:, column]
+
+
+def _load_bool(values, column, out=None):
+    return np.not_equal(values[:, column], 0, out=out)
+
+
+def _linear(values, columns, coefficients, out=None):
+    return np.matmul(coefficients, values[:, columns].T, out=out)
+
+
+def _linear_temporaries(values, columns, coefficients):
+    # The used columns are gathered into a copy
+    return len(columns) * np.dtype(values.dtype).itemsize
+
+
+def _compare(products, bounds, first_strict, out=None):
+    # Non-strict inequalities are stored before strict inequalities
+    if out is None:
+        out = np.empty(products.shape, dtype=bool)
+    np.less_equal(products[:first_strict], bounds[:first_strict, np.newaxis], out=out[:first_strict])
+    np.less(products[first_strict:], bounds[first_strict:, np.newaxis], out=out[first_strict:])
+    return out
+
+
+def _polynomial(values, columns, exponents, coefficients, constant, out=None):
+    # Every variable is raised to the required powers once (by repeated multiplication) and the weighted monomials are
+    # then accumulated term by term (rather than by a BLAS dot product) so that the result of a sample does not depend
+    # on its position in the batch
+    powers = []
+    for j, column in enumerate(columns):
+        ladder = [None, values[:, column]]
+        for _ in range(2, exponents[:, j].max() + 1):
+            ladder.append(ladder[-1] * ladder[1])
+        powers.append(ladder)
+
+    dtype = np.result_type(*[ladder[1] for ladder in powers], 1.0)
+    result = np.empty(values.shape[0], dtype=dtype) if out is None else out
+    scratch = None
+    for t in range(exponents.shape[0]):
+        factors = [powers[j][e] for j, e in enumerate(exponents[t]) if e > 0]
+        if len(factors) == 1 and coefficients[t] == 1:
+            term = factors[0]
+        else:
+            if scratch is None:
+                scratch = np.empty_like(result)
+            if coefficients[t] == 1:
+                term = np.multiply(factors[0], factors[1], out=scratch)
+                factors = factors[2:]
+            else:
+                term = np.multiply(factors[0], coefficients[t], out=scratch)
+                factors = factors[1:]
+            for factor in factors:
+                np.multiply(term, factor, out=term)
+        if t == 0:
+            np.copyto(result, term)
+        else:
+            np.add(result, term, out=result)
+    if constant != 0:
+        np.add(result, constant, out=result)
+    return result
+
+
+def _polynomial_temporaries(values, columns, exponents, coefficients, constant):
+    # Every power above 1 of every variable and one scratch term (the first powers are views of the samples)
+    itemsize = np.result_type(values.dtype, 1.0).itemsize
+    powers = int(np.maximum(exponents.max(axis=0) - 1, 0).sum())
+    return (powers + 1) * itemsize
+
+
+def _atom(table, index):
+    return table[index]
+
+
+def _times(left, right, out=None):
+    # Mirrors the reference checker, which starts every product from 1.0
+    return np.multiply(left, right, out=out, dtype=np.result_type(left, right, 1.0))
+
+
+def _ite(condition, then_value, else_value, out=None):
+    if out is None:
+        return np.where(condition, then_value, else_value)
+    np.copyto(out, else_value)
+    np.copyto(out, then_value, where=condition)
+    return out
+
+
+class Operation(object):
+    def __init__(self, name, function, reads_samples=False, view=False, temporaries=None):
+        """
+        :param str name: The name of the operation
+        :param Callable function: The function computing the result (accepting an out argument unless it is a view)
+        :param bool reads_samples: If true, the samples are passed as first argument
+        :param bool view: If true, the result is a view of the samples or of the first argument
+        :param Callable temporaries: Optional function that, given the same arguments as function, returns the number
+        of bytes per sample of the temporary arrays that function allocates (besides its result)
+        """
+        self.name = name
+        self.function = function
+        self.reads_samples = reads_samples
+        self.view = view
+        self.temporaries = temporaries
+
+    def __repr__(self):
+        return self.name
+
+
+LOAD_REAL = Operation("load_real", _load_real, reads_samples=True, view=True)
+LOAD_BOOL = Operation("load_bool", _load_bool, reads_samples=True)
+LINEAR = Operation("linear", _linear, reads_samples=True, temporaries=_linear_temporaries)
+COMPARE = Operation("compare", _compare)
+POLYNOMIAL = Operation("polynomial", _polynomial, reads_samples=True, temporaries=_polynomial_temporaries)
+ATOM = Operation("atom", _atom, view=True)
+PLUS = Operation("plus", np.add)
+MINUS = Operation("minus", np.subtract)
+TIMES = Operation("times", _times)
+POW = Operation("pow", np.power)
+LT = Operation("lt", np.less)
+LTE = Operation("lte", np.less_equal)
+EQUALS = Operation("equals", np.equal)
+AND = Operation("and", np.logical_and)
+OR = Operation("or", np.logical_or)
+NOT = Operation("not", np.logical_not)
+ITE = Operation("ite", _ite)
+
+
+def subformulas(formulas):
+    """
+    Lists all distinct nodes of the formula-DAGs (children before parents)
+    """
+    result, visited = [], set()
+    stack = [(f, False) for f in reversed(formulas)]
+    while stack:
+        node, expanded = stack.pop()
+        if expanded:
+            result.append(node)
+        elif node not in visited:
+            visited.add(node)
+            stack.append((node, True))
+            stack.extend((arg, False) for arg in reversed(node.args()))
+    return result
+
+
+class CompiledFormula(object):
+    """
+    A flat sequence of vectorized NumPy operations that evaluates one or more formulas on a batch of samples.
+    Every instruction is a tuple (operation, output slot, argument slots), slots holding constants are filled in before
+    execution and slots that are no longer needed are released as soon as possible.
+    """
+
+    def __init__(self, variables, instructions, constants, outputs, slot_count, nodes=None):
+        self.variables = variables
+        self.instructions = instructions
+        self.constants = constants
+        self.outputs = outputs
+        self.slot_count = slot_count
+        self.nodes = nodes or dict()  # slot => FNode that produced it
+
+        last_use = dict()
+        for i, (_, _, args) in enumerate(instructions):
+            for slot in args:
+                last_use[slot] = i
+        kept = set(outputs) | set(constants)
+        self.releases = [[] for _ in instructions]
+        for slot, i in last_use.items():
+            if slot not in kept:
+                self.releases[i].append(slot)
+        self.views = {out for operation, out, _ in instructions if operation.view}
+
+    def run(self, values, buffers=None, trace=None, profile=None):
+        """
+        Runs the instructions on the given samples
+        :param np.ndarray values: The samples (one row per sample)
+        :param List buffers: Optional output buffers (per instruction) whose sample axis is at least as long as values
+        :param List trace: Optional list that will receive the result of every instruction
+        :param EvaluationProfile profile: Optional profile that records the cost of every instruction (attributed to
+        the node that produced it)
+        :return List: The (raw) results for the outputs
+        """
+        registers = [None] * self.slot_count
+        for slot, value in self.constants.items():
+            registers[slot] = value
+
+        length = values.shape[0]
+        for i, ((operation, out, args), releases) in enumerate(zip(self.instructions, self.releases)):
+            arguments = [registers[slot] for slot in args]
+            if operation.reads_samples:
+                arguments.insert(0, values)
+            if profile is not None:
+                start = time.perf_counter()
+            if buffers is not None and buffers[i] is not None:
+                registers[out] = operation.function(*arguments, out=buffers[i][..., :length])
+            else:
+                registers[out] = operation.function(*arguments)
+            if profile is not None:
+                seconds = time.perf_counter() - start
+                allocated = allocated_bytes(registers[out]) + length * self.temporary_bytes(values, i)
+                profile.record(self.nodes.get(out, operation.name), length, seconds, allocated)
+            if trace is not None:
+                trace.append(registers[out])
+            for slot in releases:
+                registers[slot] = None
+
+        return [registers[slot] for slot in self.outputs]
+
+    def execute(self, values, profile=None):
+        length = values.shape[0]
+        results = self.run(values, profile=profile)
+        return [self._finalize(result, slot, length) for result, slot in zip(results, self.outputs)]
+
+    def _finalize(self, result, slot, length):
+        if np.ndim(result) == 0:
+            return np.full(length, result)
+        if slot in self.views:
+            return np.copy(result)
+        return result
+
+    def plan_buffers(self, values, chunk_size=None, memory_budget=None, probe_size=16):
+        """
+        Plans the scratch buffers needed to evaluate the samples in chunks, buffers are shared between instructions
+        whose results are not needed at the same time
+        :param np.ndarray values: The samples (a small prefix is evaluated to determine the result types)
+        :param int chunk_size: The number of samples per chunk
+        :param int memory_budget: The maximal number of bytes used by the scratch buffers and by the temporary arrays
+        that instructions allocate while processing a chunk (determines the chunk size if no chunk size is given)
+        :param int probe_size: The number of samples used to determine the result types
+        :return Tuple[int, List]: The chunk size and the buffers (per instruction, None if not buffered)
+        """
+        trace = []
+        self.run(values[:probe_size], trace=trace)
+
+        # A buffer can only be recycled once all views of it are no longer needed either
+        kept = set(self.outputs) | set(self.constants)
+        release_at = {slot: i for i, releases in enumerate(self.releases) for slot in releases}
+        for operation, out, args in reversed(self.instructions):
+            if operation.view and not operation.reads_samples:
+                if out in kept or out not in release_at:
+                    kept.add(args[0])
+                    release_at.pop(args[0], None)
+                elif args[0] in release_at:
+                    release_at[args[0]] = max(release_at[args[0]], release_at[out])
+        released = defaultdict(list)
+        for slot, i in release_at.items():
+            released[i].append(slot)
+
+        pool = defaultdict(list)
+        assignment = [None] * len(self.instructions)
+        layouts = []
+        slot_buffers = dict()
+        for i, ((operation, out, _), result) in enumerate(zip(self.instructions, trace)):
+            if not operation.view and np.ndim(result) > 0:
+                layout = (result.dtype, result.shape[:-1])
+                if len(pool[layout]) > 0:
+                    assignment[i] = pool[layout].pop()
+                else:
+                    assignment[i] = len(layouts)
+                    layouts.append(layout)
+                slot_buffers[out] = assignment[i]
+            for slot in released[i]:
+                if slot in slot_buffers:
+                    index = slot_buffers.pop(slot)
+                    pool[layouts[index]].append(index)
+
+        row_bytes = sum(dtype.itemsize * int(np.prod(shape)) for dtype, shape in layouts)
+        row_bytes += max([self.temporary_bytes(values, i) for i in range(len(self.instructions))], default=0)
+        if chunk_size is None:
+            if memory_budget is None:
+                raise ValueError("Either the chunk size or the memory budget has to be specified")
+            chunk_size = memory_budget // max(row_bytes, 1)
+            if chunk_size < 1:
+                raise ValueError("Memory budget of {} bytes is too small (at least {} bytes are required)"
+                                 .format(memory_budget, row_bytes))
+        chunk_size = max(1, min(chunk_size, values.shape[0]))
+        allocated = [np.empty(shape + (chunk_size,), dtype=dtype) for dtype, shape in layouts]
+        return chunk_size, [allocated[index] if index is not None else None for index in assignment]
+
+    def temporary_bytes(self, values, i):
+        """
+        :return int: The number of bytes per sample of the temporary arrays allocated by the i-th instruction (only one
+        instruction runs at a time, so these are not kept across instructions)
+        """
+        operation, _, args = self.instructions[i]
+        if operation.temporaries is None:
+            return 0
+        arguments = [self.constants[slot] for slot in args]
+        if operation.reads_samples:
+            arguments.insert(0, values)
+        return operation.temporaries(*arguments)
+
+    def scratch_bytes(self, buffers):
+        """
+        :return int: The number of bytes used by the (distinct) planned scratch buffers
+        """
+        return sum(buffer.nbytes for buffer in {id(b): b for b in buffers if b is not None}.values())
+
+    def stream(self, values, chunk_size=None, memory_budget=None, profile=None):
+        """
+        Evaluates the samples chunk by chunk using scratch buffers that are reused across chunks
+        :param np.ndarray values: The samples (one row per sample)
+        :param int chunk_size: The number of samples per chunk
+        :param int memory_budget: The maximal number of bytes used by the scratch buffers and temporary arrays (see
+        plan_buffers)
+        :param EvaluationProfile profile: Optional profile that records the cost of every instruction
+        :return: A generator of (start, end, results) tuples, the results are only valid until the next chunk
+        """
+        chunk_size, buffers = self.plan_buffers(values, chunk_size, memory_budget)
+        for start in range(0, values.shape[0], chunk_size):
+            end = min(start + chunk_size, values.shape[0])
+            yield start, end, self.run(values[start:end], buffers, profile=profile)
+
+    def execute_chunked(self, values, chunk_size=None, memory_budget=None, profile=None):
+        length = values.shape[0]
+        results = None
+        for start, end, chunk_results in self.stream(values, chunk_size, memory_budget, profile):
+            if results is None:
+                results = [np.empty(length, dtype=np.asarray(r).dtype) for r in chunk_results]
+            for result, chunk_result in zip(results, chunk_results):
+                result[start:end] = chunk_result
+        if results is None:
+            return self.execute(values, profile)
+        return results
+
+    def __call__(self, values):
+        return self.execute(values)[0]
+
+    def __len__(self):
+        return len(self.instructions)
+
+
+class SmtCompiler(CachedSmtWalker):
+    def __init__(self, variables, linear=False, polynomial=False):
+        super().__init__()
+        self.linear = linear
+        self.polynomial = polynomial
+        self._polynomials = dict()
+        self.indices = {v: i for i, v in enumerate(variables)}
+        self.instructions = []
+        self.constants = dict()
+        self.slot_count = 0
+        self.nodes = dict()
+        self._walking = []
+
+    def new_slot(self):
+        self.slot_count += 1
+        return self.slot_count - 1
+
+    def emit(self, operation, args):
+        out = self.new_slot()
+        self.instructions.append((operation, out, tuple(args)))
+        if self._walking:
+            self.nodes[out] = self._walking[-1]  # Intermediate results are attributed to the node being compiled
+        return out
+
+    def emit_chain(self, operation, args):
+        slots = self.walk_smt_multiple(args)
+        result = slots[0]
+        for slot in slots[1:]:
+            result = self.emit(operation, (result, slot))
+        return result
+
+    def walk_smt(self, formula):
+        key = self.cache_key(formula)
+        self._walking.append(formula)
+        try:
+            if self.polynomial and key not in self._cache and self.is_polynomial(formula):
+                slot = self.compile_polynomial(formula)
+                if slot is not None:
+                    self._cache[key] = slot
+            slot = super().walk_smt(formula)
+        finally:
+            self._walking.pop()
+        self.nodes.setdefault(slot, formula)
+        return slot
+
+    def is_polynomial(self, formula):
+        """
+        :return bool: True iff the formula is a compound polynomial over real variables of the domain
+        """
+        def check(node):
+            if node not in self._polynomials:
+                if node.is_symbol(smt.REAL):
+                    result = node.symbol_name() in self.indices
+                elif node.is_constant(smt.REAL):
+                    result = True
+                elif node.node_type() == POW_TYPE:
+                    exponent = node.arg(1)
+                    result = exponent.is_constant(smt.REAL) and exponent.constant_value() >= 1 \
+                        and int(exponent.constant_value()) == exponent.constant_value() and check(node.arg(0))
+                elif node.is_plus() or node.is_minus() or node.is_times():
+                    result = all(check(arg) for arg in node.args())
+                else:
+                    result = False
+                self._polynomials[node] = result
+            return self._polynomials[node]
+
+        return not formula.is_symbol() and not formula.is_constant() and check(formula)
+
+    @staticmethod
+    def operation_cost(formula):
+        """
+        :return int: The (approximate) number of passes over the samples needed to evaluate the formula operation by
+        operation
+        """
+        cost = 0
+        for node in subformulas([formula]):
+            if node.node_type() == POW_TYPE:
+                cost += 1 if node.arg(1).constant_value() == 2 else POW_COST
+            elif node.is_plus() or node.is_minus() or node.is_times():
+                cost += max(len(node.args()) - 1, 1)
+        return cost
+
+    @staticmethod
+    def exponent_matrix_cost(exponents, coefficients, constant):
+        """
+        :return int: The (approximate) number of passes over the samples needed to evaluate the polynomial using
+        _polynomial
+        """
+        powers = int(np.maximum(exponents.max(axis=0) - 1, 0).sum())
+        factors = np.count_nonzero(exponents, axis=1)
+        products = int(np.maximum(factors - 1 + (coefficients != 1), 0).sum())
+        return powers + products + len(coefficients) + (constant != 0)
+
+    def compile_polynomial(self, formula):
+        """
+        Emits the polynomial as a single exponent matrix operation if that requires fewer passes over the samples
+        :return int: The slot containing the result or None if the formula is not compiled as one polynomial
+        """
+        from pywmi.smt_math import Polynomial, CONST_KEY
+
+        polynomial = Polynomial.from_smt(formula)
+        constant = polynomial.poly_dict.get(CONST_KEY, 0.0)
+        terms = Polynomial({k: v for k, v in polynomial.poly_dict.items() if k != CONST_KEY})
+        variables = sorted(terms.variables, key=lambda v: self.indices[v])
+        if len(variables) == 0:
+            return self.constant(constant)
+        exponents, coefficients = terms.to_exponent_matrix(variables)
+        if self.exponent_matrix_cost(exponents, coefficients, constant) >= self.operation_cost(formula):
+            return None
+        columns = np.array([self.indices[v] for v in variables], dtype=int)
+        args = (columns, exponents, coefficients, constant)
+        return self.emit(POLYNOMIAL, [self.constant(arg) for arg in args])
+
+    def walk_and(self, args):
+        return self.emit_chain(AND, args)
+
+    def walk_or(self, args):
+        return self.emit_chain(OR, args)
+
+    def walk_plus(self, args):
+        if len(args) == 1:
+            return self.emit(PLUS, (self.constant(0), self.walk_smt(args[0])))
+        return self.emit_chain(PLUS, args)
+
+    def walk_minus(self, left, right):
+        return self.emit(MINUS, self.walk_smt_multiple([left, right]))
+
+    def walk_times(self, args):
+        if len(args) == 0:
+            raise RuntimeError("Zero argument multiplication")
+        if len(args) == 1:
+            return self.emit(TIMES, (self.constant(1.0), self.walk_smt(args[0])))
+        return self.emit_chain(TIMES, args)
+
+    def walk_not(self, argument):
+        return self.emit(NOT, (self.walk_smt(argument),))
+
+    def walk_ite(self, if_arg, then_arg, else_arg):
+        return self.emit(ITE, self.walk_smt_multiple([if_arg, then_arg, else_arg]))
+
+    def walk_pow(self, base, exponent):
+        return self.emit(POW, self.walk_smt_multiple([base, exponent]))
+
+    def walk_lte(self, left, right):
+        return self.emit(LTE, self.walk_smt_multiple([left, right]))
+
+    def walk_lt(self, left, right):
+        return self.emit(LT, self.walk_smt_multiple([left, right]))
+
+    def walk_equals(self, left, right):
+        return self.emit(EQUALS, self.walk_smt_multiple([left, right]))
+
+    def walk_symbol(self, name, v_type):
+        if v_type == smt.BOOL:
+            operation = LOAD_BOOL
+        elif v_type == smt.REAL:
+            operation = LOAD_REAL
+        else:
+            raise RuntimeError("Unsupported type {}".format(v_type))
+        return self.emit(operation, (self.constant(self.indices[name]),))
+
+    def walk_constant(self, value, v_type):
+        if v_type == smt.BOOL:
+            return self.constant(bool(value))
+        elif v_type == smt.REAL:
+            return self.constant(float(value))
+        raise RuntimeError("Unsupported type {}".format(v_type))
+
+    def constant(self, value):
+        slot = self.new_slot()
+        self.constants[slot] = value
+        return slot
+
+    def compile_linear_atoms(self, formulas):
+        """
+        Stacks the compound linear inequalities of the formulas (inequalities that are not a plain comparison of
+        variables and constants) into one coefficient matrix, so that their truth values are computed by a single
+        matrix product, and registers every such inequality as a row of the resulting atom table
+        """
+        from pywmi.smt_math import MathDictConverter
+
+        atoms = []
+        inequalities = []
+        for node in subformulas(formulas):
+            if (node.is_le() or node.is_lt()) and not all(a.is_symbol() or a.is_constant() for a in node.args()):
+                try:
+                    inequality = MathDictConverter(force_linear=True).walk_minus(node.arg(0), node.arg(1))
+                except ValueError:
+                    continue
+                if all(len(key) == 0 or key[0] in self.indices for key in inequality):
+                    atoms.append(node)
+                    inequalities.append(inequality)
+
+        if len(atoms) < 2:
+            return
+
+        order = sorted(range(len(atoms)), key=lambda i: atoms[i].is_lt())
+        atoms, inequalities = [atoms[i] for i in order], [inequalities[i] for i in order]
+
+        variables = sorted({key[0] for inequality in inequalities for key in inequality if len(key) > 0},
+                           key=lambda v: self.indices[v])
+        coefficients = np.zeros((len(atoms), len(variables)))
+        bounds = np.zeros(len(atoms))
+        for i, inequality in enumerate(inequalities):
+            for key, value in inequality.items():
+                if len(key) == 0:
+                    bounds[i] = -value
+                else:
+                    coefficients[i, variables.index(key[0])] = value
+        first_strict = sum(1 for atom in atoms if not atom.is_lt())
+        columns = np.array([self.indices[v] for v in variables], dtype=int)
+
+        products = self.emit(LINEAR, (self.constant(columns), self.constant(coefficients)))
+        table = self.emit(COMPARE, (products, self.constant(bounds), self.constant(first_strict)))
+        for i, atom in enumerate(atoms):
+            slot = self.emit(ATOM, (table, self.constant(i)))
+            self._cache[self.cache_key(atom)] = slot
+            self.nodes[slot] = atom
+
+    def compile(self, formulas):
+        if self.linear:
+            self.compile_linear_atoms(formulas)
+        outputs = [self.walk_smt(formula) for formula in formulas]
+        return CompiledFormula(list(self.indices), self.instructions, self.constants, outputs, self.slot_count,
+                               self.nodes)
+
+
+class PointCompiler(CachedSmtWalker):
+    """
+    Generates the source code of a Python function that evaluates formulas on a single sample (a 1D array). The
+    formulas are translated into nested Python expressions (and, or and if-then-else short-circuit), subterms that are
+    shared (or very deeply nested) are stored in local variables.
+    """
+
+    MAX_DEPTH = 32  # Deeper expressions are stored in local variables (Python limits the nesting of expressions)
+
+    def __init__(self, variables):
+        super().__init__()
+        self.indices = {v: i for i, v in enumerate(variables)}
+        self.lines = []
+        self.shared = set()
+
+    def local(self, expression):
+        name = "t{}".format(len(self.lines))
+        self.lines.append("{} = {}".format(name, expression))
+        return name, 0
+
+    def walk_smt(self, formula):
+        key = self.cache_key(formula)
+        if key in self._cache:
+            return self._cache[key]
+        expression, depth = super().walk_smt(formula)
+        if formula in self.shared and depth > 0 or depth > self.MAX_DEPTH:
+            expression, depth = self.local(expression)
+        self._cache[key] = expression, depth
+        return expression, depth
+
+    def join(self, operator, args):
+        compiled = self.walk_smt_multiple(args)
+        return "({})".format(" {} ".format(operator).join(e for e, _ in compiled)), 1 + max(d for _, d in compiled)
+
+    def walk_and(self, args):
+        return self.join("and", args)
+
+    def walk_or(self, args):
+        return self.join("or", args)
+
+    def walk_plus(self, args):
+        return self.join("+", args)
+
+    def walk_minus(self, left, right):
+        return self.join("-", [left, right])
+
+    def walk_times(self, args):
+        return self.join("*", args)
+
+    def walk_pow(self, base, exponent):
+        return self.join("**", [base, exponent])
+
+    def walk_lte(self, left, right):
+        return self.join("<=", [left, right])
+
+    def walk_lt(self, left, right):
+        return self.join("<", [left, right])
+
+    def walk_equals(self, left, right):
+        return self.join("==", [left, right])
+
+    def walk_not(self, argument):
+        expression, depth = self.walk_smt(argument)
+        return "(not {})".format(expression), depth + 1
+
+    def walk_ite(self, if_arg, then_arg, else_arg):
+        (c, c_depth), (t, t_depth), (e, e_depth) = self.walk_smt_multiple([if_arg, then_arg, else_arg])
+        return "({} if {} else {})".format(t, c, e), 1 + max(c_depth, t_depth, e_depth)
+
+    def walk_symbol(self, name, v_type):
+        if v_type == smt.BOOL:
+            return "(v[{}] != 0)".format(self.indices[name]), 1
+        return "v[{}]".format(self.indices[name]), 0
+
+    def walk_constant(self, value, v_type):
+        if v_type == smt.BOOL:
+            return repr(bool(value)), 0
+        elif v_type == smt.REAL:
+            return repr(float(value)), 0
+        raise RuntimeError("Unsupported type {}".format(v_type))
+
+    def compile(self, formulas):
+        """
+        :return Callable: A function that returns a tuple with the value of every formula on the given sample (the
+        generated code is available as its source attribute)
+        """
+        parents = defaultdict(int)
+        for node in subformulas(formulas):
+            for arg in set(node.args()):
+                parents[arg] += 1
+        self.shared = {node for node, count in parents.items() if count > 1}
+
+        outputs = [self.walk_smt(formula)[0] for formula in formulas]
+        body = ["v = values.tolist()"] + self.lines + ["return ({},)".format(", ".join(outputs))]
+        source = "def evaluate_point(values):\n" + "".join("    {}\n".format(line) for line in body)
+        namespace = dict()
+        exec(compile(source, "<compiled point evaluator>", "exec"), namespace)
+        function = namespace["evaluate_point"]
+        function.source = source
+        return function
+
+
+@lru_cache(maxsize=256)
+def _compile_point(formulas, variables):
+    return PointCompiler(variables).compile(formulas)
+
+
+def compile_point(domain, formulas):
+    """
+    Compiles the formulas into a cached Python function that evaluates them on a single sample, the function accepts
+    a 1D array and returns a tuple with one result per formula
+    :param Domain domain: The domain whose variable order determines the positions in the sample
+    :param List[FNode] formulas: The supports, weights or queries to compile
+    :return Callable: The compiled function
+    """
+    return _compile_point(tuple(formulas), tuple(domain.variables))
+
+
+@lru_cache(maxsize=256)
+def _compile(formulas, variables, linear, polynomial):
+    return SmtCompiler(variables, linear, polynomial).compile(formulas)
+
+
+def compile_formulas(domain, formulas, linear=False, polynomial=False):
+    """
+    Compiles the formulas into one cached sequence of vectorized operations over samples of the given domain, shared
+    subterms are only computed once
+    :param Domain domain: The domain whose variable order determines the sample columns
+    :param List[FNode] formulas: The supports, weights or queries to compile
+    :param bool linear: If true, all compound linear inequalities are evaluated together using a single matrix product
+    :param bool polynomial: If true, polynomial subterms are converted to an exponent matrix and coefficient vector
+    and evaluated by a single operation (if that is expected to be faster)
+    :return CompiledFormula: The compiled formulas (execute returns one result per formula)
+    """
+    return _compile(tuple(formulas), tuple(domain.variables), linear, polynomial)
+
+
+def compile_formula(domain, formula, linear=False, polynomial=False):
+    """
+    Compiles the formula into a cached sequence of vectorized operations over samples of the given domain
+    :param Domain domain: The domain whose variable order determines the sample columns
+    :param FNode formula: The support, weight or query to compile
+    :param bool linear: If true, all compound linear inequalities are evaluated together using a single matrix product
+    :param bool polynomial: If true, polynomial subterms are evaluated using exponent matrices
+    :return CompiledFormula: The compiled formula
+    """
+    return compile_formulas(domain, [formula], linear, polynomial)
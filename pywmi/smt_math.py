@@ -2,6 +2,7 @@ import math
 from fractions import Fraction
 from typing import Dict, Tuple, Union, List
 
+import numpy as np
 from pysmt.exceptions import InternalSolverError
 from pysmt.shortcuts import Plus, Symbol, Real, Times, Solver
 from pysmt.typing import REAL, BOOL
@@ -49,6 +50,18 @@ class Polynomial(object):
             result = algebra.plus(result, algebra.times(term, algebra.real(factor)))
         return result
 
+    def to_exponent_matrix(self, variables: List[str]) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        :param variables: The variables (columns of the exponent matrix)
+        :return: A matrix with the exponent of every variable (column) for every term (row) and the coefficients
+        """
+        keys = list(self.poly_dict.keys())
+        exponents = np.zeros((len(keys), len(variables)), dtype=int)
+        for i, key in enumerate(keys):
+            for var in key:
+                exponents[i, variables.index(var)] += 1
+        return exponents, np.array([self.poly_dict[key] for key in keys], dtype=float)
+
     def get_terms(self) -> List["Polynomial"]:
         return [Polynomial({k: v}) for k, v in self.poly_dict.items()]
 
@@ -1,11 +1,20 @@
+import json
+import threading
+
 import pytest
 import numpy as np
 from pysmt.shortcuts import Real, Ite, Bool, Equals, Pow, REAL, BOOL
 
-from pywmi import Domain, RejectionEngine, evaluate
+from pywmi import Domain, RejectionEngine, EvaluationProfile, evaluate, evaluate_many
+from pywmi.sample import uniform
+from pywmi.smt_check import SmtMaskedChecker, MIN_ROWS_PER_WORKER, set_default_workers, get_default_workers, \
+    set_default_profile, get_default_profile
+from pywmi.smt_compile import compile_formula, compile_formulas, compile_point, LINEAR, ATOM, POLYNOMIAL
+from .examples import get_examples
 
 
 class TestCheckingBatch(object):
+    strategy = "compiled"
     domain = Domain.make(["a", "b"], ["x", "y"], [(0, 100), (0, 50)])
     a = domain.get_symbol("a")
     b = domain.get_symbol("b")
@@ -20,7 +29,7 @@ class TestCheckingBatch(object):
         ])
 
     def evaluate(self, formula):
-        return list(evaluate(self.domain, formula, self.values))
+        return list(evaluate(self.domain, formula, self.values, strategy=self.strategy))
 
     def test_ite(self):
         assert self.evaluate(Ite(self.a, self.x < 50, self.y < 30)) == [True, True, True, False, False]
@@ -101,10 +110,102 @@ class TestCheckingBatch(object):
 
         a, b = domain.get_symbols(["s1", "s2"])
         f = (a >= 1) & ~b
-        assert all(evaluate(domain, f, data) == np.array([1, 0]))
+        assert all(evaluate(domain, f, data, strategy=self.strategy) == np.array([1, 0]))
+
+
+class TestCheckingBatchWalk(TestCheckingBatch):
+    strategy = "walk"
+
+
+class TestCheckingBatchMasked(TestCheckingBatch):
+    strategy = "masked"
+
+
+class TestCheckingBatchAuto(TestCheckingBatch):
+    strategy = "auto"
+
+
+@pytest.mark.parametrize("strategy", ["auto", "compiled", "masked"])
+@pytest.mark.parametrize("density", get_examples())
+def test_strategy_matches_walk(density, strategy):
+    samples = uniform(density.domain, 10000, rand_gen=np.random.RandomState(1))
+    for formula in [density.support, density.weight] + density.queries:
+        reference = evaluate(density.domain, formula, samples, strategy="walk")
+        result = evaluate(density.domain, formula, samples, strategy=strategy)
+        assert result.dtype == reference.dtype
+        if reference.dtype == bool:
+            assert np.array_equal(result, reference)
+        else:
+            assert np.allclose(result, reference, rtol=1e-12, atol=0)
+
+
+def test_linear_atoms():
+    domain = Domain.make(["a"], ["x", "y"], real_bounds=(0, 1))
+    a, x, y = domain.get_symbols()
+    formula = (a | (x + y * 2 < 1)) & (x <= y) & (x * y <= Real(0.2)) & (x - y <= Real(0.5))
+    compiled = compile_formula(domain, formula, linear=True)
+    assert [op for op, _, _ in compiled.instructions].count(LINEAR) == 1
+    assert [op for op, _, _ in compiled.instructions].count(ATOM) == 2
+    samples = uniform(domain, 1000, rand_gen=np.random.RandomState(3))
+    assert np.array_equal(compiled(samples), evaluate(domain, formula, samples, strategy="walk"))
+
+
+def test_polynomial():
+    domain = Domain.make([], ["x", "y", "z"], real_bounds=(-1, 1))
+    x, y, z = domain.get_symbols()
+    weight = Pow(x, Real(3)) + Real(2) * Pow(y, Real(4)) * z - Pow(z, Real(3)) * x + Real(1)
+    formula = Ite(x <= y, weight, x + y)
+    compiled = compile_formula(domain, formula, polynomial=True)
+    assert [op for op, _, _ in compiled.instructions].count(POLYNOMIAL) == 1
+    samples = uniform(domain, 1000, rand_gen=np.random.RandomState(4))
+    assert np.allclose(compiled(samples), evaluate(domain, formula, samples, strategy="walk"), rtol=1e-12, atol=0)
+
+    # Polynomials that are cheaper to evaluate operation by operation are not collapsed
+    cheap = compile_formula(domain, (x + y) * (x + Real(1)), polynomial=True)
+    assert POLYNOMIAL not in [op for op, _, _ in cheap.instructions]
+
+
+def test_masked_short_circuit():
+    domain = Domain.make([], ["x", "y"], real_bounds=(0, 1))
+    x, y = domain.get_symbols()
+    samples = uniform(domain, 1000, rand_gen=np.random.RandomState(2))
+    checker = SmtMaskedChecker(domain, samples)
+    expensive = (x * y * x * y + x * x * y) <= Real(0.5)
+    selective = x <= Real(0.01)
+    assert checker.order([expensive, selective], False) == [selective, expensive]
+    assert checker.order([expensive, selective], True) == [expensive, selective]
+    reference = evaluate(domain, expensive & selective, samples, strategy="walk")
+    assert np.array_equal(checker.walk_smt(expensive & selective), reference)
+
+
+@pytest.mark.parametrize("strategy", ["auto", "compiled", "walk", "masked"])
+def test_evaluate_many(strategy):
+    density = get_examples()[3]
+    formulas = [density.support, density.weight] + density.queries
+    samples = uniform(density.domain, 1000, rand_gen=np.random.RandomState(4))
+    results = evaluate_many(density.domain, formulas, samples, strategy=strategy)
+    assert len(results) == len(formulas)
+    for formula, result in zip(formulas, results):
+        assert np.array_equal(result, evaluate(density.domain, formula, samples, strategy=strategy))
+
+
+def test_evaluate_many_shares_subterms():
+    density = get_examples()[3]
+    formulas = [density.support, density.weight] + density.queries
+    shared = compile_formulas(density.domain, formulas)
+    assert len(shared) < sum(len(compile_formula(density.domain, f)) for f in formulas)
+
+
+def test_compiled_cache():
+    domain = Domain.make(["a"], ["x"], [(0, 1)])
+    a, x = domain.get_symbols()
+    formula = a & (x <= 0.5)
+    assert compile_formula(domain, formula) is compile_formula(Domain.make(["a"], ["x"], [(0, 2)]), formula)
+    assert compile_formula(domain, formula) is not compile_formula(Domain.make(["b", "a"], ["x"], [(0, 1)]), formula)
 
 
 class TestCheckingSingle(object):
+    strategy = "auto"
     domain = Domain.make(["a", "b"], ["x", "y"], [(0, 100), (0, 50)])
     a = domain.get_symbol("a")
     b = domain.get_symbol("b")
@@ -113,7 +214,7 @@ class TestCheckingSingle(object):
     values = np.array([1, 1, 10, 20])
 
     def evaluate(self, formula):
-        return evaluate(self.domain, formula, self.values)
+        return evaluate(self.domain, formula, self.values, strategy=self.strategy)
 
     def test_ite(self):
         assert self.evaluate(Ite(self.a, self.x, self.y)) == 10
@@ -203,3 +304,174 @@ class TestCheckingSingle(object):
         assert evaluate(domain, f, data1) == np.array([1])
         assert evaluate(domain, f, data2) == np.array([0])
 
+
+@pytest.mark.parametrize("strategy", ["auto", "compiled", "walk", "masked"])
+@pytest.mark.parametrize("density", get_examples())
+def test_chunked(density, strategy):
+    formulas = [density.support, density.weight] + density.queries
+    samples = uniform(density.domain, 1000, rand_gen=np.random.RandomState(5))
+    expected = evaluate_many(density.domain, formulas, samples, strategy=strategy)
+    for result, reference in zip(evaluate_many(density.domain, formulas, samples, strategy, chunk_size=64), expected):
+        assert result.dtype == reference.dtype
+        assert np.array_equal(result, reference)
+
+
+def test_chunked_constants():
+    domain = Domain.make(["a"], ["x"], [(0, 1)])
+    samples = uniform(domain, 100, rand_gen=np.random.RandomState(6))
+    assert list(evaluate(domain, Real(3) + Real(6), samples, chunk_size=7)) == [9] * 100
+    assert list(evaluate(domain, Bool(False), samples, chunk_size=7)) == [False] * 100
+
+
+def test_memory_budget():
+    import tracemalloc
+
+    density = get_examples()[2]
+    samples = uniform(density.domain, 200000, rand_gen=np.random.RandomState(7))
+    compiled = compile_formula(density.domain, density.weight, linear=True)
+    budget = 2 ** 20
+    chunk_size, buffers = compiled.plan_buffers(samples, memory_budget=budget)
+    assert compiled.scratch_bytes(buffers) <= budget
+    assert chunk_size < samples.shape[0]
+
+    tracemalloc.start()
+    result, = compiled.execute_chunked(samples, memory_budget=budget)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    assert peak < budget * 2 + result.nbytes
+    assert np.array_equal(result, compiled(samples))
+
+    with pytest.raises(ValueError):
+        compiled.plan_buffers(samples, memory_budget=1)
+
+
+def test_memory_budget_temporaries():
+    import tracemalloc
+
+    domain = Domain.make([], ["x", "y"], [(0, 1), (0, 1)])
+    x, y = domain.get_symbols()
+    weight = Pow(x, Real(6)) * Pow(y, Real(5)) + x * Pow(y, Real(3)) * Real(2)
+    samples = uniform(domain, 200000, rand_gen=np.random.RandomState(8))
+    compiled = compile_formula(domain, weight, polynomial=True)
+    assert [operation for operation, _, _ in compiled.instructions] == [POLYNOMIAL]
+
+    # The powers of the variables and the scratch term are allocated per chunk and count towards the budget
+    budget = 2 ** 20
+    chunk_size, buffers = compiled.plan_buffers(samples, memory_budget=budget)
+    assert compiled.scratch_bytes(buffers) + chunk_size * compiled.temporary_bytes(samples, 0) <= budget
+
+    tracemalloc.start()
+    result, = compiled.execute_chunked(samples, memory_budget=budget)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    assert peak < budget * 2 + result.nbytes
+    assert np.array_equal(result, compiled(samples))
+
+
+@pytest.mark.parametrize("strategy", ["auto", "walk", "masked"])
+def test_threads(strategy):
+    density = get_examples()[4]
+    formulas = [density.support, density.weight] + density.queries
+    samples = uniform(density.domain, 5 * MIN_ROWS_PER_WORKER + 3, rand_gen=np.random.RandomState(8))
+    expected = evaluate_many(density.domain, formulas, samples, strategy=strategy, workers=1)
+    for workers in [2, 4]:
+        results = evaluate_many(density.domain, formulas, samples, strategy=strategy, workers=workers, chunk_size=5000)
+        for result, reference in zip(results, expected):
+            assert np.array_equal(result, reference)
+
+
+def test_default_workers():
+    density = get_examples()[3]
+    samples = uniform(density.domain, 3 * MIN_ROWS_PER_WORKER, rand_gen=np.random.RandomState(9))
+    expected = evaluate(density.domain, density.support, samples)
+    set_default_workers(3)
+    try:
+        assert get_default_workers() == 3
+        assert np.array_equal(evaluate(density.domain, density.support, samples), expected)
+    finally:
+        set_default_workers(1)
+    with pytest.raises(ValueError):
+        set_default_workers(0)
+
+
+def test_shared_executor():
+    density = get_examples()[3]
+    samples = uniform(density.domain, 4 * MIN_ROWS_PER_WORKER, rand_gen=np.random.RandomState(10))
+    evaluate(density.domain, density.support, samples, workers=4)
+    threads = threading.active_count()
+    for workers in [2, 3, 4, 2]:
+        evaluate(density.domain, density.support, samples, workers=workers)
+    # Fewer workers reuse the existing pool rather than starting new threads
+    assert threading.active_count() <= threads
+
+
+class TestCheckingSingleWalk(TestCheckingSingle):
+    strategy = "walk"
+
+
+@pytest.mark.parametrize("density", [d for d in get_examples() if len(d.domain.variables) > 1])
+def test_point_matches_walk(density):
+    formulas = [density.support, density.weight] + density.queries
+    evaluate_point = compile_point(density.domain, formulas)
+    assert evaluate_point is compile_point(density.domain, formulas)
+    for values in uniform(density.domain, 100, rand_gen=np.random.RandomState(5)):
+        assert list(evaluate_point(values)) == evaluate_many(density.domain, formulas, values, strategy="walk")
+
+
+def test_point_shared_subterms():
+    domain = Domain.make(["a"], ["x", "y"], real_bounds=(0, 1))
+    a, x, y = domain.get_symbols()
+    shared = x * y + Real(1)
+    formula = Ite(a, shared * shared, shared) <= Real(2)
+    evaluate_point = compile_point(domain, [formula, shared])
+    assert evaluate_point.source.count("v[1] * v[2]") == 1
+    assert evaluate_point(np.array([1, 0.5, 0.5])) == (True, 1.25)
+
+
+@pytest.mark.parametrize("strategy", ["auto", "compiled", "walk", "masked"])
+def test_profile(strategy):
+    domain = Domain.make(["a"], ["x", "y"], real_bounds=(0, 1))
+    a, x, y = domain.get_symbols()
+    formula = a & (x * y <= Real(0.5))
+    samples = uniform(domain, 1000, rand_gen=np.random.RandomState(6))
+    profile = EvaluationProfile()
+    result = evaluate(domain, formula, samples, strategy=strategy, profile=profile)
+    assert np.array_equal(result, evaluate(domain, formula, samples, strategy="walk"))
+
+    ranked = profile.ranked()
+    assert ranked == sorted(ranked, key=lambda row: row["seconds"], reverse=True)
+    product = {row["node"]: row for row in ranked}[(x * y).serialize()]
+    if strategy != "masked":  # The masked strategy evaluates subterms on subsets of the samples
+        assert product["calls"] == 1
+        assert product["samples"] == 1000
+        assert product["bytes"] == 8000
+    assert json.loads(profile.to_json()) == ranked
+    assert "(x * y)" in profile.report()
+
+
+def test_profile_temporaries():
+    domain = Domain.make([], ["x", "y"], real_bounds=(0, 1))
+    x, y = domain.get_symbols()
+    weight = Pow(x, Real(6)) * Pow(y, Real(5)) + x * Pow(y, Real(3)) * Real(2)
+    samples = uniform(domain, 1000, rand_gen=np.random.RandomState(8))
+    compiled = compile_formula(domain, weight, polynomial=True)
+    profile = EvaluationProfile()
+    compiled.execute(samples, profile=profile)
+
+    # The result, the powers of the variables (x^2..x^6 and y^2..y^5) and one scratch term
+    row, = profile.ranked()
+    assert row["bytes"] == 1000 * 8 * (1 + 9 + 1)
+
+
+def test_default_profile():
+    domain = Domain.make(["a"], ["x"], real_bounds=(0, 1))
+    a, x = domain.get_symbols()
+    profile = EvaluationProfile()
+    set_default_profile(profile)
+    try:
+        assert get_default_profile() is profile
+        evaluate(domain, a & (x <= Real(0.5)), uniform(domain, 100, rand_gen=np.random.RandomState(7)))
+    finally:
+        set_default_profile(None)
+    assert profile.entries[a]
+    assert get_default_profile() is None
@@ -0,0 +1,37 @@
+import pytest
+from pysmt.shortcuts import Ite, Real
+
+from pywmi import AdaptiveRejection, Domain, ImportanceSamplingEngine, RejectionEngine
+
+SAMPLE_COUNT = 20000
+APPROX_ERROR = 0.05
+
+
+def test_importance_volume():
+    domain = Domain.make(["a"], ["x", "y"], [(0, 10), (0, 10)])
+    a, x, y = domain.get_symbols()
+    support = (x + y <= 1) & (a | (x <= 0.5))
+    engine = ImportanceSamplingEngine(domain, support, Real(1.0), SAMPLE_COUNT, seed=0)
+    estimate = engine.estimate_volume()
+    assert estimate.value == pytest.approx(0.5 + 0.375, rel=APPROX_ERROR)
+    assert 0 < engine.effective_sample_size <= SAMPLE_COUNT
+
+    # The proposal concentrates samples on the (small) support, unlike uniform rejection sampling
+    rejection = RejectionEngine(domain, support, Real(1.0), SAMPLE_COUNT, seed=0).estimate_volume()
+    assert estimate.std_error * 2 < rejection.std_error
+
+
+def test_importance_shared_tree():
+    domain = Domain.make([], ["x", "y"], [(-5, 10), (-5, 10)])
+    x, y = domain.get_symbols()
+    support = (x >= -4) & (x <= y) & (y <= 9) & ((y <= -1) | (y >= 6))
+    weight = Ite(x <= 2.5, x + y, y * 2)
+    tree = AdaptiveRejection(domain, support, weight, SAMPLE_COUNT, seed=0).tree
+    engine = ImportanceSamplingEngine(domain, support, weight, SAMPLE_COUNT, tree=tree, seed=1)
+    rejection_engine = RejectionEngine(domain, support, weight, 10 ** 6, seed=0)
+    assert engine.compute_volume() == pytest.approx(rejection_engine.compute_volume(), rel=APPROX_ERROR)
+
+    query = x <= y / 2
+    assert engine.with_constraint(query).tree is tree
+    assert engine.compute_probability(query) == pytest.approx(rejection_engine.compute_probability(query),
+                                                              rel=APPROX_ERROR)
@@ -0,0 +1,78 @@
+import numpy as np
+import pysmt.shortcuts as smt
+import pytest
+
+from pywmi import Domain, evaluate, CompactSamples
+from pywmi.mcmc import HitAndRunSampler, effective_sample_size
+from pywmi.sample import positive, uniform
+
+
+def get_density():
+    domain = Domain.make(["a", "b"], ["x", "y"], real_bounds=(0, 1))
+    a, b, x, y = domain.get_symbols()
+    support = (a | b) & (x <= y) & (x + y <= 1)
+    weight = smt.Ite(a, x + y, smt.Real(1.0))
+    return domain, support, weight
+
+
+def test_uniform_moments():
+    domain, support, _ = get_density()
+    sampler = HitAndRunSampler(domain, support, rand_gen=np.random.RandomState(0))
+    samples = sampler.sample(20000)
+    assert samples.shape == (20000, 4)
+    assert all(evaluate(domain, support, samples))
+    # The triangle (0, 0), (0, 1), (0.5, 0.5) has centroid (1/6, 1/2), a and b are true in 2/3 of the worlds
+    assert samples.mean(axis=0) == pytest.approx([2 / 3, 2 / 3, 1 / 6, 1 / 2], abs=0.02)
+
+
+def test_weighted_moments():
+    domain, support, weight = get_density()
+    sampler = HitAndRunSampler(domain, support, weight, rand_gen=np.random.RandomState(0))
+    samples = sampler.sample(20000)
+    assert all(evaluate(domain, support, samples))
+    assert 0 < sampler.acceptance_rate < 1
+
+    reference = uniform(domain, 10 ** 6, rand_gen=np.random.RandomState(1))
+    reference = reference[evaluate(domain, support, reference)]
+    weights = evaluate(domain, weight, reference)
+    expected = np.sum(reference * weights[:, np.newaxis], axis=0) / np.sum(weights)
+    assert samples.mean(axis=0) == pytest.approx(expected, abs=0.02)
+
+
+def test_thin_support():
+    # Uniform rejection sampling accepts about 1 in 10^5 samples
+    domain = Domain.make([], ["x{}".format(i) for i in range(5)], real_bounds=(0, 1))
+    symbols = domain.get_symbols()
+    support = smt.And(*[s <= smt.Real(0.1) for s in symbols])
+    samples, ratio = positive(1000, domain, support, sampler="mcmc", rand_gen=np.random.RandomState(0))
+    assert samples.shape == (1000, 5)
+    assert np.isnan(ratio)
+    assert all(evaluate(domain, support, samples))
+    assert samples.mean(axis=0) == pytest.approx([0.05] * 5, abs=0.01)
+
+
+def test_positive_sampler_options():
+    domain, support, weight = get_density()
+    sampler = HitAndRunSampler(domain, support, weight, chains=4, burn_in=10, thinning=2,
+                               rand_gen=np.random.RandomState(0))
+    samples, _ = positive(100, domain, support, weight, sampler=sampler, compact=True)
+    assert isinstance(samples, CompactSamples)
+    assert len(samples) == 100
+    assert sampler.steps == 10 + 25 * 2
+    assert set(sampler.effective_sample_size()) == set(domain.variables)
+
+    with pytest.raises(ValueError):
+        HitAndRunSampler(domain, support & (domain.get_symbol("x") * domain.get_symbol("y") <= 0.5))
+
+
+def test_effective_sample_size():
+    rand_gen = np.random.RandomState(0)
+    independent = rand_gen.standard_normal((2000, 4))
+    assert effective_sample_size(independent) == pytest.approx(8000, rel=0.2)
+
+    correlated = np.empty((2000, 4))
+    correlated[0] = rand_gen.standard_normal(4)
+    for i in range(1, 2000):
+        correlated[i] = 0.9 * correlated[i - 1] + rand_gen.standard_normal(4)
+    # An AR(1) chain with coefficient 0.9 has an effective sample size of n * (1 - 0.9) / (1 + 0.9)
+    assert effective_sample_size(correlated) == pytest.approx(8000 * 0.1 / 1.9, rel=0.3)
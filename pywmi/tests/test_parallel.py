@@ -0,0 +1,100 @@
+import numpy as np
+import pytest
+
+from pywmi import Domain, evaluate, RejectionEngine
+from pywmi.parallel import parallel_uniform, parallel_positive
+from pywmi.rng import make_rand_gen, spawn
+from pywmi.sample import uniform, SamplingError
+
+
+def get_density():
+    domain = Domain.make(["a"], ["x", "y"], real_bounds=(0, 1))
+    a, x, y = domain.get_symbols()
+    return domain, a & (x <= y)
+
+
+def test_make_rand_gen():
+    assert isinstance(make_rand_gen(3), np.random.RandomState)
+    assert isinstance(make_rand_gen(np.random.SeedSequence(3)), np.random.Generator)
+    generator = np.random.default_rng(3)
+    assert make_rand_gen(generator) is generator
+
+
+def test_spawn():
+    seed = np.random.SeedSequence(42)
+    children = spawn(seed, 4)
+    assert [c.generate_state(1)[0] for c in spawn(seed, 2)] == [c.generate_state(1)[0] for c in children[:2]]
+    states = {c.generate_state(1)[0] for c in children}
+    assert len(states) == 4
+
+
+@pytest.mark.parametrize("seed", [3, np.random.SeedSequence(3), np.random.default_rng(3)])
+def test_uniform_generator(seed):
+    domain, _ = get_density()
+    samples = uniform(domain, 1000, rand_gen=make_rand_gen(seed))
+    assert samples.shape == (1000, 3)
+    assert np.all((samples[:, 1:] >= 0) & (samples[:, 1:] <= 1))
+
+
+def test_engine_seed_sequence():
+    domain, support = get_density()
+    weight = domain.get_symbol("x")
+    volumes = [RejectionEngine(domain, support, weight, 10000, seed=np.random.SeedSequence(5)).compute_volume()
+               for _ in range(2)]
+    assert volumes[0] == volumes[1]
+    assert volumes[0] == pytest.approx(1 / 6, rel=0.05)
+
+
+def test_parallel_uniform():
+    domain, _ = get_density()
+    serial = parallel_uniform(domain, 2500, seed=7, processes=1, task_size=1000)
+    parallel = parallel_uniform(domain, 2500, seed=7, processes=2, task_size=1000)
+    assert serial.shape == (2500, 3)
+    assert np.array_equal(serial, parallel)
+    assert not np.array_equal(serial[:1000], serial[1000:2000])
+
+
+def test_parallel_positive():
+    domain, support = get_density()
+    serial, serial_ratio = parallel_positive(domain, support, 2500, seed=7, processes=1, task_size=1000)
+    parallel, parallel_ratio = parallel_positive(domain, support, 2500, seed=7, processes=3, task_size=1000)
+    assert np.array_equal(serial, parallel)
+    assert serial_ratio == parallel_ratio
+    assert all(evaluate(domain, support, serial))
+    assert serial_ratio == pytest.approx(0.25, abs=0.05)
+
+    with pytest.raises(SamplingError):
+        parallel_positive(domain, support, 2500, seed=7, processes=1, task_size=1000, max_samples=100)
+
+
+def test_parallel_engine():
+    domain, support = get_density()
+    a, x, y = domain.get_symbols()
+    weight = x + y
+    engine = RejectionEngine(domain, support, weight, 100000, seed=0, processes=2)
+    estimate = engine.estimate_volume()
+    assert estimate.sample_count == 100000
+    assert estimate.value == pytest.approx(0.5, rel=0.02)
+    assert RejectionEngine(domain, support, weight, 100000, seed=0, processes=2).compute_volume() == estimate.value
+
+    probability, = engine.compute_probabilities([x <= 0.5])
+    assert probability == pytest.approx(0.3125 / 0.5, rel=0.02)
+
+    # The pool of processes is started once and reused by later estimates (and batches of sequential estimates)
+    executor = engine.executor
+    engine.compute_volume()
+    assert engine.executor is executor
+    with RejectionEngine(domain, support, weight, 10000, seed=0, processes=2, relative_error=0.01,
+                         batch_size=1000) as sequential:
+        sequential.compute_volume()
+        executor = sequential.executor
+    assert sequential._executor is None
+    with pytest.raises(RuntimeError):
+        executor.submit(abs, 1)
+
+    # Parallel engines can be incremental, shards only return statistics that are merged into those of the engine
+    engine = RejectionEngine(domain, support, weight, 10000, seed=0, processes=3, incremental=True)
+    engine.compute_volume()
+    engine.compute_volume(20000)
+    assert engine.statistics.sample_count == 20000
+    assert engine.statistics.accepted == pytest.approx(20000 / 4, rel=0.1)
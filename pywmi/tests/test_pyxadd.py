@@ -1,9 +1,15 @@
+import logging
+
+import numpy
 import pytest
+from pysmt.shortcuts import Ite, Real
 
-from pywmi import RejectionEngine
+from pywmi import RejectionEngine, Domain, evaluate
 from pywmi.errors import InstallError
 from .examples import inspect_manual, inspect_density, get_examples, TEST_SAMPLE_COUNT
 from pywmi.engines.pyxadd.engine import PyXaddEngine
+from pywmi.engines.pyxadd.resolve import ResolveIntegrator
+from pywmi.sample import positive
 
 try:
     from ..weight_algebra.psi import psi
@@ -36,3 +42,21 @@ def test_pyxadd_automated(e):
             e.domain, e.support, e.weight, sample_count=TEST_SAMPLE_COUNT
         ),
     )
+
+
+def test_pyxadd_samples(caplog):
+    caplog.set_level(logging.INFO)  # Debug logging exports every integration step as an image
+    domain = Domain.make(["a", "b"], ["x", "y"], real_bounds=(0, 1))
+    a, b, x, y = domain.get_symbols(domain.variables)
+    support = (a | b) & (x <= y)
+    weight = Ite(a, Real(0.6), Real(0.4)) * Ite(x >= Real(0.5), x * x + y, Real(2) * y)
+    engine = PyXaddEngine(domain, support, weight, reduce_strategy=ResolveIntegrator.NO_REDUCE)
+    samples = engine.get_samples(50000, numpy.random.RandomState(0))
+    assert samples.shape == (50000, 4)
+    assert all(evaluate(domain, support, samples))
+    diagrams = engine.diagrams
+    engine.get_samples(10)
+    assert engine.diagrams is diagrams  # The partially integrated diagrams are reused
+
+    expected, _ = positive(50000, domain, support, weight, rand_gen=numpy.random.RandomState(1))
+    assert samples.mean(axis=0) == pytest.approx(expected.mean(axis=0), abs=0.01)
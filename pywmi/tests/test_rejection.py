@@ -1,8 +1,10 @@
+import json
+
 import pysmt.shortcuts as smt
 import pytest
 
 from .examples import inspect_manual, inspect_density, inspect_infinite_without_domain_bounds, get_examples
-from pywmi import RejectionEngine, Domain, XaddEngine
+from pywmi import RejectionEngine, Domain, XaddEngine, SharedSamples
 from pywmi.transform import normalize_formula
 
 SAMPLE_COUNT = 1000000
@@ -59,3 +61,205 @@ def test_rejection_iff_real():
     assert rej_vol1 == pytest.approx(0, REL_ERROR ** 3)
     assert rej_vol2 == pytest.approx(0, REL_ERROR ** 3)
     assert rej_vol3 == pytest.approx(0, REL_ERROR ** 3)
+
+
+@pytest.mark.parametrize("sampling", ["random", "sobol", "halton"])
+def test_estimate_volume(sampling):
+    domain = Domain.make([], ["x", "y"], real_bounds=(0, 1))
+    x, y = domain.get_symbols()
+    engine = RejectionEngine(domain, x + y <= 1, x * y, 2 ** 14, seed=0, sampling=sampling)
+    estimate = engine.estimate_volume()
+    assert estimate.sample_count == 2 ** 14
+    assert estimate.replicates == (1 if sampling == "random" else 8)
+    low, high = estimate.interval(0.999)
+    assert low <= 1 / 24 <= high
+    assert engine.compute_volume() == pytest.approx(1 / 24, rel=0.05)
+
+
+def test_quasi_monte_carlo_accuracy():
+    domain = Domain.make([], ["x", "y"], real_bounds=(0, 1))
+    x, y = domain.get_symbols()
+    weight = x * x * y + smt.Real(1)
+    errors = dict()
+    for sampling in ["random", "sobol"]:
+        estimates = [RejectionEngine(domain, smt.TRUE(), weight, 2 ** 12, seed=seed, sampling=sampling)
+                     .compute_volume() for seed in range(5)]
+        errors[sampling] = max(abs(estimate - 7 / 6) for estimate in estimates)
+    assert errors["sobol"] * 10 < errors["random"]
+
+
+def test_boolean_groups():
+    domain = Domain.make(["a", "b", "c", "d", "e"], ["x"], [(0, 2)])
+    a, b, c, d, e, x = domain.get_symbols()
+    engine = RejectionEngine(domain, smt.TRUE(), smt.Real(1.0), 10000, seed=0)
+    assert engine.compute_volume(ohe_variables=[["a", "b", "c"]]) == pytest.approx(3 * 4 * 2)
+    assert engine.compute_volume(exactly_k=[(["a", "b", "c", "d"], 2)]) == pytest.approx(6 * 2 * 2)
+
+    # Of the 6 assignments with two true variables, only (c, d) violates a | b
+    engine = RejectionEngine(domain, a | b, smt.Real(1.0), 100000, seed=0)
+    assert engine.compute_volume(exactly_k=[(["a", "b", "c", "d"], 2)]) == pytest.approx(5 * 2 * 2, rel=REL_ERROR * 2)
+
+
+def test_stratified():
+    domain = Domain.make(["a", "b", "c"], ["x"], [(0, 1)])
+    a, b, c, x = domain.get_symbols()
+    support = (a & b & (x <= 0.1)) | ~(a & b)
+    weight = smt.Ite(a & b, smt.Real(100), smt.Real(1))
+    plain = RejectionEngine(domain, support, weight, 20000, seed=0).estimate_volume()
+    stratified = RejectionEngine(domain, support, weight, 20000, seed=0, stratify=True).estimate_volume()
+    assert stratified.value == pytest.approx(2 * 0.1 * 100 + 6, rel=0.1)
+    assert stratified.sample_count == 20000
+    assert stratified.std_error < plain.std_error
+
+    # If every Boolean world is a stratum and the support does not depend on x, the estimate is exact
+    engine = RejectionEngine(domain, a | b, smt.Real(1.0), 1000, seed=0, stratify=True, max_strata=1024)
+    assert engine.compute_volume() == pytest.approx(6)
+    with pytest.raises(ValueError):
+        engine.compute_volume(ohe_variables=[["a", "b"]])
+
+
+def test_stratified_many_booleans():
+    # With more Boolean worlds than strata, the assignments to the variables of the weight define the strata
+    domain = Domain.make(["b{}".format(i) for i in range(12)], ["x"], [(0, 1)])
+    *booleans, x = domain.get_symbols()
+    heavy = smt.And(*booleans[:4])
+    support = (heavy & (x <= 0.1)) | ~heavy
+    weight = smt.Ite(heavy, smt.Real(100), smt.Real(1))
+    engine = RejectionEngine(domain, support, weight, 20000, seed=0, stratify=True, max_strata=64)
+    assert set(booleans[i].symbol_name() for i in range(4)) <= set(engine.get_strata_variables(20000))
+    stratified = engine.estimate_volume()
+    plain = RejectionEngine(domain, support, weight, 20000, seed=0).estimate_volume()
+    assert stratified.value == pytest.approx(2 ** 8 * 0.1 * 100 + 2 ** 12 - 2 ** 8, abs=4 * stratified.std_error)
+    assert stratified.std_error < plain.std_error
+
+
+def test_sequential():
+    domain = Domain.make(["a"], ["x", "y"], [(0, 1), (0, 1)])
+    a, x, y = domain.get_symbols()
+    support = (x + y <= 1) & (a | (x <= 0.5))
+    engine = RejectionEngine(domain, support, smt.Real(1.0), 10 ** 7, seed=0, relative_error=0.01, batch_size=1000)
+    estimate = engine.estimate_volume()
+    assert engine.stopped_by == "target"
+    assert estimate.sample_count < 10 ** 6
+    assert estimate.half_width() <= 0.01 * estimate.value
+    assert estimate.value == pytest.approx(0.5 + 0.375, rel=0.05)
+
+    # Every query stops once its own interval is narrow enough
+    engine = RejectionEngine(domain, support, smt.Real(1.0), 10 ** 7, seed=0, half_width=0.01, batch_size=1000)
+    easy, hard = engine.estimate_probabilities([x <= 2, a])
+    assert engine.stopped_by == "target"
+    assert easy.sample_count < hard.sample_count
+    assert hard.value == pytest.approx(0.5 / 0.875, abs=0.03)
+    assert hard.half_width() <= 0.01
+
+    # Budgets end the estimation if the target cannot be reached
+    engine = RejectionEngine(domain, support & (x >= 2), smt.Real(1.0), 5000, seed=0, relative_error=0.01)
+    assert engine.compute_volume() == 0
+    assert engine.stopped_by == "sample_count"
+    assert engine.compute_probabilities([a]) == [None]
+
+
+def test_incremental():
+    domain = Domain.make(["a"], ["x", "y"], [(0, 1), (0, 1)])
+    a, x, y = domain.get_symbols()
+    support = (x + y <= 1) & (a | (x <= 0.5))
+    weight = x * 2 + smt.Real(1)
+    query = (x <= 0.25) & ~a
+
+    engine = RejectionEngine(domain, support, weight, 10000, seed=0, incremental=True)
+    engine.estimate_volume()
+    assert engine.statistics.sample_count == 10000
+    # Statistics for a new query require new samples, which also refine the volume
+    engine.estimate_probabilities([query])
+    assert engine.statistics.sample_count == 20000
+    assert list(engine.statistics.query_sample_counts) == [10000]
+    assert engine.estimate_volume(20000).sample_count == 20000
+
+    # A resumed estimate continues the random stream, so refining it yields the same result as sampling at once
+    resumed = RejectionEngine(domain, support, weight, 10000, seed=0)
+    resumed.resume(json.loads(json.dumps(engine.checkpoint())))
+    assert resumed.incremental
+    estimate = resumed.estimate_volume(40000)
+    assert estimate.sample_count == 40000
+    once = RejectionEngine(domain, support, weight, 40000, seed=0).estimate_volume()
+    assert estimate.value == pytest.approx(once.value)
+    assert estimate.std_error == pytest.approx(once.std_error)
+
+    probability, = resumed.estimate_probabilities([query], 40000)
+    assert probability.sample_count == 40000
+    assert resumed.statistics.sample_count == 70000
+
+
+def test_shared_samples():
+    domain = Domain.make(["a"], ["x", "y"], [(0, 1), (0, 1)])
+    a, x, y = domain.get_symbols()
+    supports = [(x + y <= 1) & a, (x + y <= 1) & (a | (x <= 0.5)), (x + y <= 1) & (x <= 0.5)]
+    weight = x * 2 + smt.Real(1)
+    shared = SharedSamples(domain, 20000, seed=0)
+    estimates, covariance = shared.estimate_volumes(supports, weight, covariance=True)
+
+    # The estimates equal those of separate engines that draw the same samples
+    for support, estimate in zip(supports, estimates):
+        separate = RejectionEngine(domain, support, weight, 20000, seed=0).estimate_volume()
+        assert estimate.value == pytest.approx(separate.value)
+        assert estimate.std_error == pytest.approx(separate.std_error)
+    assert covariance.diagonal() == pytest.approx([e.std_error ** 2 for e in estimates])
+    assert covariance[0, 1] > 0
+
+    unweighted, weighted = shared.estimate_volumes(supports[:2], [None, weight])
+    assert unweighted.value == pytest.approx(0.5, rel=0.05)
+    assert weighted.value == pytest.approx(estimates[1].value)
+
+
+@pytest.mark.filterwarnings("ignore::RuntimeWarning")
+def test_shared_samples_undefined_weight():
+    domain = Domain.make([], ["x", "y"], [(0, 1), (0, 1)])
+    x, y = domain.get_symbols()
+    support = (x <= 0.5) & (x + y <= 1)
+    # The weight is 1 on the support but overflows to inf * 0 = nan for x > 0.5
+    weight = smt.Pow(x * smt.Real(10), smt.Real(400)) * smt.Real(0) + smt.Real(1)
+    shared = SharedSamples(domain, 20000, seed=0)
+    weighted, unweighted = shared.estimate_volumes([support, support], [weight, None])
+    assert weighted.value == pytest.approx(unweighted.value)
+    assert weighted.std_error == pytest.approx(unweighted.std_error)
+
+
+def test_control_variates():
+    domain = Domain.make(["a"], ["x", "y"], [(0, 1), (0, 1)])
+    a, x, y = domain.get_symbols()
+    support = (x + y <= 1.8) & (a | (x <= 0.9))
+    weight = x * y + smt.Real(1)
+    exact = RejectionEngine(domain, support, weight, 10 ** 6, seed=1).estimate_volume()
+    plain = RejectionEngine(domain, support, weight, 10000, seed=0).estimate_volume()
+    controlled = RejectionEngine(domain, support, weight, 10000, seed=0, control_variates=True).estimate_volume()
+    assert controlled.value == pytest.approx(exact.value, abs=4 * controlled.std_error)
+    assert controlled.std_error < plain.std_error
+
+    plain_probability, = RejectionEngine(domain, support, weight, 10000, seed=0).estimate_probabilities([a])
+    engine = RejectionEngine(domain, support, weight, 10000, seed=0, control_variates=True)
+    probability, = engine.estimate_probabilities([a])
+    assert probability.value == pytest.approx(engine.compute_probabilities([a])[0], abs=4 * probability.std_error)
+    assert probability.std_error * 2 < plain_probability.std_error
+
+    # Without real-valued support constraints, the Boolean controls explain the (piecewise constant) weight exactly
+    boolean_domain = Domain.make(["a", "b"])
+    a, b = boolean_domain.get_symbols()
+    weight = smt.Ite(a, smt.Real(0.3), smt.Real(0.7)) + smt.Ite(b, smt.Real(0.2), smt.Real(0.8))
+    engine = RejectionEngine(boolean_domain, smt.TRUE(), weight, 1000, seed=0, control_variates=True)
+    assert engine.compute_volume() == pytest.approx(4.0)
+
+    with pytest.raises(ValueError):
+        RejectionEngine(domain, support, weight, 1000, control_variates=True, relative_error=0.01)
+
+
+def test_control_variates_degenerate_bounds():
+    # The known means of the controls of a real variable with coinciding bounds are its powers of the bound
+    domain = Domain.make(["a"], ["x", "y"], [(0, 1), (0.5, 0.5)])
+    a, x, y = domain.get_symbols()
+    support = (x <= 0.5) & (a | (x <= 0.25))
+    weight = x * y + smt.Real(1)
+    engine = RejectionEngine(domain, support, weight, 10000, seed=0, control_variates=True)
+    assert engine.estimate_volume().value == 0
+    exact = RejectionEngine(domain, support, weight, 10 ** 6, seed=1).estimate_probabilities([a])
+    probability, = engine.estimate_probabilities([a])
+    assert probability.value == pytest.approx(exact[0].value, abs=4 * probability.std_error)
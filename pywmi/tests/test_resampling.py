@@ -0,0 +1,51 @@
+import numpy as np
+import pysmt.shortcuts as smt
+import pytest
+
+from pywmi import Domain, evaluate
+from pywmi.resampling import resample, AliasTable, SCHEMES
+from pywmi.sample import positive
+
+
+@pytest.mark.parametrize("scheme", SCHEMES)
+def test_frequencies(scheme):
+    weights = np.array([1.0, 0.0, 3.0, 6.0])
+    indices = resample(weights, 100000, scheme, rand_gen=np.random.RandomState(0))
+    assert indices.dtype.kind == "i"
+    assert len(indices) == 100000
+    frequencies = np.bincount(indices, minlength=len(weights)) / len(indices)
+    assert frequencies == pytest.approx(weights / weights.sum(), abs=0.01)
+    assert frequencies[1] == 0
+
+
+@pytest.mark.parametrize("scheme", ["systematic", "stratified"])
+def test_low_variance(scheme):
+    weights = np.array([0.25, 0.25, 0.5])
+    counts = np.bincount(resample(weights, 1000, scheme, rand_gen=np.random.RandomState(1)), minlength=3)
+    assert counts == pytest.approx([250, 250, 500], abs=25 if scheme == "stratified" else 1)
+
+
+def test_alias_table_reuse():
+    table = AliasTable([2.0, 1.0, 1.0])
+    rand_gen = np.random.RandomState(2)
+    draws = np.concatenate([resample(table, 10000, rand_gen=rand_gen) for _ in range(5)])
+    assert np.bincount(draws) / len(draws) == pytest.approx([0.5, 0.25, 0.25], abs=0.01)
+
+
+def test_invalid_weights():
+    with pytest.raises(ValueError):
+        resample([0.0, 0.0], 10)
+    with pytest.raises(ValueError):
+        resample([1.0, -1.0], 10)
+    with pytest.raises(ValueError):
+        resample([1.0], 10, scheme="unknown")
+
+
+@pytest.mark.parametrize("scheme", SCHEMES)
+def test_positive(scheme):
+    domain = Domain.make(["a"], ["x"], real_bounds=(0, 1))
+    a, x = domain.get_symbols()
+    weight = smt.Ite(a, smt.Real(1), smt.Real(3))
+    samples, _ = positive(20000, domain, x <= 0.5, weight, rand_gen=np.random.RandomState(3), scheme=scheme)
+    assert samples.shape[0] == 20000
+    assert np.mean(evaluate(domain, a, samples)) == pytest.approx(0.25, abs=0.02)
@@ -1,8 +1,11 @@
+import itertools
+
+import numpy as np
 import pysmt.shortcuts as smt
 import pytest
 
-from pywmi import Domain, sample, evaluate
-from pywmi.sample import positive, SamplingError
+from pywmi import Domain, sample, evaluate, CompactSamples
+from pywmi.sample import positive, SamplingError, PositiveStream
 
 
 def test_boolean():
@@ -87,3 +90,132 @@ def test_sampling_stacking():
         assert True
     except ValueError:
         assert False
+
+
+def test_compact():
+    domain = Domain.make(["a{}".format(i) for i in range(10)], ["x", "y"], real_bounds=(0, 1))
+    dense = sample.uniform(domain, 1000, ohe_variables=[["a0", "a1", "a2"]], rand_gen=np.random.RandomState(5))
+    samples = sample.uniform(domain, 1000, ohe_variables=[["a0", "a1", "a2"]], rand_gen=np.random.RandomState(5),
+                             compact=True)
+    assert isinstance(samples, CompactSamples)
+    assert samples.nbytes < dense.nbytes / 4
+    assert np.array_equal(samples.to_dense(), dense)
+
+    a0, a1, a9, x, y = (domain.get_symbol(v) for v in ["a0", "a1", "a9", "x", "y"])
+    for formula in [(a0 | a9) & (x <= y), smt.Ite(a1, x * y, x + y), a9]:
+        for strategy in ["auto", "walk", "masked"]:
+            assert np.array_equal(evaluate(domain, formula, samples, strategy=strategy),
+                                  evaluate(domain, formula, dense, strategy=strategy))
+
+    projected_domain, projected = domain.project(["y", "a9", "a1"], samples)
+    assert isinstance(projected, CompactSamples)
+    assert np.array_equal(projected.to_dense(), domain.project(["y", "a9", "a1"], dense)[1])
+
+    single = sample.uniform(domain, 100, compact=True, real_dtype=np.float32)
+    assert single.dtype == np.float32
+    assert evaluate(domain, x + y, single).dtype == np.float32
+
+
+def test_compact_sampling():
+    domain = Domain.make(["a", "b"], ["x", "y"], real_bounds=(0, 1))
+    a, b, x, y = domain.get_symbols()
+    support = (a | b) & (x <= y)
+    weight = smt.Ite(a, smt.Real(1), smt.Real(2))
+    samples, pos_ratio = positive(1000, domain, support, weight, rand_gen=np.random.RandomState(6), compact=True)
+    assert isinstance(samples, CompactSamples)
+    assert len(samples) == 1000
+    assert np.all(evaluate(domain, support, samples))
+    assert pos_ratio == pytest.approx(0.375, rel=0.1)
+
+
+@pytest.mark.parametrize("sampling", ["sobol", "halton"])
+def test_quasi_monte_carlo(sampling):
+    domain = Domain.make(["a", "b", "c"], ["x", "y"], [(-1, 1), (2, 10)])
+    samples = sample.uniform(domain, 1024, ohe_variables=[["a", "b"]], rand_gen=np.random.RandomState(8),
+                             sampling=sampling)
+    assert samples.shape == (1024, 5)
+    assert np.all((-1 <= samples[:, 3]) & (samples[:, 3] <= 1))
+    assert np.all((2 <= samples[:, 4]) & (samples[:, 4] <= 10))
+    assert np.all(samples[:, 0] + samples[:, 1] == 1)
+    # Low-discrepancy points are spread (almost) evenly over every dimension
+    assert np.mean(samples[:, 0]) == pytest.approx(0.5, abs=0.01)
+    assert np.histogram(samples[:, 3], bins=8)[0] == pytest.approx(np.full(8, 128), abs=3)
+    compact = sample.uniform(domain, 1024, ohe_variables=[["a", "b"]], rand_gen=np.random.RandomState(8),
+                             sampling=sampling, compact=True)
+    assert np.array_equal(compact.to_dense(), samples)
+
+
+def test_exactly_k():
+    domain = Domain.make(["a", "b", "c", "d", "e"], ["x"], [(0, 1)])
+    samples = sample.uniform(domain, 6000, ohe_variables=[["a", "b"]], exactly_k=[(["c", "d", "e"], 2)],
+                             rand_gen=np.random.RandomState(9))
+    assert np.all(samples[:, 0] + samples[:, 1] == 1)
+    assert np.all(samples[:, 2:5].sum(axis=1) == 2)
+    assert np.mean(samples[:, 0]) == pytest.approx(0.5, abs=0.03)
+    assert np.mean(samples[:, 2:5], axis=0) == pytest.approx(np.full(3, 2 / 3), abs=0.03)
+
+    with pytest.raises(ValueError):
+        sample.uniform(domain, 10, ohe_variables=[["a", "b"]], exactly_k=[(["b", "c"], 1)])
+    with pytest.raises(ValueError):
+        sample.uniform(domain, 10, exactly_k=[(["a", "b"], 3)])
+
+
+def test_choose_subsets():
+    chosen = sample.choose_subsets(np.linspace(0, 1, 10, endpoint=False), 5, 2)
+    subsets = [tuple(np.nonzero(row)[0]) for row in chosen]
+    assert subsets == sorted(itertools.combinations(range(5), 2))
+
+
+def test_positive_stream():
+    domain = Domain.make(["a"], ["x", "y"], real_bounds=(0, 1))
+    a, x, y = domain.get_symbols()
+    support = a & (x <= y)
+
+    stream = PositiveStream(domain, support, chunk_size=1000, rand_gen=np.random.RandomState(7), max_positive=3500,
+                            copy=True)
+    chunks = list(stream)
+    assert [len(chunk) for chunk in chunks] == [1000, 1000, 1000, 500]
+    assert stream.stopped_by == "max_positive"
+    assert all(all(evaluate(domain, support, chunk)) for chunk in chunks)
+    assert stream.acceptance_rate == pytest.approx(0.25, abs=0.03)
+
+    # The same seed yields the same stream
+    again = list(PositiveStream(domain, support, chunk_size=1000, rand_gen=np.random.RandomState(7),
+                                max_positive=3500, copy=True))
+    assert all(np.array_equal(c1, c2) for c1, c2 in zip(chunks, again))
+
+
+def test_positive_stream_budgets():
+    domain = Domain.make(["a"], ["x", "y"], real_bounds=(0, 1))
+    a, x, y = domain.get_symbols()
+    support = a & (x <= y)
+
+    stream = PositiveStream(domain, support, chunk_size=100, rand_gen=np.random.RandomState(0), max_samples=2000)
+    accepted = sum(len(chunk) for chunk in stream)
+    assert stream.stopped_by == "max_samples"
+    assert stream.drawn == 2000
+    assert accepted == stream.accepted
+
+    stream = PositiveStream(domain, support, chunk_size=100, rand_gen=np.random.RandomState(0), time_budget=0.05)
+    for _ in stream:
+        pass
+    assert stream.stopped_by == "time_budget"
+
+    stream = PositiveStream(domain, support, chunk_size=100, rand_gen=np.random.RandomState(0), max_positive=250,
+                            compact=True)
+    chunks = [chunk.copy() for chunk in stream]
+    assert all(isinstance(chunk, CompactSamples) for chunk in chunks)
+    assert [len(chunk) for chunk in chunks] == [100, 100, 50]
+    assert all(all(evaluate(domain, support, chunk)) for chunk in chunks)
+
+
+def test_positive_reproducible():
+    domain = Domain.make(["a"], ["x", "y"], real_bounds=(0, 1))
+    a, x, y = domain.get_symbols()
+    support = a & (x <= y)
+    first, _ = positive(1000, domain, support, sample_count=100, max_samples=10 ** 5,
+                        rand_gen=np.random.RandomState(3))
+    np.random.seed(1)
+    second, _ = positive(1000, domain, support, sample_count=100, max_samples=10 ** 5,
+                        rand_gen=np.random.RandomState(3))
+    assert np.array_equal(first, second)
@@ -152,3 +152,11 @@ def test_linear_inequality_from_smt():
     inequality = LinearInequality.from_smt(x >= 0)
     assert inequality.a("x") == -1
     assert inequality.scale_to_integer().a("x") == -1
+
+
+def test_polynomial_exponent_matrix():
+    x, y = [Symbol(n, REAL) for n in "xy"]
+    polynomial = Polynomial.from_smt(x * x * y * 3 + y * 2 + 1)
+    exponents, coefficients = polynomial.to_exponent_matrix(["x", "y"])
+    terms = {tuple(row): coefficient for row, coefficient in zip(exponents.tolist(), coefficients)}
+    assert terms == {(2, 1): 3, (0, 1): 2, (0, 0): 1}
@@ -1,3 +1,4 @@
+import numpy
 import pytest
 from pysmt.shortcuts import Ite, Real
 
@@ -5,7 +6,8 @@ from pywmi.engines.latte_backend import LatteIntegrator
 from pywmi.errors import InstallError
 from .examples import inspect_manual, get_examples, inspect_density
 from pywmi import Domain, RejectionEngine, FactorizedXsddEngine, PyXaddEngine
-from pywmi import XsddEngine
+from pywmi import XsddEngine, evaluate
+from pywmi.sample import positive
 from ..engines.convex_integrator import EngineConvexIntegrationBackend
 
 missing_installs = []
@@ -218,6 +220,22 @@ def test_fxsdd_manual():
     inspect_manual(lambda d, s, w: FactorizedXsddEngine(d, s, w), REL_ERROR)
 
 
+def test_xsdd_samples():
+    domain = Domain.make(["a", "b"], ["x", "y"], real_bounds=(0, 1))
+    a, b, x, y = domain.get_symbols(domain.variables)
+    support = (a | b) & (x <= y)
+    weight = Ite(a, Real(0.6), Real(0.4)) * Ite(x >= Real(0.5), x + y, Real(2) * y)
+    engine = XsddEngine(domain, support, weight, convex_backend=LatteIntegrator())
+    engine.compute_volume()
+    samples = engine.get_samples(100000, numpy.random.RandomState(0))
+    assert samples.shape == (100000, 4)
+    assert all(evaluate(domain, support, samples))
+
+    # The samples match weighted rejection samples
+    expected, _ = positive(100000, domain, support, weight, rand_gen=numpy.random.RandomState(1))
+    assert samples.mean(axis=0) == pytest.approx(expected.mean(axis=0), abs=0.01)
+
+
 # @pytest.mark.parametrize("e", get_examples())
 # def test_xsdd_examples(e):
 #     inspect_density(lambda d, s, w: XsddEngine(d, s, w, convex_backend=LatteIntegrator()), e)
@@ -0,0 +1,37 @@
+import numpy
+import pytest
+from pysmt.shortcuts import Ite, Real
+
+from pywmi import Domain, XsddEngine, evaluate
+from pywmi.engines.rejection import RejectionIntegrator
+from pywmi.sample import positive
+
+try:
+    import pysdd
+except ImportError:
+    pysdd = None
+
+pytestmark = pytest.mark.skipif(pysdd is None, reason="pysdd not installed")
+
+SAMPLE_COUNT = 100000
+
+
+def test_xsdd_samples_rejection_backend():
+    domain = Domain.make(["a", "b"], ["x", "y"], real_bounds=(0, 1))
+    a, b, x, y = domain.get_symbols(domain.variables)
+    support = (a | b) & (x <= y)
+    weight = Ite(a, Real(0.6), Real(0.4)) * Ite(x >= Real(0.5), x + y, Real(2) * y)
+    backend = RejectionIntegrator(SAMPLE_COUNT, seed=0)
+    engine = XsddEngine(domain, support, weight, convex_backend=backend)
+    samples = engine.get_samples(SAMPLE_COUNT, numpy.random.RandomState(0))
+    assert samples.shape == (SAMPLE_COUNT, 4)
+    assert all(evaluate(domain, support, samples))
+
+    # The samples match weighted rejection samples (up to the error of the approximate backend)
+    expected, _ = positive(SAMPLE_COUNT, domain, support, weight, rand_gen=numpy.random.RandomState(1))
+    assert samples.mean(axis=0) == pytest.approx(expected.mean(axis=0), abs=0.02)
+
+    # Later calls reuse the sampler (and the memoized masses)
+    sampler = engine.get_bounded()._sampler
+    assert engine.get_samples(10, numpy.random.RandomState(2)).shape == (10, 4)
+    assert engine.get_bounded()._sampler is sampler
@@ -24,7 +24,7 @@ REQUIRED = [
     "tabulate",
     "graphviz",
     "sympy",
-    "scipy>=1.2",
+    "scipy>=1.7",
     "deprecated",
     "networkx",
     "antlr4-python3-runtime",